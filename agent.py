@@ -1,20 +1,36 @@
 import edge_tts
 import asyncio
-import tempfile
 import base64
+import copy
+import io
 import json
 import logging
 import os
-from typing import Dict, Optional, Any
+from typing import AsyncIterator, Dict, Optional, Any, Tuple, Union
 import speech_recognition as sr
 import cv2
 import numpy as np
 from datetime import datetime
+from tts_cache import TTSCache
+from config import Config
+from media_buffer import media_path
+from executor import BlockingExecutor, ExecutorBusyError
+from frame_store import FrameStore
+from metrics import ERRORS, STT_DURATION, TTS_DURATION, VIDEO_DECODE_DURATION
+from tracing import span
 
 # Logging ayarları
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Başlangıçta önbelleğe alınan sabit sistem cümleleri
+SYSTEM_PHRASES = [
+    "Üzgünüm, bir hata oluştu.",
+    "Ses işlenirken bir hata oluştu.",
+    "Video işlenirken bir hata oluştu.",
+    "Sunucu şu anda meşgul, lütfen tekrar deneyin.",
+]
+
 class Agent:
     def __init__(self):
         """Agent sınıfını başlat"""
@@ -22,6 +38,9 @@ class Agent:
         self.recognizer = sr.Recognizer()
         self.is_listening = False
         self.stop_listening_event = asyncio.Event()
+        self.tts_cache = TTSCache()
+        self.executor = BlockingExecutor()
+        self.frame_store = FrameStore(executor=self.executor)
         
         # Ses tanıma ayarları
         self.recognizer.energy_threshold = 3000
@@ -30,33 +49,160 @@ class Agent:
         self.recognizer.phrase_threshold = 0.3
         self.recognizer.non_speaking_duration = 0.4
 
-    async def text_to_speech(self, text: str) -> Optional[str]:
-        """Metni sese çevir ve base64 formatında döndür"""
+    def _transcribe(self, audio_bytes: bytes) -> str:
+        """WAV verisini metne çevir (engelleyici, havuzda çalışır)"""
+        # adjust_for_ambient_noise tanıyıcının eşiğini değiştirdiği için
+        # eşzamanlı işler ortak nesne yerine kopyası üzerinde çalışır
+        recognizer = copy.copy(self.recognizer)
+        with sr.AudioFile(io.BytesIO(audio_bytes)) as source:
+            recognizer.adjust_for_ambient_noise(source, duration=0.3)
+            audio = recognizer.record(source)
+            return recognizer.recognize_google(audio, language="tr-TR")
+
+    @staticmethod
+    def _seek_last_frame(cap: "cv2.VideoCapture") -> Tuple[Optional[np.ndarray], int]:
+        """Kapsayıcı kare sayısını biliyorsa doğrudan son kareye atla"""
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if count <= 0 or not cap.set(cv2.CAP_PROP_POS_FRAMES, count - 1):
+            return None, 0
+
+        ret, frame = cap.read()
+        # Bazı kapsayıcılar sayıyı süreden tahmin eder; ardından kare
+        # gelmiyorsa sayı doğrudur, aksi halde baştan sayılır
+        if not ret or cap.grab():
+            return None, 0
+        return frame, count
+
+    def _decode_video(self, video_bytes: bytes) -> Tuple[np.ndarray, int]:
+        """Videoyu akış halinde çöz ve (son kare, kare sayısı) döndür (engelleyici, havuzda çalışır)
+
+        Bellekte yalnızca son örneklenen kare tutulur. VIDEO_FRAME_STRIDE > 1 ise
+        her N karede bir kare renk dönüşümünden geçirilir ve dönen kare son
+        örneklenen karedir.
+        """
+        stride = max(1, Config.VIDEO_FRAME_STRIDE)
+        last_frame = None
+        frame_count = 0
+
+        # OpenCV dosya yolu ister; küçük videolar bellekte kalır, yol her
+        # durumda bloktan çıkarken temizlenir
+        with media_path(video_bytes, suffix=".webm") as path:
+            cap = cv2.VideoCapture(path)
+            try:
+                if not cap.isOpened():
+                    raise ValueError("Video açılamadı")
+
+                last_frame, frame_count = self._seek_last_frame(cap)
+                if last_frame is None:
+                    # Atlama sonrası konum güvenilir olmadığından akış yeniden açılır
+                    cap.release()
+                    cap = cv2.VideoCapture(path)
+                    frame_count = 0
+                    while cap.grab():
+                        if frame_count % stride == 0:
+                            ret, frame = cap.retrieve()
+                            if ret:
+                                last_frame = frame
+                        frame_count += 1
+            finally:
+                cap.release()
+
+        if last_frame is None:
+            raise ValueError("Video karesi bulunamadı")
+
+        if Config.VIDEO_DOWNSCALE > 1:
+            scale = 1 / Config.VIDEO_DOWNSCALE
+            last_frame = cv2.resize(last_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return last_frame, frame_count
+
+    async def _synthesize(self, text: str) -> bytes:
+        """edge_tts ile metni MP3 verisine çevir"""
+        with span("tts_synthesize", TTS_DURATION):
+            communicate = edge_tts.Communicate(text, self.voice)
+            parts = []
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    parts.append(chunk["data"])
+            return b"".join(parts)
+
+    async def speech_bytes(self, text: str) -> Optional[bytes]:
+        """Metni sese çevir ve ham MP3 verisi olarak döndür"""
         try:
             if not text:
                 return None
 
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                communicate = edge_tts.Communicate(text, self.voice)
-                await communicate.save(temp_file.name)
-                
-                with open(temp_file.name, "rb") as audio_file:
-                    audio_data = base64.b64encode(audio_file.read()).decode()
-                
-                os.unlink(temp_file.name)
-                return audio_data
+            audio_bytes = await self.tts_cache.get(self.voice, text)
+            if audio_bytes is None:
+                audio_bytes = await self._synthesize(text)
+                await self.tts_cache.put(self.voice, text, audio_bytes)
+
+            return audio_bytes
         except Exception as e:
+            ERRORS.labels("tts").inc()
             logger.error(f"Ses dönüşümü hatası: {str(e)}")
             return None
 
-    async def get_response(self, text: str) -> Dict[str, Any]:
-        """Kullanıcı mesajına yanıt oluştur"""
+    async def text_to_speech(self, text: str) -> Optional[str]:
+        """Metni sese çevir ve base64 formatında döndür"""
+        audio_bytes = await self.speech_bytes(text)
+        return base64.b64encode(audio_bytes).decode() if audio_bytes else None
+
+    async def _reply_audio(self, text: str, synthesize: bool, raw_audio: bool) -> Union[str, bytes, None]:
+        """Yanıt sesini istenen biçimde üret (base64, ham bayt ya da hiç)"""
+        if not synthesize:
+            return None
+        if raw_audio:
+            return await self.speech_bytes(text)
+        return await self.text_to_speech(text)
+
+    async def stream_speech(self, text: str) -> AsyncIterator[bytes]:
+        """Metni sese çevirirken MP3 parçalarını geldikçe üret"""
+        cached = await self.tts_cache.get(self.voice, text)
+        if cached is not None:
+            chunk_size = Config.TTS_STREAM_CHUNK_SIZE
+            for i in range(0, len(cached), chunk_size):
+                yield cached[i:i + chunk_size]
+            return
+
+        # Kısa yanıtlar akış bitince önbelleğe yazılır; sınırı aşan klipler
+        # bellekte biriktirilmez
+        parts = []
+        size = 0
+        communicate = edge_tts.Communicate(text, self.voice)
+        async for chunk in communicate.stream():
+            if chunk["type"] != "audio":
+                continue
+            data = chunk["data"]
+            if parts is not None:
+                size += len(data)
+                if size > Config.TTS_STREAM_CACHE_MAX_BYTES:
+                    parts = None
+                else:
+                    parts.append(data)
+            yield data
+
+        if parts:
+            await self.tts_cache.put(self.voice, text, b"".join(parts))
+
+    async def warmup(self) -> None:
+        """Sabit sistem cümlelerini önceden sentezleyip önbelleğe al"""
+        for phrase in SYSTEM_PHRASES:
+            try:
+                if await self.tts_cache.get(self.voice, phrase) is None:
+                    await self.tts_cache.put(self.voice, phrase, await self._synthesize(phrase))
+            except Exception as e:
+                logger.error(f"TTS ön ısıtma hatası ({phrase}): {str(e)}")
+
+    async def get_response(self, text: str, synthesize: bool = True,
+                           raw_audio: bool = False) -> Dict[str, Any]:
+        """Kullanıcı mesajına yanıt oluştur (synthesize=False ise ses akışla ayrıca gönderilir)"""
         try:
             # Yanıt metnini oluştur (selamlama olmadan)
             response_text = text.strip()
             
             # Metni sese çevir
-            audio_data = await self.text_to_speech(response_text)
+            with span("tts"):
+                audio_data = await self._reply_audio(response_text, synthesize, raw_audio)
             
             return {
                 "text": response_text,
@@ -64,6 +210,7 @@ class Agent:
                 "type": "response"
             }
         except Exception as e:
+            ERRORS.labels("response").inc()
             logger.error(f"Yanıt oluşturma hatası: {str(e)}")
             return {
                 "text": "Üzgünüm, bir hata oluştu.",
@@ -71,32 +218,41 @@ class Agent:
                 "type": "error"
             }
 
-    async def process_audio(self, audio_data: str) -> Dict[str, Any]:
+    async def process_audio(self, audio_data: Union[str, bytes], synthesize: bool = True,
+                            raw_audio: bool = False, client_id: Optional[str] = None) -> Dict[str, Any]:
         """Ses verisini işle ve yanıt döndür"""
         try:
             if not audio_data:
                 raise ValueError("Ses verisi boş")
 
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                audio_bytes = base64.b64decode(audio_data)
-                temp_file.write(audio_bytes)
-                temp_file.flush()
-                
-                with sr.AudioFile(temp_file.name) as source:
-                    self.recognizer.adjust_for_ambient_noise(source, duration=0.3)
-                    audio = self.recognizer.record(source)
-                    text = self.recognizer.recognize_google(audio, language="tr-TR")
-                
-                os.unlink(temp_file.name)
-                
-                if not text:
-                    raise ValueError("Ses metne çevrilemedi")
-
-                response = await self.get_response(text)
-                response["transcription"] = text
-                
-                return response
+            # İkili protokolde veri zaten ham bayt olarak gelir
+            if isinstance(audio_data, (bytes, bytearray)):
+                audio_bytes = audio_data
+            else:
+                with span("base64_decode"):
+                    audio_bytes = base64.b64decode(audio_data)
+
+            # WAV verisi doğrudan bellekten okunur; tanıma olay döngüsü dışında yapılır
+            with span("stt", STT_DURATION):
+                text = await self.executor.run(self._transcribe, audio_bytes, client_id=client_id)
+            
+            if not text:
+                raise ValueError("Ses metne çevrilemedi")
+
+            response = await self.get_response(text, synthesize=synthesize, raw_audio=raw_audio)
+            response["transcription"] = text
+            
+            return response
+        except ExecutorBusyError:
+            logger.warning("Ses işleme reddedildi: işlem kuyruğu dolu")
+            return {
+                "text": "Sunucu şu anda meşgul, lütfen tekrar deneyin.",
+                "audio": None,
+                "transcription": None,
+                "type": "error"
+            }
         except Exception as e:
+            ERRORS.labels("stt").inc()
             logger.error(f"Ses işleme hatası: {str(e)}")
             return {
                 "text": "Ses işlenirken bir hata oluştu.",
@@ -105,52 +261,48 @@ class Agent:
                 "type": "error"
             }
 
-    async def process_video(self, video_data: str) -> Dict[str, Any]:
+    async def process_video(self, video_data: Union[str, bytes], synthesize: bool = True,
+                            raw_audio: bool = False, client_id: Optional[str] = None) -> Dict[str, Any]:
         """Video verisini işle ve yanıt döndür"""
         try:
             if not video_data:
                 raise ValueError("Video verisi boş")
 
-            with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_file:
-                video_bytes = base64.b64decode(video_data)
-                temp_file.write(video_bytes)
-                temp_file.flush()
-                
-                cap = cv2.VideoCapture(temp_file.name)
-                if not cap.isOpened():
-                    raise ValueError("Video açılamadı")
+            if isinstance(video_data, (bytes, bytearray)):
+                video_bytes = video_data
+            else:
+                with span("base64_decode"):
+                    video_bytes = base64.b64decode(video_data)
 
-                frames = []
-                while cap.isOpened():
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-                    frames.append(frame)
-                cap.release()
-                
-                os.unlink(temp_file.name)
-                
-                if not frames:
-                    raise ValueError("Video karesi bulunamadı")
-
-                # Son kareyi kaydet
-                last_frame = frames[-1]
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                frame_path = f"frames/frame_{timestamp}.jpg"
-                
-                os.makedirs("static/frames", exist_ok=True)
-                cv2.imwrite(f"static/{frame_path}", last_frame)
-                
-                response_text = f"Video işlendi ({len(frames)} kare)"
-                audio_data = await self.text_to_speech(response_text)
-                
-                return {
-                    "text": response_text,
-                    "audio": audio_data,
-                    "video": frame_path,
-                    "type": "response"
-                }
+            with span("video_decode", VIDEO_DECODE_DURATION):
+                last_frame, frame_count = await self.executor.run(
+                    self._decode_video, video_bytes, client_id=client_id
+                )
+
+            # Son kareyi kaydet (aynı kare tekrar yazılmaz)
+            with span("frame_store"):
+                frame_path = await self.frame_store.save(last_frame, client_id=client_id)
+            
+            response_text = f"Video işlendi ({frame_count} kare)"
+            with span("tts"):
+                audio_data = await self._reply_audio(response_text, synthesize, raw_audio)
+            
+            return {
+                "text": response_text,
+                "audio": audio_data,
+                "video": frame_path,
+                "type": "response"
+            }
+        except ExecutorBusyError:
+            logger.warning("Video işleme reddedildi: işlem kuyruğu dolu")
+            return {
+                "text": "Sunucu şu anda meşgul, lütfen tekrar deneyin.",
+                "audio": None,
+                "video": None,
+                "type": "error"
+            }
         except Exception as e:
+            ERRORS.labels("video").inc()
             logger.error(f"Video işleme hatası: {str(e)}")
             return {
                 "text": "Video işlenirken bir hata oluştu.",
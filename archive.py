@@ -0,0 +1,82 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from cache import SimpleCache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# (session_id, first_id, last_id, row_count, path)
+ArchiveSegment = Tuple[str, int, int, int, str]
+
+class ConversationArchive:
+    """Eski konuşmalar oturum başına gzip'li JSON Lines parçalarında saklanır; dizin veritabanındadır"""
+    def __init__(self, directory: Optional[str] = None, cache: Optional[SimpleCache] = None):
+        self.directory = directory or Config.ARCHIVE_DIR
+        # Parçalar değişmez; sayfa sayfa gezinirken aynı parça tekrar açılmaz
+        self.cache = cache or SimpleCache(max_entries=Config.ARCHIVE_SEGMENT_CACHE_SIZE, name="archive")
+        self.stats = {"segments_written": 0, "segments_read": 0, "rows_written": 0}
+
+    @staticmethod
+    def segment_path(session_id: str, first_id: int, last_id: int) -> str:
+        """Göreli parça yolu; session_id özetlenir, böylece dosya adına güvenli ve dağıtık olur"""
+        digest = hashlib.sha1(session_id.encode()).hexdigest()
+        return os.path.join(digest[:2], digest, f"{first_id:012d}-{last_id:012d}.jsonl.gz")
+
+    def write_segment_sync(self, session_id: str, rows: List[Dict]) -> ArchiveSegment:
+        """Aynı oturumun id sırasındaki kayıtlarını tek parçaya yaz"""
+        first_id, last_id = rows[0]["id"], rows[-1]["id"]
+        path = self.segment_path(session_id, first_id, last_id)
+        full_path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        tmp_path = f"{full_path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str))
+                f.write("\n")
+        os.replace(tmp_path, full_path)
+
+        self.stats["segments_written"] += 1
+        self.stats["rows_written"] += len(rows)
+        return session_id, first_id, last_id, len(rows), path
+
+    async def write_segments(self, rows: List[Dict]) -> List[ArchiveSegment]:
+        """Kayıtları oturumlara ayırıp her oturum için bir parça yaz (olay döngüsü dışında)"""
+        sessions: Dict[str, List[Dict]] = {}
+        for row in sorted(rows, key=lambda row: row["id"]):
+            sessions.setdefault(row["session_id"], []).append(row)
+        return await asyncio.to_thread(
+            lambda: [self.write_segment_sync(session_id, group) for session_id, group in sessions.items()]
+        )
+
+    def read_segment_sync(self, path: str) -> List[Dict]:
+        """Parçayı aç; kayıtlar id'ye göre artan sıradadır"""
+        with gzip.open(os.path.join(self.directory, path), "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    async def read_segment(self, path: str) -> List[Dict]:
+        """Parçayı önbellekten ya da diskten (olay döngüsü dışında) oku"""
+        rows = self.cache.get(path)
+        if rows is None:
+            rows = await asyncio.to_thread(self.read_segment_sync, path)
+            self.cache.set(path, rows, ttl=Config.ARCHIVE_SEGMENT_CACHE_TTL)
+            self.stats["segments_read"] += 1
+        return rows
+
+    async def read_history(self, segments: List[ArchiveSegment], limit: int,
+                           before: Optional[int] = None) -> List[Dict]:
+        """Yeniden eskiye sıralı parçalardan en fazla limit kayıt getir"""
+        history: List[Dict] = []
+        for segment in segments:
+            for row in reversed(await self.read_segment(segment[4])):
+                if before is None or row["id"] < before:
+                    history.append(dict(row))
+                    if len(history) >= limit:
+                        return history
+        return history
@@ -0,0 +1,320 @@
+"""WebSocket yük testi
+
+web:app'i süreç içinde ayağa kaldırır, edge_tts ve Google STT yerine
+deterministik yerel sahteleri koyar ve çok sayıda eşzamanlı /ws/{client_id}
+oturumunu metin/ses/video karışımıyla sürer. Sonuçlar (msg/s, p50/p95/p99,
+olay döngüsü gecikmesi) bench_results/ altına JSON olarak yazılır; böylece
+farklı commit'lerin koşuları karşılaştırılabilir.
+
+Örnek:
+    python benchmark.py --sessions 50 --messages 20 --mix text=0.7,audio=0.2,video=0.1
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+logger = logging.getLogger("benchmark")
+
+class FakeCommunicate:
+    """edge_tts.Communicate yerine geçen, sabit gecikmeli deterministik sentezleyici"""
+    latency = 0.02
+    chunk_count = 4
+
+    def __init__(self, text: str, voice: str, *args: Any, **kwargs: Any):
+        self.payload = f"{voice}:{text}".encode()
+
+    async def stream(self):
+        for i in range(self.chunk_count):
+            await asyncio.sleep(self.latency / self.chunk_count)
+            yield {"type": "audio", "data": self.payload + bytes([i]) * 1024}
+
+def fake_recognize_google(recognizer, audio_data, *args: Any, **kwargs: Any) -> str:
+    """Google STT yerine geçen, ağ gecikmesini engelleyici uyku ile taklit eden tanıyıcı"""
+    time.sleep(fake_recognize_google.latency)
+    return f"ses {len(audio_data.frame_data)}"
+
+fake_recognize_google.latency = 0.05
+
+def install_fakes(tts_latency: float, stt_latency: float) -> None:
+    """Ağ servislerini yerel sahtelerle değiştir"""
+    import agent
+    import speech_recognition as sr
+
+    FakeCommunicate.latency = tts_latency
+    fake_recognize_google.latency = stt_latency
+    agent.edge_tts.Communicate = FakeCommunicate
+    sr.Recognizer.recognize_google = fake_recognize_google
+
+def make_wav(seconds: float = 0.5, rate: int = 16000) -> bytes:
+    """Sessiz, geçerli bir WAV dosyası üret"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\0\0" * int(seconds * rate))
+    return buffer.getvalue()
+
+def make_video(frames: int = 15) -> bytes:
+    """Küçük bir MJPG video üret"""
+    import cv2
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "klip.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (160, 120))
+        for i in range(frames):
+            writer.write(np.full((120, 160, 3), (i * 17) % 256, np.uint8))
+        writer.release()
+        with open(path, "rb") as f:
+            return f.read()
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """En yakın sıra yöntemiyle yüzdelik"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return round(ordered[index], 3)
+
+def summarize(latencies: List[float]) -> Dict[str, Any]:
+    """Milisaniye cinsinden gecikme özeti"""
+    ms = [value * 1000 for value in latencies]
+    return {
+        "count": len(ms),
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": round(max(ms), 3) if ms else None
+    }
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """"text=0.7,audio=0.2,video=0.1" biçimini ağırlık sözlüğüne çevir"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("text", "audio", "video"):
+            raise ValueError(f"Geçersiz mesaj türü: {name}")
+        weights[name] = float(weight)
+    if sum(weights.values()) <= 0:
+        raise ValueError("Karışım ağırlıkları sıfır olamaz")
+    return weights
+
+class ServerThread(threading.Thread):
+    """web:app'i ayrı bir olay döngüsünde çalıştırır ve döngü gecikmesini ölçer"""
+    def __init__(self, port: int, lag_interval: float = 0.01):
+        super().__init__(daemon=True)
+        self.port = port
+        self.lag_interval = lag_interval
+        self.lag_samples: List[float] = []
+        self.ready = threading.Event()
+        self.server = None
+
+    async def _monitor_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            self.lag_samples.append(max(0.0, loop.time() - expected))
+
+    async def _serve(self) -> None:
+        import uvicorn
+        import web
+
+        config = uvicorn.Config(web.app, host="127.0.0.1", port=self.port,
+                                log_level="warning", ws_max_size=64 * 1024 * 1024)
+        self.server = uvicorn.Server(config)
+        monitor = asyncio.create_task(self._monitor_lag())
+        serve = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            await asyncio.sleep(0.01)
+        self.ready.set()
+        await serve
+        monitor.cancel()
+
+    def run(self) -> None:
+        asyncio.run(self._serve())
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.should_exit = True
+        self.join(timeout=10)
+
+async def run_session(url: str, client_id: str, messages: int, weights: Dict[str, float],
+                      payloads: Dict[str, bytes], binary: bool, rng: random.Random,
+                      results: Dict[str, List[float]], errors: Dict[str, int]) -> None:
+    """Tek bir istemci oturumunu sırayla mesaj gönderip yanıt bekleyerek sür"""
+    from protocol import FrameKind, encode_frame
+
+    kinds = list(weights)
+    frame_kinds = {"text": FrameKind.TEXT, "audio": FrameKind.AUDIO, "video": FrameKind.VIDEO}
+    encoded = {name: base64.b64encode(data).decode() for name, data in payloads.items()}
+
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(f"{url}/ws/{client_id}", max_msg_size=0) as ws:
+            if binary:
+                await ws.send_json({"type": "hello", "protocol": "binary"})
+                await ws.receive_json()
+
+            for seq in range(messages):
+                kind = rng.choices(kinds, weights=[weights[k] for k in kinds])[0]
+                text = f"{client_id} mesaj {seq}"
+                start = time.perf_counter()
+
+                if binary:
+                    payload = text.encode() if kind == "text" else payloads[kind]
+                    await ws.send_bytes(encode_frame(frame_kinds[kind], payload=payload))
+                else:
+                    content = text if kind == "text" else encoded[kind]
+                    await ws.send_json({"type": kind, "content": content})
+
+                while True:
+                    reply = await ws.receive()
+                    if reply.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    data = json.loads(reply.data)
+                    if data.get("type") != "ping":
+                        break
+                    # Sunucu nabzı ölçüme katılmaz
+                    await ws.send_json({"type": "pong"})
+                elapsed = time.perf_counter() - start
+
+                if reply.type == aiohttp.WSMsgType.TEXT:
+                    if data.get("type") == "error":
+                        errors[kind] = errors.get(kind, 0) + 1
+                elif reply.type != aiohttp.WSMsgType.BINARY:
+                    errors[kind] = errors.get(kind, 0) + 1
+                    return
+                results.setdefault(kind, []).append(elapsed)
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Sunucuyu başlat, oturumları sür ve sonuç özetini döndür"""
+    weights = parse_mix(args.mix)
+    payloads = {"audio": make_wav(args.audio_seconds), "video": make_video(args.video_frames)}
+
+    port = free_port()
+    server = ServerThread(port)
+    server.start()
+    if not server.ready.wait(timeout=30):
+        raise RuntimeError("Sunucu başlatılamadı")
+
+    results: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    rng = random.Random(args.seed)
+    try:
+        # Açılıştaki ısınma sentezi döngü gecikmesine katılmasın
+        server.lag_samples.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            run_session(f"ws://127.0.0.1:{port}", f"bench-{i}", args.messages, weights,
+                        payloads, args.binary, random.Random(rng.random()), results, errors)
+            for i in range(args.sessions)
+        ])
+        duration = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    all_latencies = [value for values in results.values() for value in values]
+    lag_ms = [value * 1000 for value in server.lag_samples]
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "config": {key: value for key, value in vars(args).items() if key != "output_dir"},
+        "duration_s": round(duration, 3),
+        "messages": len(all_latencies),
+        "msgs_per_s": round(len(all_latencies) / duration, 2) if duration else None,
+        "errors": errors,
+        "latency": summarize(all_latencies),
+        "latency_by_type": {kind: summarize(values) for kind, values in results.items()},
+        "event_loop_lag": {
+            "samples": len(lag_ms),
+            "p50_ms": percentile(lag_ms, 50),
+            "p99_ms": percentile(lag_ms, 99),
+            "max_ms": round(max(lag_ms), 3) if lag_ms else None
+        }
+    }
+
+def save_results(results: Dict[str, Any], output_dir: str) -> str:
+    """Sonuçları zaman damgası ve commit adıyla JSON dosyasına yaz"""
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"{stamp}_{results['git_revision'] or 'nogit'}.json"
+    path = os.path.join(output_dir, name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Teddy WebSocket yük testi")
+    parser.add_argument("--sessions", type=int, default=20, help="Eşzamanlı oturum sayısı")
+    parser.add_argument("--messages", type=int, default=10, help="Oturum başına mesaj sayısı")
+    parser.add_argument("--mix", default="text=0.7,audio=0.2,video=0.1", help="Mesaj türü ağırlıkları")
+    parser.add_argument("--binary", action="store_true", help="İkili WebSocket protokolünü kullan")
+    parser.add_argument("--tts-latency", type=float, default=0.02, help="Sahte TTS gecikmesi (sn)")
+    parser.add_argument("--stt-latency", type=float, default=0.05, help="Sahte STT gecikmesi (sn)")
+    parser.add_argument("--audio-seconds", type=float, default=0.5, help="Ses mesajı uzunluğu (sn)")
+    parser.add_argument("--video-frames", type=int, default=15, help="Video mesajı kare sayısı")
+    parser.add_argument("--seed", type=int, default=1, help="Rastgelelik tohumu")
+    parser.add_argument("--output-dir", default=os.path.join(BASE_DIR, "bench_results"),
+                        help="JSON sonuç dizini")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    # Sunucunun veritabanı, önbellek ve kare dosyaları geçici bir dizinde tutulur ve sonunda silinir
+    cwd = os.getcwd()
+    output_dir = os.path.abspath(args.output_dir)
+    with tempfile.TemporaryDirectory(prefix="teddy-bench-") as workdir:
+        os.chdir(workdir)
+        try:
+            os.makedirs("data", exist_ok=True)
+            from config import Config
+            Config.FRAME_STORE_DIR = os.path.join(workdir, "static", "frames")
+            install_fakes(args.tts_latency, args.stt_latency)
+            results = asyncio.run(run_benchmark(args))
+        finally:
+            os.chdir(cwd)
+
+    path = save_results(results, output_dir)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"Sonuçlar kaydedildi: {path}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from typing import Iterator, Optional, Tuple
+from fastapi import HTTPException, Request
+from starlette.responses import Response, StreamingResponse
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class BlobStore:
+    """İçerik adresli dosya deposu: her blob sha256 özetiyle, iki seviyeli alt dizinlerde saklanır"""
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or Config.BLOB_STORE_DIR
+        self.stats = {"stored": 0, "deduplicated": 0, "deleted": 0}
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def is_digest(value: str) -> bool:
+        return bool(DIGEST_PATTERN.match(value))
+
+    def path(self, digest: str) -> str:
+        """ab/cd/abcd... biçiminde parçalı yol; tek dizinde milyonlarca dosya birikmez"""
+        if not self.is_digest(digest):
+            raise ValueError(f"Geçersiz blob özeti: {digest}")
+        return os.path.join(self.directory, digest[:2], digest[2:4], digest)
+
+    def put_sync(self, data: bytes) -> str:
+        """Blob'u yaz ve özetini döndür; aynı içerik zaten varsa yalnızca zaman damgası tazelenir"""
+        digest = self.digest(data)
+        path = self.path(digest)
+        try:
+            # Çöp toplayıcının bekleme süresi yeniden başlasın
+            os.utime(path)
+            self.stats["deduplicated"] += 1
+            return digest
+        except FileNotFoundError:
+            # Hiç yazılmamış ya da çöp toplayıcı arada silmiş; dosya (yeniden) yazılır
+            pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.stats["stored"] += 1
+        return digest
+
+    async def put(self, data: bytes) -> str:
+        """Blob'u olay döngüsü dışında yaz"""
+        return await asyncio.to_thread(self.put_sync, data)
+
+    def stat(self, digest: str) -> Optional[os.stat_result]:
+        try:
+            return os.stat(self.path(digest))
+        except FileNotFoundError:
+            return None
+
+    def read_range(self, digest: str, start: int, end: int,
+                   chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """[start, end] bayt aralığını parça parça oku (uçlar dahil)"""
+        with open(self.path(digest), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def scan_sync(self, grace: float = 0.0) -> Iterator[str]:
+        """Son grace saniyede yazılmamış blob özetlerini dolaş; yarım kalmış geçici dosyalar silinir"""
+        cutoff = time.time() - grace
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_mtime >= cutoff:
+                        continue
+                    if name.endswith(".tmp"):
+                        os.unlink(path)
+                    elif self.is_digest(name):
+                        yield name
+                except FileNotFoundError:
+                    continue
+
+    def delete_sync(self, digest: str, grace: float = 0.0) -> bool:
+        """Blob'u sil; son grace saniye içinde yazılan ya da tekrar kullanılan blob'a dokunulmaz"""
+        path = self.path(digest)
+        # Dosya önce kenara taşınır: put_sync arada zaman damgasını tazelediyse geri konur,
+        # taşındıktan sonra gelen put_sync ise dosyayı yeniden yazar
+        tombstone = f"{path}.{threading.get_ident()}.deleting.tmp"
+        try:
+            if time.time() - os.stat(path).st_mtime < grace:
+                return False
+            os.replace(path, tombstone)
+        except FileNotFoundError:
+            return True
+        try:
+            if time.time() - os.stat(tombstone).st_mtime < grace:
+                os.replace(tombstone, path)
+                return False
+            os.unlink(tombstone)
+        except FileNotFoundError:
+            return True
+        self.stats["deleted"] += 1
+        return True
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Tek aralıklı "bytes=" başlığını (başlangıç, bitiş) olarak çöz; geçersizse ValueError"""
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("Yalnızca tek bir bayt aralığı desteklenir")
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+    else:
+        # bytes=-500: son 500 bayt
+        suffix = int(last)
+        if suffix <= 0:
+            raise ValueError("Geçersiz aralık")
+        start = max(0, size - suffix)
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Aralık dosya boyutunun dışında")
+    return start, end
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match başlığı verilen ETag'i (ya da *) içeriyor mu"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+async def blob_response(store: BlobStore, digest: str, request: Request) -> Response:
+    """Blob'u HTTP yanıtı olarak döndür; Range (206/416) ve If-None-Match (304) desteklenir"""
+    if not store.is_digest(digest):
+        raise HTTPException(status_code=404, detail="Blob bulunamadı")
+    stat = await asyncio.to_thread(store.stat, digest)
+    if stat is None:
+        raise HTTPException(status_code=404, detail="Blob bulunamadı")
+
+    size = stat.st_size
+    # İçerik adresli olduğu için özet hem ETag hem de süresiz önbellek anahtarıdır
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{digest}"',
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        store.read_range(digest, start, end),
+        status_code=status_code,
+        media_type="audio/mpeg",
+        headers=headers
+    )
@@ -1,69 +1,366 @@
-from typing import Any, Dict, Optional, Callable
+from typing import Any, Dict, Optional, Callable, Set
+from collections import OrderedDict
 from functools import wraps
+import asyncio
+import hashlib
+import hmac
+import pickle
+import sys
 import time
+import uuid
 import logging
-from datetime import datetime, timedelta
+from config import Config
+from cache_backends import CacheBackend
+from metrics import CACHE_REQUESTS
 
 logger = logging.getLogger(__name__)
 
+def _estimate_size(value: Any) -> int:
+    """Değerin bellekte kapladığı yaklaşık bayt sayısı"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Any, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
 class SimpleCache:
-    """Basit in-memory cache implementasyonu"""
-    def __init__(self):
-        self._cache: Dict[str, Dict[str, Any]] = {}
+    """Sınırlı, LRU tahliyeli in-memory cache implementasyonu"""
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 sweep_interval: Optional[float] = None, name: str = "memory"):
+        self.name = name
+        self.max_entries = max_entries or Config.CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.CACHE_MAX_BYTES
+        self.sweep_interval = sweep_interval or Config.CACHE_SWEEP_INTERVAL
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+    
+    def __len__(self) -> int:
+        return len(self._cache)
+    
+    @property
+    def size_bytes(self) -> int:
+        """Tutulan değerlerin yaklaşık toplam boyutu"""
+        return self._bytes
+    
+    def _remove(self, key: str) -> None:
+        entry = self._cache.pop(key)
+        self._bytes -= entry.size
     
     def get(self, key: str) -> Optional[Any]:
         """Cache'den veri al"""
-        if key not in self._cache:
+        entry = self._cache.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            CACHE_REQUESTS.labels(self.name, "miss").inc()
             return None
         
-        item = self._cache[key]
-        if item["expires_at"] < datetime.now():
-            del self._cache[key]
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            CACHE_REQUESTS.labels(self.name, "miss").inc()
             return None
-            
-        return item["value"]
+        
+        self._cache.move_to_end(key)
+        self.stats["hits"] += 1
+        CACHE_REQUESTS.labels(self.name, "hit").inc()
+        return entry.value
     
     def set(self, key: str, value: Any, ttl: int = 3600) -> None:
         """Cache'e veri kaydet"""
-        self._cache[key] = {
-            "value": value,
-            "expires_at": datetime.now() + timedelta(seconds=ttl)
-        }
+        if key in self._cache:
+            self._remove(key)
+        
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        
+        self._cache[key] = _Entry(value, time.monotonic() + ttl, size)
+        self._bytes += size
+        
+        # Sınırlar aşıldıysa en uzun süredir kullanılmayanları çıkar
+        while len(self._cache) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._cache))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+    
+    def peek(self, key: str) -> Optional[Any]:
+        """İstatistiklere ve LRU sırasına dokunmadan oku; süresi dolmuşsa None"""
+        entry = self._cache.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            return None
+        return entry.value
     
     def delete(self, key: str) -> None:
         """Cache'den veri sil"""
         if key in self._cache:
-            del self._cache[key]
+            self._remove(key)
     
     def clear(self) -> None:
         """Tüm cache'i temizle"""
         self._cache.clear()
+        self._bytes = 0
+    
+    def sweep(self) -> int:
+        """Süresi dolmuş tüm kayıtları sil ve silinen sayıyı döndür"""
+        now = time.monotonic()
+        expired = [key for key, entry in self._cache.items() if entry.expires_at <= now]
+        for key in expired:
+            self._remove(key)
+        self.stats["expirations"] += len(expired)
+        return len(expired)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """İsabet, ıska ve tahliye sayaçlarını döndür"""
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": self.stats["hits"] / total if total else 0.0,
+            "entries": len(self._cache),
+            "bytes": self._bytes
+        }
+    
+    def start(self) -> None:
+        """Arka planda süresi dolan kayıtları temizleyen görevi başlat"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+    
+    async def stop(self) -> None:
+        """Arka plan temizleme görevini durdur"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+    
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.sweep()
+            if removed:
+                logger.debug(f"Cache temizliği: {removed} kayıt silindi")
+
+class TieredCache:
+    """Süreç içi L1 (SimpleCache) önünde, isteğe bağlı paylaşılan L2 cache
+
+    L2'ye yazılan değerler pickle ile ikili olarak saklanır. Yük sürüm baytı
+    ve CACHE_L2_SECRET ile HMAC-SHA256 imzası taşır; imzası tutmayan ya da
+    çözülemeyen kayıt açılmadan L2 hatası sayılır. Bir süreç kayıt yazdığında
+    ya da sildiğinde diğer süreçlerin L1 kopyaları pub/sub ile geçersiz kılınır.
+    """
+    CHANNEL = "teddy:cache:invalidate"
+    VERSION = b"\x01"
+
+    def __init__(self, l1: SimpleCache, l2: Optional[CacheBackend] = None,
+                 secret: Optional[str] = None):
+        self.l1 = l1
+        self.l2 = l2
+        self._secret = (secret or Config.CACHE_L2_SECRET).encode()
+        if l2 is not None:
+            self._check_secret()
+        self._origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        self.stats = {"l2_hits": 0, "l2_misses": 0, "l2_errors": 0}
+    
+    async def attach(self, l2: CacheBackend) -> None:
+        """L2 arka ucunu bağla ve geçersiz kılma mesajlarını dinlemeye başla"""
+        self._check_secret()
+        await self.detach()
+        self.l2 = l2
+        self._listener = asyncio.create_task(self._listen())
+        # Dinleyicinin kanala abone olmasına fırsat ver
+        await asyncio.sleep(0)
+    
+    def _check_secret(self) -> None:
+        # L2'ye yazabilen biri bilinen anahtarla pickle yükü imzalayıp kod çalıştırabilir
+        if self._secret.decode() in Config.PLACEHOLDER_SECRETS:
+            raise RuntimeError("L2 cache için CACHE_L2_SECRET (ya da JWT_SECRET_KEY) gerçek bir anahtar olmalı")
+    
+    async def detach(self) -> None:
+        """L2 bağlantısını kapat"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self.l2 is not None:
+            await self.l2.close()
+            self.l2 = None
+    
+    def _encode(self, key: str, value: Any) -> bytes:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        return self.VERSION + self._sign(key, data) + data
+    
+    def _decode(self, key: str, payload: bytes) -> Any:
+        """İmzayı doğrula ve değeri aç; geçersiz yükte ValueError"""
+        version, signature, data = payload[:1], payload[1:33], payload[33:]
+        if version != self.VERSION:
+            raise ValueError("Bilinmeyen L2 kayıt sürümü")
+        # İmza anahtarı da kapsar; bir anahtarın değeri başka anahtara kopyalanamaz
+        if not hmac.compare_digest(signature, self._sign(key, data)):
+            raise ValueError("L2 kayıt imzası geçersiz")
+        return pickle.loads(data)
+    
+    def _sign(self, key: str, data: bytes) -> bytes:
+        return hmac.new(self._secret, key.encode() + b"\0" + data, hashlib.sha256).digest()
+    
+    async def get(self, key: str) -> Optional[Any]:
+        """Önce L1'e, yoksa L2'ye bak; L2 isabeti L1'e kalan süresiyle yazılır"""
+        value = self.l1.get(key)
+        if value is not None or self.l2 is None:
+            return value
+        
+        try:
+            item = await self.l2.get(key)
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            logger.error(f"L2 cache okuma hatası: {str(e)}")
+            return None
+        
+        if item is None:
+            self.stats["l2_misses"] += 1
+            CACHE_REQUESTS.labels("l2", "miss").inc()
+            return None
+        
+        data, remaining = item
+        try:
+            value = self._decode(key, data)
+        except Exception as e:
+            # Bozuk, eski sürüm ya da başkasının yazdığı kayıt ıska sayılır
+            self.stats["l2_errors"] += 1
+            logger.error(f"L2 cache kaydı çözülemedi ({key}): {str(e)}")
+            return None
+        self.stats["l2_hits"] += 1
+        CACHE_REQUESTS.labels("l2", "hit").inc()
+        self.l1.set(key, value, remaining)
+        return value
+    
+    async def set(self, key: str, value: Any, ttl: float = 3600) -> None:
+        """Her iki katmana yaz ve diğer süreçlerin L1 kopyasını geçersiz kıl"""
+        self.l1.set(key, value, ttl)
+        if self.l2 is None:
+            return
+        try:
+            await self.l2.set(key, self._encode(key, value), ttl)
+            await self.l2.publish(self.CHANNEL, f"{self._origin}:{key}".encode())
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            logger.error(f"L2 cache yazma hatası: {str(e)}")
+    
+    async def delete(self, key: str) -> None:
+        """Kaydı tüm süreçlerden sil"""
+        self.l1.delete(key)
+        if self.l2 is None:
+            return
+        try:
+            await self.l2.delete(key)
+            await self.l2.publish(self.CHANNEL, f"{self._origin}:{key}".encode())
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            logger.error(f"L2 cache silme hatası: {str(e)}")
+    
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for message in self.l2.subscribe(self.CHANNEL):
+                    origin, _, key = message.decode().partition(":")
+                    if origin != self._origin:
+                        self.l1.delete(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache geçersiz kılma dinleyicisi hatası: {str(e)}")
+                # Bağlantı koptuysa L1'deki kopyalar bayatlamış olabilir
+                self.l1.clear()
+                await asyncio.sleep(1)
 
 # Singleton cache instance
 cache = SimpleCache()
+tiered_cache = TieredCache(cache)
+
+# Aynı anahtar için sürmekte olan hesaplamalar (single-flight)
+_inflight: Dict[str, asyncio.Task] = {}
+# Arka planda yenilenen kayıtların görevleri (çöp toplayıcıya karşı referans)
+_background_refreshes: Set[asyncio.Task] = set()
+
+def cache_decorator(ttl: int = 3600, stale_ttl: int = 0) -> Callable:
+    """Cache decorator'ı
 
-def cache_decorator(ttl: int = 3600) -> Callable:
-    """Cache decorator'ı"""
+    Değerler tiered_cache üzerinden saklanır; L2 bağlıysa tüm süreçler
+    aynı sonucu paylaşır. Aynı anahtarı eşzamanlı isteyen çağrılardan
+    yalnızca biri fonksiyonu çalıştırır, diğerleri onun sonucunu bekler. stale_ttl > 0 ise süresi
+    geçen değer stale_ttl boyunca döndürülmeye devam eder ve arka planda
+    yenilenir.
+    """
     def decorator(func: Callable) -> Callable:
+        async def run(key: str, args: tuple, kwargs: dict) -> Any:
+            try:
+                start_time = time.monotonic()
+                result = await func(*args, **kwargs)
+                duration = time.monotonic() - start_time
+                
+                logger.debug(f"Cache miss for key: {key}, duration: {duration:.2f}s")
+                # Tazelik süresi süreçler arasında paylaşıldığı için duvar saatiyle tutulur
+                await tiered_cache.set(key, (result, time.time() + ttl), ttl + stale_ttl)
+                return result
+            finally:
+                del _inflight[key]
+        
+        async def compute(key: str, args: tuple, kwargs: dict) -> Any:
+            # Hesaplama çağırandan bağımsız bir görevde çalışır; hiçbir çağıranın
+            # (ilki dahil) iptali ortak işi iptal etmez
+            task = _inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(run(key, args, kwargs))
+                _inflight[key] = task
+            else:
+                logger.debug(f"Cache coalesced for key: {key}")
+            return await asyncio.shield(task)
+        
+        async def refresh_quietly(key: str, args: tuple, kwargs: dict) -> None:
+            try:
+                await compute(key, args, kwargs)
+            except Exception as e:
+                logger.error(f"Arka plan cache yenileme hatası ({key}): {str(e)}")
+        
         @wraps(func)
         async def wrapper(*args: Any, **kwargs: Any) -> Any:
             # Cache anahtarını oluştur
             key = f"{func.__name__}:{':'.join(str(arg) for arg in args)}:{':'.join(f'{k}:{v}' for k, v in sorted(kwargs.items()))}"
             
             # Cache'den veriyi al
-            cached_data = cache.get(key)
-            if cached_data is not None:
-                logger.debug(f"Cache hit for key: {key}")
-                return cached_data
-            
-            # Fonksiyonu çalıştır ve sonucu cache'le
-            start_time = time.time()
-            result = await func(*args, **kwargs)
-            duration = time.time() - start_time
-            
-            logger.debug(f"Cache miss for key: {key}, duration: {duration:.2f}s")
-            cache.set(key, result, ttl)
+            cached = await tiered_cache.get(key)
+            if cached is not None:
+                value, fresh_until = cached
+                if fresh_until > time.time():
+                    logger.debug(f"Cache hit for key: {key}")
+                    return value
+                
+                # Bayat değeri hemen döndür, yenilemeyi tek seferde arka planda yap
+                logger.debug(f"Cache stale for key: {key}")
+                if key not in _inflight:
+                    task = asyncio.create_task(refresh_quietly(key, args, kwargs))
+                    _background_refreshes.add(task)
+                    task.add_done_callback(_background_refreshes.discard)
+                return value
             
-            return result
+            return await compute(key, args, kwargs)
         return wrapper
-    return decorator 
\ No newline at end of file
+    return decorator
\ No newline at end of file
@@ -0,0 +1,117 @@
+import asyncio
+import time
+import logging
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config import Config
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis isteğe bağlıdır; yalnızca L2 açıkken gerekir
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend(ABC):
+    """Süreçler arası paylaşılan (L2) cache arka ucu arayüzü"""
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """(veri, kalan süre sn) döndür; yoksa None"""
+
+    @abstractmethod
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, message: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+class RedisBackend(CacheBackend):
+    """Redis tabanlı L2 cache"""
+    def __init__(self, url: Optional[str] = None, prefix: str = "teddy:cache:"):
+        if aioredis is None:
+            raise RuntimeError("Redis L2 cache için 'redis' paketi gerekli")
+        self.prefix = prefix
+        self._client = aioredis.from_url(url or Config.get_redis_url())
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        async with self._client.pipeline(transaction=False) as pipe:
+            data, ttl_ms = await pipe.get(self.prefix + key).pttl(self.prefix + key).execute()
+        if data is None:
+            return None
+        return data, max(ttl_ms, 0) / 1000
+
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        await self._client.set(self.prefix + key, data, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self.prefix + key)
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        await self._client.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"]
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+    async def close(self) -> None:
+        await self._client.close()
+
+class InMemoryServer:
+    """InMemoryBackend örneklerinin paylaştığı süreç içi sunucu (testler için)"""
+    def __init__(self):
+        self.data: Dict[str, Tuple[bytes, float]] = {}
+        self.channels: Dict[str, List[asyncio.Queue]] = {}
+
+class InMemoryBackend(CacheBackend):
+    """Redis davranışını süreç içinde taklit eden L2 arka ucu"""
+    def __init__(self, server: Optional[InMemoryServer] = None):
+        self.server = server or InMemoryServer()
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        item = self.server.data.get(key)
+        if item is None:
+            return None
+        data, expires_at = item
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            del self.server.data[key]
+            return None
+        return data, remaining
+
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        self.server.data[key] = (data, time.monotonic() + ttl)
+
+    async def delete(self, key: str) -> None:
+        self.server.data.pop(key, None)
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        for queue in self.server.channels.get(channel, []):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self.server.channels.setdefault(channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.server.channels[channel].remove(queue)
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple, Union
+from fastapi import WebSocket
+from config import Config
+from metrics import ACTIVE_CONNECTIONS, ERRORS, QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Kapanış kodları
+CLOSE_GOING_AWAY = 1001
+CLOSE_SLOW_CONSUMER = 1008
+CLOSE_REPLACED = 4000
+CLOSE_TIMEOUT = 1.0
+
+SLOW_CONSUMER_POLICIES = ("disconnect", "drop_oldest")
+
+Outbound = Union[str, bytes]
+
+class Connection:
+    """Tek bir WebSocket: gönderimler sınırlı kuyruğa yazılır, ayrı bir görev soketi boşaltır"""
+    __slots__ = (
+        "client_id", "websocket", "max_queue", "max_queue_bytes", "policy", "last_seen", "heartbeat",
+        "close_code", "stats", "_queue", "_queue_bytes", "_wakeup", "_closed", "_writer"
+    )
+
+    def __init__(self, client_id: str, websocket: WebSocket, max_queue: int,
+                 max_queue_bytes: int, policy: str):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.max_queue_bytes = max_queue_bytes
+        self.policy = policy
+        self.last_seen = time.monotonic()
+        # Uygulama düzeyi ping/pong yalnızca hello ile isteyen istemcilere uygulanır
+        self.heartbeat = False
+        self.close_code: Optional[int] = None
+        self.stats = {"sent": 0, "dropped": 0}
+        self._queue: Deque[Outbound] = deque()
+        self._queue_bytes = 0
+        self._wakeup = asyncio.Event()
+        self._closed = asyncio.get_running_loop().create_future()
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.done()
+
+    @property
+    def pending(self) -> int:
+        """Gönderilmeyi bekleyen mesaj sayısı"""
+        return len(self._queue)
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._drain())
+
+    def touch(self) -> None:
+        """İstemciden mesaj geldiğini işaretle (boşta kalma süresini sıfırlar)"""
+        self.last_seen = time.monotonic()
+
+    def enqueue(self, message: Outbound) -> bool:
+        """Mesajı gönderim kuyruğuna ekle; kuyruk doluysa yavaş tüketici politikası uygulanır"""
+        if self.closed:
+            return False
+
+        size = len(message)
+        while self._queue and (len(self._queue) >= self.max_queue
+                               or self._queue_bytes + size > self.max_queue_bytes):
+            ERRORS.labels("ws_slow_consumer").inc()
+            if self.policy != "drop_oldest":
+                logger.warning(f"Yavaş istemci bağlantısı kesiliyor: {self.client_id}")
+                self.close(CLOSE_SLOW_CONSUMER)
+                return False
+            self._queue_bytes -= len(self._queue.popleft())
+            self.stats["dropped"] += 1
+            QUEUE_DEPTH.labels("ws_send").dec()
+
+        self._queue.append(message)
+        self._queue_bytes += size
+        QUEUE_DEPTH.labels("ws_send").inc()
+        self._wakeup.set()
+        return True
+
+    async def send_json(self, data: Dict[str, Any]) -> None:
+        """WebSocket.send_json ile aynı imza; mesaj kuyruğa yazılır, beklemez"""
+        self.enqueue(json.dumps(data, ensure_ascii=False))
+
+    async def send_bytes(self, data: bytes) -> None:
+        """WebSocket.send_bytes ile aynı imza; mesaj kuyruğa yazılır, beklemez"""
+        self.enqueue(data)
+
+    async def receive(self) -> Dict[str, Any]:
+        """Sonraki mesajı al; bağlantı sunucu tarafından kapatılırsa disconnect döner"""
+        if not self.closed:
+            receive = asyncio.ensure_future(self.websocket.receive())
+            await asyncio.wait({receive, self._closed}, return_when=asyncio.FIRST_COMPLETED)
+            if receive.done():
+                message = receive.result()
+                self.touch()
+                return message
+            receive.cancel()
+        return {"type": "websocket.disconnect", "code": self.close_code}
+
+    def close(self, code: int = 1000) -> None:
+        """Yeni gönderimleri durdur; kuyruk boşalınca soket yazıcı görevde kapatılır"""
+        if self.closed:
+            return
+        self.close_code = code
+        self._closed.set_result(code)
+        self._wakeup.set()
+        if code == CLOSE_SLOW_CONSUMER and self._writer is not None:
+            # Soket tıkalı; kuyruğun boşalması beklenmez
+            self._writer.cancel()
+
+    async def wait_closed(self, timeout: float = 5.0) -> None:
+        """Yazıcı görev bitene kadar bekle; soket tıkalıysa görev iptal edilir"""
+        if self._writer is None:
+            return
+        done, _ = await asyncio.wait({self._writer}, timeout=timeout)
+        if not done:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+
+    async def _drain(self) -> None:
+        """Kuyruktaki mesajları sırayla sokete yaz; kapanışta kalanlar da gönderilmeye çalışılır"""
+        websocket = self.websocket
+        try:
+            while True:
+                if not self._queue:
+                    if self.closed:
+                        break
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                message = self._queue.popleft()
+                self._queue_bytes -= len(message)
+                QUEUE_DEPTH.labels("ws_send").dec()
+                if isinstance(message, bytes):
+                    await websocket.send_bytes(message)
+                else:
+                    await websocket.send_text(message)
+                self.stats["sent"] += 1
+        except Exception as e:
+            logger.info(f"WebSocket gönderimi durdu ({self.client_id}): {str(e)}")
+            self.close(CLOSE_GOING_AWAY)
+        finally:
+            if self._queue:
+                QUEUE_DEPTH.labels("ws_send").dec(len(self._queue))
+                self._queue.clear()
+                self._queue_bytes = 0
+            try:
+                await asyncio.wait_for(websocket.close(self.close_code or 1000), CLOSE_TIMEOUT)
+            except Exception:
+                pass
+
+class ConnectionManager:
+    """client_id başına tek WebSocket bağlantısını, gönderim kuyruklarını ve nabız kontrolünü yönetir"""
+    def __init__(self, max_queue: Optional[int] = None, max_queue_bytes: Optional[int] = None,
+                 policy: Optional[str] = None, heartbeat_interval: Optional[float] = None,
+                 idle_timeout: Optional[float] = None):
+        self.max_queue = max_queue or Config.WS_SEND_QUEUE_SIZE
+        self.max_queue_bytes = max_queue_bytes or Config.WS_SEND_QUEUE_BYTES
+        self.policy = policy or Config.WS_SLOW_CONSUMER_POLICY
+        if self.policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Geçersiz yavaş istemci politikası: {self.policy}")
+        self.heartbeat_interval = heartbeat_interval or Config.WS_HEARTBEAT_INTERVAL
+        self.idle_timeout = idle_timeout or Config.WS_IDLE_TIMEOUT
+        self._connections: Dict[str, Connection] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self.stats = {"replaced": 0, "reaped": 0, "broadcasts": 0}
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self._connections
+
+    def get(self, client_id: str) -> Optional[Connection]:
+        return self._connections.get(client_id)
+
+    async def connect(self, client_id: str, websocket: WebSocket) -> Connection:
+        """Soketi kabul et; aynı client_id ile açık eski bağlantı kapatılır"""
+        await websocket.accept()
+        connection = Connection(client_id, websocket, self.max_queue, self.max_queue_bytes, self.policy)
+        connection.start()
+
+        previous = self._connections.get(client_id)
+        self._connections[client_id] = connection
+        if previous is not None:
+            logger.info(f"Aynı istemci yeniden bağlandı, eski bağlantı kapatılıyor: {client_id}")
+            self.stats["replaced"] += 1
+            previous.close(CLOSE_REPLACED)
+        else:
+            ACTIVE_CONNECTIONS.inc()
+        return connection
+
+    async def disconnect(self, connection: Connection) -> None:
+        """Bağlantıyı kapat ve (yerine yenisi gelmediyse) kayıttan çıkar"""
+        if self._connections.get(connection.client_id) is connection:
+            del self._connections[connection.client_id]
+            ACTIVE_CONNECTIONS.dec()
+        connection.close()
+        await connection.wait_closed()
+
+    def broadcast(self, message: Union[Dict[str, Any], bytes],
+                  exclude: Iterable[str] = ()) -> int:
+        """Mesajı bir kez serileştirip tüm bağlantıların kuyruğuna ekle; ulaşılan bağlantı sayısını döndür"""
+        payload: Outbound = message if isinstance(message, bytes) else json.dumps(message, ensure_ascii=False)
+        excluded = set(exclude)
+        delivered = 0
+        for client_id, connection in list(self._connections.items()):
+            if client_id not in excluded and connection.enqueue(payload):
+                delivered += 1
+        self.stats["broadcasts"] += 1
+        return delivered
+
+    def start(self) -> None:
+        """Nabız ve boşta kalan bağlantı temizleme görevini başlat"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._heartbeat())
+
+    async def stop(self) -> None:
+        """Nabız görevini durdur ve tüm bağlantıları kapat"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for connection in list(self._connections.values()):
+            connection.close(CLOSE_GOING_AWAY)
+
+    def reap(self) -> Tuple[int, int]:
+        """Nabız isteyen bağlantılardan boşta kalanları kapat, diğerlerine ping gönder; (kapatılan, ping atılan) döndür
+
+        pong göndermeyen eski istemciler burada kapatılmaz; kopan soketleri
+        uvicorn'un WebSocket protokol ping'leri (--ws-ping-interval) yakalar.
+        """
+        now = time.monotonic()
+        reaped = pinged = 0
+        ping = json.dumps({"type": "ping"})
+        for connection in list(self._connections.values()):
+            if not connection.heartbeat:
+                continue
+            if now - connection.last_seen > self.idle_timeout:
+                logger.info(f"Boşta kalan bağlantı kapatılıyor: {connection.client_id}")
+                connection.close(CLOSE_GOING_AWAY)
+                reaped += 1
+            elif connection.enqueue(ping):
+                pinged += 1
+        self.stats["reaped"] += reaped
+        return reaped, pinged
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"Nabız kontrolü hatası: {str(e)}")
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            **self.stats,
+            "connections": len(self._connections),
+            "queued": sum(connection.pending for connection in self._connections.values())
+        }
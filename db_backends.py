@@ -0,0 +1,889 @@
+import itertools
+import json
+import logging
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncContextManager, AsyncIterator, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from archive import ArchiveSegment
+from config import Config
+from db_pool import ConnectionPool
+
+try:
+    import fcntl
+except ImportError:  # Windows'ta yoktur; SQLite iş kilidi tek işçiye düşer
+    fcntl = None
+
+try:
+    import asyncpg
+except ImportError:  # asyncpg isteğe bağlıdır; yalnızca Postgres kullanılırken gerekir
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# (session_id, user_message, assistant_message, audio_blob, video_path)
+ConversationRow = Tuple[str, str, str, Optional[str], Optional[str]]
+# (user_id, preferences yaması, interaction_history yaması)
+ProfileRow = Tuple[str, Dict[str, Any], Dict[str, Any]]
+CONVERSATION_COLUMNS = ("session_id", "user_message", "assistant_message", "audio_blob", "video_path")
+KNOWLEDGE_COLUMNS = "id, topic, content, source, confidence, timestamp"
+ARCHIVE_COLUMNS = "session_id, first_id, last_id, row_count, path"
+
+# Postgres 'simple' sözlüğü aksanları katlamaz; SQLite'ın remove_diacritics
+# davranışına yakın olması için sık Latin aksanları hem dizinde hem sorguda
+# temel harfe çevrilir ("gunes" "Güneş" ile eşleşir). unaccent eklentisi
+# her kurulumda bulunmadığından ve IMMUTABLE olmadığından kullanılmaz.
+ACCENTED = "ÀÁÂÃÄÅÇÈÉÊËÌÍÎÏÑÒÓÔÕÖÙÚÛÜÝĞİŞàáâãäåçèéêëìíîïñòóôõöùúûüýÿğş"
+UNACCENTED = "AAAAAACEEEEIIIINOOOOOUUUUYGISaaaaaaceeeeiiiinooooouuuuyygs"
+UNACCENT_TABLE = str.maketrans(ACCENTED, UNACCENTED)
+
+def pg_unaccent(expression: str) -> str:
+    """ACCENTED karakterlerini temel harfe çeviren (üretilmiş sütunda kullanılabilir) SQL ifadesi"""
+    return f"translate({expression}, '{ACCENTED}', '{UNACCENTED}')"
+
+def search_terms(query: str) -> List[str]:
+    """Serbest metni arama terimlerine böl (sözdizimi karakterleri terime dahil edilmez)"""
+    return re.findall(r"\w+", query)
+
+def sqlite_json_merge(target: str, patch: str) -> str:
+    """Üst düzey anahtarları patch'teki değerlerle değiştiren JSON birleştirme ifadesi (dict.update ve jsonb || gibi)
+
+    json_patch (RFC 7396) iç içe nesneleri birleştirip null anahtarları sildiği
+    için kullanılmaz; önbellek ve Postgres ile aynı sonucu vermelidir.
+    """
+    return f"""(
+        SELECT json_group_object(key, CASE type
+            WHEN 'true' THEN json('true') WHEN 'false' THEN json('false')
+            WHEN 'object' THEN json(value) WHEN 'array' THEN json(value)
+            ELSE value END)
+        FROM (
+            SELECT key, value, type FROM json_each(COALESCE({target}, '{{}}'))
+            WHERE key NOT IN (SELECT key FROM json_each({patch}))
+            UNION ALL
+            SELECT key, value, type FROM json_each({patch})
+        )
+    )"""
+
+class DatabaseBackend(ABC):
+    """Database sınıfının kullandığı depolama arka ucu arayüzü"""
+    name = "base"
+
+    @property
+    @abstractmethod
+    def is_open(self) -> bool:
+        ...
+
+    @abstractmethod
+    async def open(self) -> None:
+        ...
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    @abstractmethod
+    async def create_schema(self) -> None:
+        ...
+
+    @abstractmethod
+    async def insert_conversation(self, row: ConversationRow) -> Dict:
+        """Tek kaydı yaz ve veritabanındaki halini (id, zaman damgası) döndür"""
+
+    @abstractmethod
+    async def insert_conversations(self, rows: List[ConversationRow]) -> Optional[List[Dict]]:
+        """Kayıtları tek bir işlemde toplu yaz; arka uç id döndüremiyorsa None"""
+
+    @abstractmethod
+    async def get_conversation_history(self, session_id: str, limit: int,
+                                       before: Optional[int] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    async def get_archivable(self, cutoff: datetime, limit: int) -> List[Dict]:
+        """cutoff'tan eski, id sırasındaki en eski kesintisiz kayıt dilimi (arşiv hep sıcak tablodan eski kalır)"""
+
+    @abstractmethod
+    def job_lock(self, name: str) -> AsyncContextManager[bool]:
+        """Periyodik iş için işçiler arası kilit; kilit başka işçideyse False verir"""
+
+    @abstractmethod
+    async def archive_conversations(self, segments: List[ArchiveSegment], ids: List[int]) -> None:
+        """Parçaları dizine ekle ve kayıtları sıcak tablodan tek işlemde sil"""
+
+    @abstractmethod
+    async def get_archive_segments(self, session_id: str, before: Optional[int],
+                                   limit: int) -> List[ArchiveSegment]:
+        """Oturumun before'dan eski kayıt içeren parçaları, yeniden eskiye"""
+
+    @abstractmethod
+    async def get_inline_audio(self, limit: int, after: int = 0) -> List[Tuple[int, str]]:
+        """Sesi hâlâ satır içinde (base64) tutan eski kayıtları id sırasıyla (id, audio_path) olarak getir"""
+
+    @abstractmethod
+    async def set_audio_blobs(self, rows: List[Tuple[str, int]]) -> None:
+        """(özet, id) çiftleriyle kayıtların sesini blob referansına çevir"""
+
+    @abstractmethod
+    async def unreferenced_blobs(self, limit: int) -> List[str]:
+        """Referans sayısı sıfıra düşmüş blob özetleri"""
+
+    @abstractmethod
+    async def delete_blobs(self, digests: List[str]) -> None:
+        """Hâlâ referanssız olan blob kayıtlarını sil"""
+
+    @abstractmethod
+    async def existing_blobs(self, digests: List[str]) -> Set[str]:
+        """Verilen özetlerden blobs tablosunda kaydı olanlar"""
+
+    @abstractmethod
+    async def upsert_user_profiles(self, rows: List[ProfileRow]) -> None:
+        """Profilleri tek ifadeyle ekle ya da JSON alanlarını veritabanında birleştirerek güncelle
+
+        Birleştirme yüzeyseldir: yamadaki üst düzey anahtarlar mevcut değerin
+        yerine geçer, None değerler null olarak saklanır (dict.update ile aynı).
+        """
+
+    @abstractmethod
+    async def get_user_profile(self, user_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    async def add_learned_knowledge(self, topic: str, content: str, source: Optional[str],
+                                    confidence: float) -> None:
+        ...
+
+    @abstractmethod
+    async def get_learned_knowledge(self, topic: Optional[str] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    async def search_knowledge(self, query: str, min_confidence: float, source: Optional[str],
+                               limit: int, offset: int) -> List[Dict]:
+        """Konu ve içerikte tam metin ara; sonuçlar alaka puanına (score) göre azalan sırada"""
+
+class SQLiteBackend(DatabaseBackend):
+    """Tek dosyalı SQLite arka ucu (tek yazıcı, çoklu okuyucu havuzu)"""
+    name = "sqlite"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+
+    @property
+    def is_open(self) -> bool:
+        return self.pool.is_open
+
+    async def open(self) -> None:
+        await self.pool.open()
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def create_schema(self) -> None:
+        async with self.pool.writer() as db:
+            # Konuşma geçmişi tablosu
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    user_message TEXT NOT NULL,
+                    assistant_message TEXT NOT NULL,
+                    audio_path TEXT,
+                    video_path TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Oturum bazlı sayfalama için bileşik indeks
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_conversations_session_id
+                ON conversations (session_id, id)
+            """)
+
+            # Ses blob deposundadır; satırda yalnızca özet tutulur
+            cursor = await db.execute("PRAGMA table_info(conversations)")
+            if "audio_blob" not in [row[1] for row in await cursor.fetchall()]:
+                await db.execute("ALTER TABLE conversations ADD COLUMN audio_blob TEXT")
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    digest TEXT PRIMARY KEY,
+                    refcount INTEGER NOT NULL DEFAULT 0,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (digest) WHERE refcount <= 0
+            """)
+            # Referans sayıları konuşma satırlarıyla aynı işlemde tetikleyicilerle tutulur
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS conversations_blob_ai AFTER INSERT ON conversations
+                WHEN new.audio_blob IS NOT NULL BEGIN
+                    INSERT INTO blobs (digest, refcount) VALUES (new.audio_blob, 1)
+                    ON CONFLICT (digest) DO UPDATE SET refcount = refcount + 1;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS conversations_blob_ad AFTER DELETE ON conversations
+                WHEN old.audio_blob IS NOT NULL BEGIN
+                    UPDATE blobs SET refcount = refcount - 1 WHERE digest = old.audio_blob;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS conversations_blob_au AFTER UPDATE OF audio_blob ON conversations
+                BEGIN
+                    UPDATE blobs SET refcount = refcount - 1 WHERE digest = old.audio_blob;
+                    INSERT INTO blobs (digest, refcount) SELECT new.audio_blob, 1 WHERE new.audio_blob IS NOT NULL
+                    ON CONFLICT (digest) DO UPDATE SET refcount = refcount + 1;
+                END
+            """)
+
+            # Arşiv parçalarının dizini
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS conversation_archive (
+                    session_id TEXT NOT NULL,
+                    first_id INTEGER NOT NULL,
+                    last_id INTEGER NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (session_id, last_id)
+                )
+            """)
+
+            # Kullanıcı profili tablosu
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS user_profiles (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT UNIQUE NOT NULL,
+                    preferences TEXT,
+                    interaction_history TEXT,
+                    last_seen DATETIME
+                )
+            """)
+
+            # Öğrenilen bilgiler tablosu
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS learned_knowledge (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    source TEXT,
+                    confidence FLOAT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_learned_knowledge_topic
+                ON learned_knowledge (topic, confidence DESC)
+            """)
+
+            # Tam metin dizini; içerik learned_knowledge'dan okunur, tetikleyicilerle eşitlenir
+            cursor = await db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'learned_knowledge_fts'"
+            )
+            fts_exists = await cursor.fetchone() is not None
+            await db.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS learned_knowledge_fts USING fts5(
+                    topic, content,
+                    content='learned_knowledge', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS learned_knowledge_ai AFTER INSERT ON learned_knowledge BEGIN
+                    INSERT INTO learned_knowledge_fts (rowid, topic, content)
+                    VALUES (new.id, new.topic, new.content);
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS learned_knowledge_ad AFTER DELETE ON learned_knowledge BEGIN
+                    INSERT INTO learned_knowledge_fts (learned_knowledge_fts, rowid, topic, content)
+                    VALUES ('delete', old.id, old.topic, old.content);
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS learned_knowledge_au AFTER UPDATE ON learned_knowledge BEGIN
+                    INSERT INTO learned_knowledge_fts (learned_knowledge_fts, rowid, topic, content)
+                    VALUES ('delete', old.id, old.topic, old.content);
+                    INSERT INTO learned_knowledge_fts (rowid, topic, content)
+                    VALUES (new.id, new.topic, new.content);
+                END
+            """)
+            if not fts_exists:
+                # Dizin sonradan eklendiyse mevcut kayıtlar da dizinlenir
+                await db.execute("INSERT INTO learned_knowledge_fts (learned_knowledge_fts) VALUES ('rebuild')")
+
+            await db.commit()
+
+    async def insert_conversation(self, row: ConversationRow) -> Dict:
+        async with self.pool.writer() as db:
+            cursor = await db.execute("""
+                INSERT INTO conversations
+                (session_id, user_message, assistant_message, audio_blob, video_path)
+                VALUES (?, ?, ?, ?, ?)
+                RETURNING *
+            """, row)
+            inserted = dict(await cursor.fetchone())
+            await db.commit()
+            return inserted
+
+    async def insert_conversations(self, rows: List[ConversationRow]) -> Optional[List[Dict]]:
+        async with self.pool.writer() as db:
+            await db.executemany("""
+                INSERT INTO conversations
+                (session_id, user_message, assistant_message, audio_blob, video_path)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            # Tek yazıcı ve AUTOINCREMENT ile partinin id'leri ardışıktır; son id'den geriye okunur
+            cursor = await db.execute("SELECT last_insert_rowid()")
+            last_id = (await cursor.fetchone())[0]
+            cursor = await db.execute(
+                "SELECT * FROM conversations WHERE id > ? AND id <= ? ORDER BY id",
+                (last_id - len(rows), last_id)
+            )
+            inserted = [dict(row) for row in await cursor.fetchall()]
+            await db.commit()
+            return inserted
+
+    async def get_conversation_history(self, session_id: str, limit: int,
+                                       before: Optional[int] = None) -> List[Dict]:
+        async with self.pool.reader() as db:
+            if before is None:
+                cursor = await db.execute("""
+                    SELECT * FROM conversations
+                    WHERE session_id = ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                """, (session_id, limit))
+            else:
+                cursor = await db.execute("""
+                    SELECT * FROM conversations
+                    WHERE session_id = ? AND id < ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                """, (session_id, before, limit))
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def get_archivable(self, cutoff: datetime, limit: int) -> List[Dict]:
+        async with self.pool.reader() as db:
+            # Birincil anahtar sırasıyla okunur; zaman damgası için ek indeks gerekmez
+            cursor = await db.execute("SELECT * FROM conversations ORDER BY id LIMIT ?", (limit,))
+            rows = [dict(row) for row in await cursor.fetchall()]
+        # CURRENT_TIMESTAMP UTC ve "YYYY-MM-DD HH:MM:SS" biçimindedir
+        cutoff_text = cutoff.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        return list(itertools.takewhile(lambda row: (row["timestamp"] or "") < cutoff_text, rows))
+
+    @asynccontextmanager
+    async def job_lock(self, name: str) -> AsyncIterator[bool]:
+        # Tek yazıcı bağlantısı yalnızca süreç içinde geçerlidir; birden çok işçi aynı
+        # dosyayı paylaşırken veritabanının yanındaki kilit dosyası üzerinde flock alınır
+        if self.db_path == ":memory:":
+            yield True
+            return
+        if fcntl is None:
+            # flock olmayan platformda periyodik işler yalnızca tek işçide çalışır
+            yield Config.WEB_CONCURRENCY <= 1
+            return
+        with open(f"{self.db_path}.{name}.lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    async def archive_conversations(self, segments: List[ArchiveSegment], ids: List[int]) -> None:
+        async with self.pool.writer() as db:
+            await db.executemany(
+                f"INSERT OR REPLACE INTO conversation_archive ({ARCHIVE_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                segments
+            )
+            cursor = await db.execute(
+                "DELETE FROM conversations WHERE id IN (SELECT value FROM json_each(?)) RETURNING audio_blob",
+                (json.dumps(ids),)
+            )
+            deleted = [row[0] for row in await cursor.fetchall()]
+            # Silme tetikleyicisi referansları düşürür; ses arşivde kullanılmaya devam ettiği için
+            # gerçekten silinen satırların sesleri aynı işlemde geri eklenir
+            await db.executemany(
+                "UPDATE blobs SET refcount = refcount + ? WHERE digest = ?",
+                [(count, digest) for digest, count in Counter(filter(None, deleted)).items()]
+            )
+            await db.commit()
+
+    async def get_archive_segments(self, session_id: str, before: Optional[int],
+                                   limit: int) -> List[ArchiveSegment]:
+        async with self.pool.reader() as db:
+            cursor = await db.execute(f"""
+                SELECT {ARCHIVE_COLUMNS} FROM conversation_archive
+                WHERE session_id = ? AND first_id < ?
+                ORDER BY last_id DESC
+                LIMIT ?
+            """, (session_id, before if before is not None else 2 ** 63 - 1, limit))
+            return [tuple(row) for row in await cursor.fetchall()]
+
+    async def get_inline_audio(self, limit: int, after: int = 0) -> List[Tuple[int, str]]:
+        async with self.pool.reader() as db:
+            cursor = await db.execute("""
+                SELECT id, audio_path FROM conversations
+                WHERE audio_path IS NOT NULL AND audio_blob IS NULL AND id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (after, limit))
+            return [(row[0], row[1]) for row in await cursor.fetchall()]
+
+    async def set_audio_blobs(self, rows: List[Tuple[str, int]]) -> None:
+        async with self.pool.writer() as db:
+            await db.executemany(
+                "UPDATE conversations SET audio_blob = ?, audio_path = NULL WHERE id = ?", rows
+            )
+            await db.commit()
+
+    async def unreferenced_blobs(self, limit: int) -> List[str]:
+        async with self.pool.reader() as db:
+            cursor = await db.execute(
+                "SELECT digest FROM blobs WHERE refcount <= 0 LIMIT ?", (limit,)
+            )
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def delete_blobs(self, digests: List[str]) -> None:
+        async with self.pool.writer() as db:
+            await db.executemany(
+                "DELETE FROM blobs WHERE digest = ? AND refcount <= 0", [(d,) for d in digests]
+            )
+            await db.commit()
+
+    async def existing_blobs(self, digests: List[str]) -> Set[str]:
+        async with self.pool.reader() as db:
+            cursor = await db.execute(
+                "SELECT digest FROM blobs WHERE digest IN (SELECT value FROM json_each(?))",
+                (json.dumps(digests),)
+            )
+            return {row[0] for row in await cursor.fetchall()}
+
+    async def upsert_user_profiles(self, rows: List[ProfileRow]) -> None:
+        # Yama veritabanı içinde birleştirilir; okuma-yazma yarışı olmaz
+        async with self.pool.writer() as db:
+            await db.executemany(f"""
+                INSERT INTO user_profiles
+                (user_id, preferences, interaction_history, last_seen)
+                VALUES (?, json(?), json(?), CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    preferences = {sqlite_json_merge("user_profiles.preferences", "excluded.preferences")},
+                    interaction_history = {sqlite_json_merge("user_profiles.interaction_history",
+                                                             "excluded.interaction_history")},
+                    last_seen = excluded.last_seen
+            """, [
+                (user_id, json.dumps(preferences), json.dumps(interaction))
+                for user_id, preferences, interaction in rows
+            ])
+            await db.commit()
+
+    async def get_user_profile(self, user_id: str) -> Optional[Dict]:
+        async with self.pool.reader() as db:
+            cursor = await db.execute(
+                "SELECT * FROM user_profiles WHERE user_id = ?", (user_id,)
+            )
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        profile = dict(row)
+        profile["preferences"] = json.loads(profile["preferences"] or "{}")
+        profile["interaction_history"] = json.loads(profile["interaction_history"] or "{}")
+        return profile
+
+    async def add_learned_knowledge(self, topic: str, content: str, source: Optional[str],
+                                    confidence: float) -> None:
+        async with self.pool.writer() as db:
+            await db.execute("""
+                INSERT INTO learned_knowledge (topic, content, source, confidence)
+                VALUES (?, ?, ?, ?)
+            """, (topic, content, source, confidence))
+            await db.commit()
+
+    async def get_learned_knowledge(self, topic: Optional[str] = None) -> List[Dict]:
+        async with self.pool.reader() as db:
+            if topic:
+                cursor = await db.execute(
+                    "SELECT * FROM learned_knowledge WHERE topic = ? ORDER BY confidence DESC",
+                    (topic,)
+                )
+            else:
+                cursor = await db.execute(
+                    "SELECT * FROM learned_knowledge ORDER BY timestamp DESC"
+                )
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def search_knowledge(self, query: str, min_confidence: float, source: Optional[str],
+                               limit: int, offset: int) -> List[Dict]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # Her terim tırnak içinde aranır (örtük VE); konu eşleşmesi içerikten iki kat ağırlıklı
+        match = " ".join(f'"{term}"' for term in terms)
+        sql = """
+            SELECT k.*, -bm25(learned_knowledge_fts, 2.0, 1.0) AS score
+            FROM learned_knowledge_fts
+            JOIN learned_knowledge AS k ON k.id = learned_knowledge_fts.rowid
+            WHERE learned_knowledge_fts MATCH ? AND COALESCE(k.confidence, 0) >= ?
+        """
+        params: List[Any] = [match, min_confidence]
+        if source is not None:
+            sql += " AND k.source = ?"
+            params.append(source)
+        # Eşit skorlarda id ile sıralanır; sayfalar arasında kayıt atlanmaz ya da tekrarlanmaz
+        sql += " ORDER BY bm25(learned_knowledge_fts, 2.0, 1.0), k.id DESC LIMIT ? OFFSET ?"
+        params.extend((limit, offset))
+
+        async with self.pool.reader() as db:
+            cursor = await db.execute(sql, params)
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+class PostgresBackend(DatabaseBackend):
+    """asyncpg havuzlu Postgres arka ucu; birden çok uygulama işçisi aynı anda yazabilir"""
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: Optional[int] = None, max_size: Optional[int] = None):
+        if asyncpg is None:
+            raise RuntimeError("Postgres arka ucu için 'asyncpg' paketi gerekli")
+        self.dsn = dsn
+        self.min_size = min_size or Config.DB_POOL_MIN_SIZE
+        self.max_size = max(self.min_size, max_size or Config.DB_POOL_MAX_SIZE)
+        self.pool: Optional["asyncpg.Pool"] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.pool is not None
+
+    @staticmethod
+    async def _init_connection(conn: "asyncpg.Connection") -> None:
+        # jsonb sütunları Python sözlüğü olarak okunup yazılır
+        await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+    async def open(self) -> None:
+        if self.pool is not None:
+            return
+        # asyncpg sorguları bağlantı başına hazırlanmış ifade olarak önbelleğe alır
+        self.pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            statement_cache_size=Config.DB_STATEMENT_CACHE_SIZE,
+            init=self._init_connection
+        )
+        logger.info(f"Postgres havuzu açıldı ({self.min_size}-{self.max_size} bağlantı)")
+
+    async def close(self) -> None:
+        if self.pool is None:
+            return
+        pool, self.pool = self.pool, None
+        await pool.close()
+        logger.info("Postgres havuzu kapatıldı")
+
+    async def create_schema(self) -> None:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Aynı anda açılan işçiler şemayı sırayla oluştursun
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('teddy_schema'))")
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS conversations (
+                        id BIGSERIAL PRIMARY KEY,
+                        session_id TEXT NOT NULL,
+                        user_message TEXT NOT NULL,
+                        assistant_message TEXT NOT NULL,
+                        audio_path TEXT,
+                        video_path TEXT,
+                        timestamp TIMESTAMPTZ DEFAULT now()
+                    )
+                """)
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_conversations_session_id
+                    ON conversations (session_id, id)
+                """)
+                await conn.execute("ALTER TABLE conversations ADD COLUMN IF NOT EXISTS audio_blob TEXT")
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS blobs (
+                        digest TEXT PRIMARY KEY,
+                        refcount INTEGER NOT NULL DEFAULT 0,
+                        created_at TIMESTAMPTZ DEFAULT now()
+                    )
+                """)
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (digest) WHERE refcount <= 0
+                """)
+                # COPY de satır tetikleyicilerini çalıştırır; referans sayısı toplu yazmada da doğru kalır.
+                # search_path sabitlenir; başka şemadan yapılan silmelerde de aynı blobs tablosu güncellenir
+                await conn.execute("""
+                    CREATE OR REPLACE FUNCTION teddy_blob_refcount() RETURNS trigger AS $$
+                    BEGIN
+                        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.audio_blob IS NOT NULL THEN
+                            UPDATE blobs SET refcount = refcount - 1 WHERE digest = OLD.audio_blob;
+                        END IF;
+                        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.audio_blob IS NOT NULL THEN
+                            INSERT INTO blobs (digest, refcount) VALUES (NEW.audio_blob, 1)
+                            ON CONFLICT (digest) DO UPDATE SET refcount = blobs.refcount + 1;
+                        END IF;
+                        RETURN NULL;
+                    END
+                    $$ LANGUAGE plpgsql SET search_path FROM CURRENT
+                """)
+                await conn.execute("""
+                    CREATE OR REPLACE TRIGGER conversations_blob_refcount
+                    AFTER INSERT OR DELETE OR UPDATE OF audio_blob ON conversations
+                    FOR EACH ROW EXECUTE FUNCTION teddy_blob_refcount()
+                """)
+
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS conversation_archive (
+                        session_id TEXT NOT NULL,
+                        first_id BIGINT NOT NULL,
+                        last_id BIGINT NOT NULL,
+                        row_count INTEGER NOT NULL,
+                        path TEXT NOT NULL,
+                        created_at TIMESTAMPTZ DEFAULT now(),
+                        PRIMARY KEY (session_id, last_id)
+                    )
+                """)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS user_profiles (
+                        id BIGSERIAL PRIMARY KEY,
+                        user_id TEXT UNIQUE NOT NULL,
+                        preferences JSONB NOT NULL DEFAULT '{}',
+                        interaction_history JSONB NOT NULL DEFAULT '{}',
+                        last_seen TIMESTAMPTZ
+                    )
+                """)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS learned_knowledge (
+                        id BIGSERIAL PRIMARY KEY,
+                        topic TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        source TEXT,
+                        confidence DOUBLE PRECISION,
+                        timestamp TIMESTAMPTZ DEFAULT now()
+                    )
+                """)
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_learned_knowledge_topic
+                    ON learned_knowledge (topic, confidence DESC)
+                """)
+                # Tam metin dizini: eklemede otomatik hesaplanan tsvector sütunu + GIN
+                expression = await conn.fetchval("""
+                    SELECT generation_expression FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = 'learned_knowledge'
+                      AND column_name = 'search_vector'
+                """)
+                if expression is not None and "translate" not in expression:
+                    # Eski sürümlerin aksan katlamayan sütunu (ve dizini) yeniden oluşturulur
+                    await conn.execute("ALTER TABLE learned_knowledge DROP COLUMN search_vector")
+                await conn.execute(f"""
+                    ALTER TABLE learned_knowledge ADD COLUMN IF NOT EXISTS search_vector tsvector
+                    GENERATED ALWAYS AS (
+                        setweight(to_tsvector('simple', {pg_unaccent('topic')}), 'A') ||
+                        setweight(to_tsvector('simple', {pg_unaccent('content')}), 'B')
+                    ) STORED
+                """)
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_learned_knowledge_search
+                    ON learned_knowledge USING GIN (search_vector)
+                """)
+
+    async def insert_conversation(self, row: ConversationRow) -> Dict:
+        async with self.pool.acquire() as conn:
+            return dict(await conn.fetchrow("""
+                INSERT INTO conversations
+                (session_id, user_message, assistant_message, audio_blob, video_path)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING *
+            """, *row))
+
+    async def insert_conversations(self, rows: List[ConversationRow]) -> Optional[List[Dict]]:
+        # COPY, satır satır INSERT'e göre tek gidiş-dönüşte çok daha hızlıdır ama id döndürmez
+        async with self.pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                "conversations", records=rows, columns=CONVERSATION_COLUMNS
+            )
+        return None
+
+    async def get_conversation_history(self, session_id: str, limit: int,
+                                       before: Optional[int] = None) -> List[Dict]:
+        async with self.pool.acquire() as conn:
+            if before is None:
+                rows = await conn.fetch("""
+                    SELECT * FROM conversations
+                    WHERE session_id = $1
+                    ORDER BY id DESC
+                    LIMIT $2
+                """, session_id, limit)
+            else:
+                rows = await conn.fetch("""
+                    SELECT * FROM conversations
+                    WHERE session_id = $1 AND id < $2
+                    ORDER BY id DESC
+                    LIMIT $3
+                """, session_id, before, limit)
+            return [dict(row) for row in rows]
+
+    async def get_archivable(self, cutoff: datetime, limit: int) -> List[Dict]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT * FROM conversations ORDER BY id LIMIT $1", limit)
+        return list(itertools.takewhile(
+            lambda row: row["timestamp"] is None or row["timestamp"] < cutoff, map(dict, rows)
+        ))
+
+    @asynccontextmanager
+    async def job_lock(self, name: str) -> AsyncIterator[bool]:
+        # Oturum düzeyinde danışma kilidi iş boyunca aynı bağlantıda tutulur
+        async with self.pool.acquire() as conn:
+            acquired = await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", name)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", name)
+
+    async def archive_conversations(self, segments: List[ArchiveSegment], ids: List[int]) -> None:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(f"""
+                    INSERT INTO conversation_archive ({ARCHIVE_COLUMNS}) VALUES ($1, $2, $3, $4, $5)
+                    ON CONFLICT (session_id, last_id) DO UPDATE
+                    SET first_id = excluded.first_id, row_count = excluded.row_count, path = excluded.path
+                """, segments)
+                rows = await conn.fetch(
+                    "DELETE FROM conversations WHERE id = ANY($1::bigint[]) RETURNING audio_blob", ids
+                )
+                # Silme tetikleyicisi referansları düşürür; ses arşivde kullanılmaya devam ettiği için
+                # gerçekten silinen satırların sesleri aynı işlemde geri eklenir
+                await conn.executemany(
+                    "UPDATE blobs SET refcount = refcount + $1 WHERE digest = $2",
+                    [(count, digest) for digest, count in
+                     Counter(row["audio_blob"] for row in rows if row["audio_blob"]).items()]
+                )
+
+    async def get_archive_segments(self, session_id: str, before: Optional[int],
+                                   limit: int) -> List[ArchiveSegment]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT {ARCHIVE_COLUMNS} FROM conversation_archive
+                WHERE session_id = $1 AND ($2::bigint IS NULL OR first_id < $2)
+                ORDER BY last_id DESC
+                LIMIT $3
+            """, session_id, before, limit)
+            return [tuple(row) for row in rows]
+
+    async def get_inline_audio(self, limit: int, after: int = 0) -> List[Tuple[int, str]]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT id, audio_path FROM conversations
+                WHERE audio_path IS NOT NULL AND audio_blob IS NULL AND id > $1
+                ORDER BY id
+                LIMIT $2
+            """, after, limit)
+            return [(row["id"], row["audio_path"]) for row in rows]
+
+    async def set_audio_blobs(self, rows: List[Tuple[str, int]]) -> None:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(
+                    "UPDATE conversations SET audio_blob = $1, audio_path = NULL WHERE id = $2", rows
+                )
+
+    async def unreferenced_blobs(self, limit: int) -> List[str]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT digest FROM blobs WHERE refcount <= 0 LIMIT $1", limit)
+            return [row["digest"] for row in rows]
+
+    async def delete_blobs(self, digests: List[str]) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM blobs WHERE digest = ANY($1::text[]) AND refcount <= 0", digests
+            )
+
+    async def existing_blobs(self, digests: List[str]) -> Set[str]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT digest FROM blobs WHERE digest = ANY($1::text[])", digests)
+            return {row["digest"] for row in rows}
+
+    async def upsert_user_profiles(self, rows: List[ProfileRow]) -> None:
+        # jsonb || (yüzeysel birleştirme) tek ifadede yapılır; kullanıcı sırasına dizmek
+        # eşzamanlı işçiler arasında kilitlenmeyi (deadlock) önler
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO user_profiles
+                    (user_id, preferences, interaction_history, last_seen)
+                    VALUES ($1, $2, $3, now())
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        preferences = user_profiles.preferences || EXCLUDED.preferences,
+                        interaction_history = user_profiles.interaction_history || EXCLUDED.interaction_history,
+                        last_seen = EXCLUDED.last_seen
+                """, sorted(rows, key=lambda row: row[0]))
+
+    async def get_user_profile(self, user_id: str) -> Optional[Dict]:
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow("SELECT * FROM user_profiles WHERE user_id = $1", user_id)
+        return dict(row) if row is not None else None
+
+    async def add_learned_knowledge(self, topic: str, content: str, source: Optional[str],
+                                    confidence: float) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO learned_knowledge (topic, content, source, confidence)
+                VALUES ($1, $2, $3, $4)
+            """, topic, content, source, confidence)
+
+    async def get_learned_knowledge(self, topic: Optional[str] = None) -> List[Dict]:
+        async with self.pool.acquire() as conn:
+            if topic:
+                rows = await conn.fetch(
+                    f"SELECT {KNOWLEDGE_COLUMNS} FROM learned_knowledge WHERE topic = $1 ORDER BY confidence DESC",
+                    topic
+                )
+            else:
+                rows = await conn.fetch(
+                    f"SELECT {KNOWLEDGE_COLUMNS} FROM learned_knowledge ORDER BY timestamp DESC"
+                )
+            return [dict(row) for row in rows]
+
+    async def search_knowledge(self, query: str, min_confidence: float, source: Optional[str],
+                               limit: int, offset: int) -> List[Dict]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # Terimler SQLite tarafıyla aynı şekilde VE ile bağlanır; aksanlar dizindeki gibi katlanır
+        terms = [term.translate(UNACCENT_TABLE) for term in terms]
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                SELECT {KNOWLEDGE_COLUMNS}, ts_rank_cd(search_vector, query) AS score
+                FROM learned_knowledge, to_tsquery('simple', $1) AS query
+                WHERE search_vector @@ query
+                  AND COALESCE(confidence, 0) >= $2
+                  AND ($3::text IS NULL OR source = $3)
+                ORDER BY score DESC, id DESC
+                LIMIT $4 OFFSET $5
+            """, " & ".join(f"'{term}'" for term in terms), min_confidence, source, limit, offset)
+            return [dict(row) for row in rows]
+
+def create_backend(url: str) -> DatabaseBackend:
+    """URL'ye göre arka ucu seç: sqlite:///yol, postgresql://... ya da düz dosya yolu"""
+    if "://" not in url:
+        return SQLiteBackend(url)
+
+    scheme = urlsplit(url).scheme.split("+")[0]
+    if scheme == "sqlite":
+        # sqlite:///data/teddy.db -> data/teddy.db, sqlite:////tmp/a.db -> /tmp/a.db
+        return SQLiteBackend(url.split("://", 1)[1][1:])
+    if scheme in ("postgres", "postgresql"):
+        # SQLAlchemy tarzı sürücü eki (postgresql+asyncpg) asyncpg'de geçersizdir
+        return PostgresBackend("postgresql://" + url.split("://", 1)[1])
+    raise ValueError(f"Desteklenmeyen veritabanı adresi: {scheme}")
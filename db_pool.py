@@ -0,0 +1,102 @@
+import aiosqlite
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class ConnectionPool:
+    """Uzun ömürlü SQLite bağlantı havuzu (tek yazıcı, çoklu okuyucu)"""
+    def __init__(self, db_path: str, reader_count: Optional[int] = None):
+        self.db_path = db_path
+        self.reader_count = max(1, reader_count or Config.DB_READER_POOL_SIZE)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock = asyncio.Lock()
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._closed = True
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        """Ayarlanmış yeni bir bağlantı aç"""
+        conn = await aiosqlite.connect(
+            self.db_path,
+            cached_statements=Config.DB_STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute(f"PRAGMA synchronous={Config.DB_SYNCHRONOUS}")
+        await conn.execute(f"PRAGMA mmap_size={Config.DB_MMAP_SIZE}")
+        # Negatif değer sayfa sayısı yerine KiB cinsinden boyut anlamına gelir
+        await conn.execute(f"PRAGMA cache_size=-{Config.DB_CACHE_SIZE_KB}")
+        await conn.execute(f"PRAGMA busy_timeout={Config.DB_BUSY_TIMEOUT_MS}")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        await conn.execute("PRAGMA foreign_keys=ON")
+        if read_only:
+            await conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    async def open(self) -> None:
+        """Yazıcı ve okuyucu bağlantılarını aç"""
+        if not self._closed:
+            return
+
+        # WAL modu veritabanı dosyasına kalıcı yazılır, önce yazıcıyı açıyoruz
+        self._writer = await self._connect()
+        self._idle_readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            conn = await self._connect(read_only=True)
+            self._readers.append(conn)
+            self._idle_readers.put_nowait(conn)
+
+        self._closed = False
+        logger.info(f"Veritabanı havuzu açıldı: {self.db_path} ({self.reader_count} okuyucu)")
+
+    async def close(self) -> None:
+        """Tüm bağlantıları kapat"""
+        if self._closed:
+            return
+        self._closed = True
+
+        async with self._writer_lock:
+            for conn in self._readers:
+                await conn.close()
+            self._readers.clear()
+            self._idle_readers = None
+
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+
+        logger.info("Veritabanı havuzu kapatıldı")
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Yazıcı bağlantısını özel olarak kullan; hata olursa işlemi geri al"""
+        if self._closed:
+            raise RuntimeError("Veritabanı havuzu açık değil")
+
+        async with self._writer_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Boştaki bir okuyucu bağlantısını ödünç al"""
+        if self._closed:
+            raise RuntimeError("Veritabanı havuzu açık değil")
+
+        conn = await self._idle_readers.get()
+        try:
+            yield conn
+        finally:
+            if self._idle_readers is not None:
+                self._idle_readers.put_nowait(conn)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+from config import Config
+from metrics import ERRORS, QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+class ExecutorBusyError(RuntimeError):
+    """Bekleyen iş sayısı sınırı aşıldı"""
+
+class BlockingExecutor:
+    """Engelleyici işleri (STT, video çözme) olay döngüsü dışında çalıştıran sınırlı havuz"""
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 per_client_limit: Optional[int] = None):
+        self.max_workers = max_workers or Config.BLOCKING_WORKERS
+        self.max_queue = max_queue or Config.BLOCKING_QUEUE_SIZE
+        self.per_client_limit = per_client_limit or Config.BLOCKING_PER_CLIENT
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        # client_id -> [semafor, kullanan iş sayısı]
+        self._client_slots: Dict[str, List[Any]] = {}
+        self.stats = {"rejected": 0}
+
+    @property
+    def pending(self) -> int:
+        """Çalışan ve sırada bekleyen iş sayısı"""
+        return self._pending
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="teddy-blocking"
+            )
+        return self._executor
+
+    def _acquire_slot(self, client_id: str) -> asyncio.Semaphore:
+        slot = self._client_slots.get(client_id)
+        if slot is None:
+            slot = self._client_slots[client_id] = [asyncio.Semaphore(self.per_client_limit), 0]
+        slot[1] += 1
+        return slot[0]
+
+    def _release_slot(self, client_id: str) -> None:
+        slot = self._client_slots[client_id]
+        slot[1] -= 1
+        if slot[1] == 0:
+            del self._client_slots[client_id]
+
+    async def run(self, func: Callable, *args: Any, client_id: Optional[str] = None) -> Any:
+        """func(*args) çağrısını havuzda çalıştır; kuyruk doluysa ExecutorBusyError fırlat"""
+        if self._pending >= self.max_queue:
+            self.stats["rejected"] += 1
+            ERRORS.labels("executor_busy").inc()
+            raise ExecutorBusyError("İşlem kuyruğu dolu")
+
+        loop = asyncio.get_running_loop()
+        call = partial(func, *args)
+        self._pending += 1
+        QUEUE_DEPTH.labels("blocking").inc()
+        try:
+            if client_id is None:
+                return await loop.run_in_executor(self._get_executor(), call)
+
+            semaphore = self._acquire_slot(client_id)
+            try:
+                async with semaphore:
+                    return await loop.run_in_executor(self._get_executor(), call)
+            finally:
+                self._release_slot(client_id)
+        finally:
+            self._pending -= 1
+            QUEUE_DEPTH.labels("blocking").dec()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """İş parçacıklarını kapat"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Optional
+import cv2
+import numpy as np
+from fastapi.staticfiles import StaticFiles
+from starlette.responses import Response
+from starlette.types import Scope
+from config import Config
+from executor import BlockingExecutor
+
+logger = logging.getLogger(__name__)
+
+# Bu süreden eski .tmp dosyaları yarıda kalmış yazım sayılır
+STALE_TMP_SECONDS = 300
+
+class ImmutableStaticFiles(StaticFiles):
+    """İçerik adresli dosyaları tarayıcının süresiz önbelleklemesi için sunar"""
+    def file_response(self, full_path: os.PathLike, stat_result: os.stat_result,
+                      scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+class FrameStore:
+    """Video karelerini içerik özetiyle adlandırıp saklayan, boyut ve yaşa göre temizlenen depo"""
+    def __init__(self, directory: Optional[str] = None, executor: Optional[BlockingExecutor] = None,
+                 max_bytes: Optional[int] = None, max_age: Optional[float] = None):
+        self.directory = directory or Config.FRAME_STORE_DIR
+        self.executor = executor or BlockingExecutor()
+        self.max_bytes = max_bytes if max_bytes is not None else Config.FRAME_STORE_MAX_BYTES
+        self.max_age = max_age if max_age is not None else Config.FRAME_STORE_MAX_AGE_DAYS * 86400
+        self._sweep_lock = threading.Lock()
+        # Kayıtlar yürütücü iş parçacıklarında yapılır; sayaçlar bu kilitle korunur
+        self._stats_lock = threading.Lock()
+        self._saves_since_sweep = 0
+        self.stats = {"saved": 0, "deduplicated": 0, "evicted": 0}
+
+    @staticmethod
+    def frame_digest(frame: np.ndarray) -> str:
+        """Kare piksellerinden içerik özeti üret"""
+        digest = hashlib.sha256(str(frame.shape).encode())
+        digest.update(np.ascontiguousarray(frame).data)
+        return digest.hexdigest()[:32]
+
+    async def save(self, frame: np.ndarray, client_id: Optional[str] = None) -> str:
+        """Kareyi olay döngüsü dışında kaydet ve static altındaki göreli yolunu döndür"""
+        return await self.executor.run(self._save_sync, frame, client_id=client_id)
+
+    def _save_sync(self, frame: np.ndarray) -> str:
+        name = f"{self.frame_digest(frame)}.jpg"
+        path = os.path.join(self.directory, name)
+        relative_path = f"frames/{name}"
+
+        try:
+            # Aynı kare zaten var; yaşını tazeleyip kodlamayı atla
+            os.utime(path)
+            with self._stats_lock:
+                self.stats["deduplicated"] += 1
+            return relative_path
+        except FileNotFoundError:
+            # Hiç yazılmamış ya da temizlik arada silmiş; kare (yeniden) yazılır
+            pass
+
+        ok, encoded = cv2.imencode(".jpg", frame)
+        if not ok:
+            raise ValueError("Kare JPEG olarak kodlanamadı")
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(encoded.tobytes())
+            os.replace(tmp_path, path)
+        finally:
+            # Yazım yarıda kaldıysa geçici dosya bırakılmaz
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+
+        with self._stats_lock:
+            self.stats["saved"] += 1
+            self._saves_since_sweep += 1
+            sweep_due = self._saves_since_sweep >= Config.FRAME_STORE_SWEEP_EVERY
+        if sweep_due:
+            self.sweep()
+        return relative_path
+
+    def sweep(self) -> None:
+        """Süresi dolan kareleri sil, toplam boyut sınırı aşılırsa en eskilerden başla"""
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            with self._stats_lock:
+                self._saves_since_sweep = 0
+            if not os.path.isdir(self.directory):
+                return
+
+            now = time.time()
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".tmp"):
+                    # Süreç çöktüğünde kalan geçici dosyalar; süren yazımlara dokunulmaz
+                    if now - entry.stat().st_mtime > STALE_TMP_SECONDS:
+                        self._remove(entry.path, evicted=False)
+                    continue
+                if not entry.name.endswith(".jpg"):
+                    continue
+                stat = entry.stat()
+                if now - stat.st_mtime > self.max_age:
+                    self._remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+                total += stat.st_size
+
+            for _, path, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+        finally:
+            self._sweep_lock.release()
+
+    def _remove(self, path: str, evicted: bool = True) -> None:
+        try:
+            os.unlink(path)
+            if evicted:
+                with self._stats_lock:
+                    self.stats["evicted"] += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Kare silinemedi ({path}): {str(e)}")
@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import json
+import logging
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from cache import SimpleCache
+from cache_backends import CacheBackend
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+HistoryLoader = Callable[[str, int, Optional[int]], Awaitable[List[Dict]]]
+
+class SessionHistory:
+    """Bir oturumun en yeni kayıtlarını yeniden eskiye tutan halka tampon"""
+    __slots__ = ("rows", "complete")
+
+    def __init__(self, rows: Iterable[Dict], capacity: int, complete: bool):
+        self.rows = deque(rows, maxlen=capacity)
+        # complete: oturumun tüm kayıtları tamponda (daha eskisi yok)
+        self.complete = complete
+
+    def page(self, limit: int, before: Optional[int] = None) -> Optional[List[Dict]]:
+        """Sayfa tampondan karşılanabiliyorsa döndür, yoksa None"""
+        rows = self.rows if before is None else (row for row in self.rows if row["id"] < before)
+        page = list(itertools.islice(rows, limit))
+        if len(page) == limit or self.complete:
+            return page
+        return None
+
+    def add(self, row: Dict) -> None:
+        """Yeni yazılan kaydı ekle; tampon doluysa en eski kayıt düşer"""
+        rows = self.rows
+        if rows and row["id"] <= rows[0]["id"]:
+            if any(existing["id"] == row["id"] for existing in rows):
+                return
+            # Doğrudan kayıt ile toplu yazma arasında sıra dışı gelen kayıt yerine yerleştirilir
+            ordered = sorted([*rows, row], key=lambda existing: existing["id"], reverse=True)
+            if len(ordered) > rows.maxlen:
+                self.complete = False
+            self.rows = deque(ordered[:rows.maxlen], maxlen=rows.maxlen)
+            return
+        if len(rows) == rows.maxlen:
+            self.complete = False
+        rows.appendleft(row)
+
+class HistoryCache:
+    """Son konuşmalar için oturum başına okuma önbelleği; yazılan kayıtlar tampona eklenir
+
+    Tampon yalnızca bu sürecin yazmalarını görür. Birden çok işçi yazıyorsa
+    attach() ile paylaşılan cache'in pub/sub kanalına bağlanılır; bir işçinin
+    yazdığı oturumlar diğer işçilerin tamponundan düşülür. Kanal yoksa
+    enabled=False ile önbellek kapatılmalıdır.
+    """
+    CHANNEL = "teddy:history:invalidate"
+
+    def __init__(self, capacity: Optional[int] = None, cache: Optional[SimpleCache] = None):
+        self.capacity = max(1, capacity or Config.HISTORY_CACHE_ROWS)
+        self.cache = cache or SimpleCache(max_entries=Config.HISTORY_CACHE_SESSIONS, name="history")
+        self.enabled = True
+        # Yükleme sürerken gelen yazmalar eski sonucun önbelleğe girmesini engeller
+        self._generation = 0
+        self._origin = uuid.uuid4().hex
+        self._backend: Optional[CacheBackend] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._publishes: Set[asyncio.Task] = set()
+
+    async def get(self, session_id: str, limit: int, before: Optional[int],
+                  loader: HistoryLoader) -> List[Dict]:
+        """Sayfayı tampondan ver; karşılanamazsa loader ile oku (ilk sayfa tamponu doldurur)"""
+        if not self.enabled:
+            return await loader(session_id, limit, before)
+
+        entry: Optional[SessionHistory] = self.cache.get(session_id)
+        if entry is not None:
+            page = entry.page(limit, before)
+            if page is not None:
+                return page
+
+        if before is not None:
+            # Tamponun gerisindeki sayfalar önbelleğe alınmaz
+            return await loader(session_id, limit, before)
+
+        generation = self._generation
+        fetch = max(self.capacity, limit)
+        rows = await loader(session_id, fetch, None)
+        if generation == self._generation:
+            complete = len(rows) < fetch and len(rows) <= self.capacity
+            self.cache.set(
+                session_id,
+                SessionHistory(rows[:self.capacity], self.capacity, complete),
+                ttl=Config.HISTORY_CACHE_TTL
+            )
+        return rows[:limit]
+
+    def add(self, rows: Iterable[Dict]) -> None:
+        """Veritabanına yazılan kayıtları (id'leriyle) önbellekteki oturumlara ekle"""
+        self._generation += 1
+        session_ids = set()
+        for row in rows:
+            session_ids.add(row["session_id"])
+            entry: Optional[SessionHistory] = self.cache.peek(row["session_id"])
+            if entry is not None:
+                entry.add(row)
+        self._publish(session_ids)
+
+    def invalidate(self, session_ids: Iterable[str]) -> None:
+        """Oturumları önbellekten düşür (kayıtların id'si bilinmediğinde)"""
+        session_ids = set(session_ids)
+        self._drop(session_ids)
+        self._publish(session_ids)
+
+    def clear(self) -> None:
+        """Tüm oturumları düşür (ör. toplu güncellemeden sonra)"""
+        self._drop(None)
+        self._publish(None)
+
+    def _drop(self, session_ids: Optional[Iterable[str]]) -> None:
+        self._generation += 1
+        if session_ids is None:
+            self.cache.clear()
+            return
+        for session_id in session_ids:
+            self.cache.delete(session_id)
+
+    async def attach(self, backend: CacheBackend) -> None:
+        """Geçersiz kılmaları diğer işçilere yay ve onlarınkini dinle (arka uç kapatılmaz, paylaşılır)"""
+        await self.detach()
+        self._backend = backend
+        self._listener = asyncio.create_task(self._listen())
+        # Dinleyicinin kanala abone olmasına fırsat ver
+        await asyncio.sleep(0)
+
+    async def detach(self) -> None:
+        """Kanal dinleyicisini durdur"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._publishes:
+            await asyncio.gather(*self._publishes, return_exceptions=True)
+        self._backend = None
+
+    def _publish(self, session_ids: Optional[Set[str]]) -> None:
+        if self._backend is None or not self.enabled or session_ids == set():
+            return
+        message = json.dumps({
+            "origin": self._origin,
+            "sessions": None if session_ids is None else sorted(session_ids)
+        }).encode()
+        task = asyncio.create_task(self._send(message))
+        self._publishes.add(task)
+        task.add_done_callback(self._publishes.discard)
+
+    async def _send(self, message: bytes) -> None:
+        try:
+            await self._backend.publish(self.CHANNEL, message)
+        except Exception as e:
+            logger.error(f"Geçmiş geçersiz kılma yayını hatası: {str(e)}")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for message in self._backend.subscribe(self.CHANNEL):
+                    data = json.loads(message)
+                    if data["origin"] != self._origin:
+                        self._drop(data["sessions"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Geçmiş geçersiz kılma dinleyicisi hatası: {str(e)}")
+                # Bağlantı koptuysa kaçırılan yazmalar olabilir
+                self._drop(None)
+                await asyncio.sleep(1)
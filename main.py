@@ -1,13 +1,18 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 import json
 import logging
 import uuid
-from typing import Dict
-from models import Database
+from typing import Optional
+from models import Database, history_entry
+from blob_store import blob_response
 from agent import Agent
+from connections import Connection, ConnectionManager
+from frame_store import ImmutableStaticFiles
+from metrics import mark_process_dead, metrics_response
+from config import Config
 import asyncio
 import os
 
@@ -19,6 +24,7 @@ logger = logging.getLogger(__name__)
 app = FastAPI()
 
 # Statik dosyalar ve şablonlar
+app.mount("/static/frames", ImmutableStaticFiles(directory=Config.FRAME_STORE_DIR, check_dir=False), name="frames")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
@@ -26,8 +32,8 @@ templates = Jinja2Templates(directory="templates")
 db = Database()
 agent = Agent()
 
-# WebSocket bağlantıları
-active_connections: Dict[str, WebSocket] = {}
+# WebSocket bağlantıları (client_id başına tek bağlantı, sınırlı gönderim kuyruğu)
+connections = ConnectionManager()
 
 @app.on_event("startup")
 async def startup_event():
@@ -36,13 +42,22 @@ async def startup_event():
     if not os.path.exists('data'):
         os.makedirs('data')
     await db.initialize()
+    connections.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Uygulama kapanırken veritabanı bağlantılarını kapat"""
+    await connections.stop()
+    await db.close()
+    mark_process_dead()
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     """WebSocket bağlantı noktası"""
+    connection: Optional[Connection] = None
     try:
-        await websocket.accept()
-        active_connections[client_id] = websocket
+        # Aynı client_id ile açık eski bağlantı varsa kapatılır
+        connection = await connections.connect(client_id, websocket)
         
         # Kullanıcı profilini güncelle
         await db.update_user_profile(
@@ -53,8 +68,17 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
         while True:
             try:
                 # Mesajı al
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                message = await connection.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("text") is None:
+                    continue
+                message_data = json.loads(message["text"])
+                
+                # {"type": "hello", "heartbeat": true} ile istemci ping/pong nabzına katılır
+                if message_data.get("type") == "hello":
+                    connection.heartbeat = bool(message_data.get("heartbeat"))
+                    continue
                 
                 # Mesaj türüne göre işle
                 if message_data.get("type") == "text":
@@ -63,16 +87,16 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     response = await agent.get_response(user_message)
                     
                     # Konuşmayı kaydet
-                    await db.save_conversation(
+                    await db.queue_conversation(
                         client_id,
                         user_message,
                         response["text"],
-                        audio_path=response.get("audio"),
+                        audio=response.get("audio"),
                         video_path=response.get("video")
                     )
                     
                     # Yanıtı gönder
-                    await websocket.send_json({
+                    await connection.send_json({
                         "type": "response",
                         "text": response["text"],
                         "audio": response.get("audio"),
@@ -85,16 +109,16 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     response = await agent.process_audio(audio_data)
                     
                     # Konuşmayı kaydet
-                    await db.save_conversation(
+                    await db.queue_conversation(
                         client_id,
                         response["transcription"],
                         response["text"],
-                        audio_path=response.get("audio"),
+                        audio=response.get("audio"),
                         video_path=response.get("video")
                     )
                     
                     # Yanıtı gönder
-                    await websocket.send_json({
+                    await connection.send_json({
                         "type": "response",
                         "text": response["text"],
                         "audio": response.get("audio"),
@@ -108,16 +132,16 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     response = await agent.process_video(video_data)
                     
                     # Konuşmayı kaydet
-                    await db.save_conversation(
+                    await db.queue_conversation(
                         client_id,
                         response["transcription"],
                         response["text"],
-                        audio_path=response.get("audio"),
+                        audio=response.get("audio"),
                         video_path=response.get("video")
                     )
                     
                     # Yanıtı gönder
-                    await websocket.send_json({
+                    await connection.send_json({
                         "type": "response",
                         "text": response["text"],
                         "audio": response.get("audio"),
@@ -129,19 +153,15 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                 break
             except Exception as e:
                 logger.error(f"Error processing message: {str(e)}")
-                await websocket.send_json({
+                await connection.send_json({
                     "type": "error",
                     "message": "İşlem sırasında bir hata oluştu."
                 })
     
     finally:
-        # Bağlantıyı kapat
-        if client_id in active_connections:
-            del active_connections[client_id]
-        try:
-            await websocket.close()
-        except:
-            pass
+        # Bağlantıyı kapat; yerine yeni bağlantı geldiyse kayıt korunur
+        if connection is not None:
+            await connections.disconnect(connection)
 
 @app.get("/", response_class=HTMLResponse)
 async def get_home():
@@ -152,10 +172,27 @@ async def get_home():
     )
 
 @app.get("/history/{client_id}")
-async def get_history(client_id: str):
-    """Konuşma geçmişini getir"""
-    history = await db.get_conversation_history(client_id)
-    return {"history": history}
+async def get_history(
+    client_id: str,
+    before: Optional[int] = Query(None, ge=1),
+    limit: int = Query(Config.HISTORY_PAGE_SIZE, ge=1, le=Config.HISTORY_MAX_PAGE_SIZE)
+):
+    """Konuşma geçmişini sayfa sayfa getir (before: önceki sayfanın imleci)"""
+    history = await db.get_conversation_history(client_id, limit=limit, before=before)
+    next_before = history[-1]["id"] if len(history) == limit else None
+    # Ses gövdesi yerine web.py ile aynı biçimde /blobs referansı döner
+    return {"history": [history_entry(row) for row in history], "next_before": next_before}
+
+@app.get("/blobs/{digest}")
+async def get_blob(digest: str, request: Request):
+    """Konuşma sesini getir; Range başlığıyla kısmi içerik (206) desteklenir"""
+    return await blob_response(db.blobs, digest, request)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrikleri"""
+    body, content_type = metrics_response()
+    return Response(content=body, media_type=content_type)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,39 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+from config import Config
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Kısmi yazmaları da tamamlayarak tüm veriyi dosya tanımlayıcısına yaz"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+@contextmanager
+def media_path(data: bytes, suffix: str = "") -> Iterator[str]:
+    """Dosya yolu isteyen kütüphaneler için medya verisine geçici bir yol aç
+
+    Eşik altındaki veriler anonim bellek dosyasında (memfd) tutulur ve diske
+    hiç yazılmaz; eşiği aşan veriler ya da memfd olmayan sistemler için geçici
+    dosya kullanılır. Her iki durumda da çıkışta kaynak mutlaka temizlenir.
+    """
+    if len(data) <= Config.MEDIA_SPOOL_THRESHOLD_BYTES and hasattr(os, "memfd_create"):
+        fd = os.memfd_create("teddy-media", os.MFD_CLOEXEC)
+        try:
+            _write_all(fd, data)
+            yield f"/proc/self/fd/{fd}"
+        finally:
+            os.close(fd)
+        return
+
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        try:
+            _write_all(fd, data)
+        finally:
+            os.close(fd)
+        yield path
+    finally:
+        os.unlink(path)
@@ -1,8 +1,23 @@
+import asyncio
+import base64
+import logging
 import os
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+import aiohttp
 from dotenv import load_dotenv
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from twilio.rest import Client
-from agent import AIAgent
+from agent import Agent
+from config import Config
+from metrics import ERRORS, QUEUE_DEPTH
+
+try:
+    from telegram.ext import Application, CommandHandler, MessageHandler, filters
+except ImportError:  # python-telegram-bot yalnızca bot çalıştırılırken gerekir
+    Application = None
+
+logger = logging.getLogger(__name__)
 
 # .env dosyasından API anahtarlarını yükle
 load_dotenv()
@@ -12,35 +27,331 @@ TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 YOUR_PHONE_NUMBER = os.getenv("YOUR_PHONE_NUMBER")
 
-# AI Ajanını başlat
-ai_agent = AIAgent()
+# Hedef başına hız sınırlayıcılar bu sayıyı aşınca boştakiler silinir
+MAX_IDLE_LIMITERS = 1024
+
+def split_message(text: str, max_length: int) -> List[str]:
+    """Metni sağlayıcının mesaj sınırına göre sıralı parçalara böl"""
+    if not text:
+        return []
+    return [text[i:i + max_length] for i in range(0, len(text), max_length)]
+
+class DeliveryError(Exception):
+    """Sağlayıcı mesajı kabul etmedi; retryable ise tekrar denenebilir"""
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+def check_status(status: int, detail: str, retry_after: Optional[float] = None) -> None:
+    """HTTP durum koduna göre DeliveryError fırlat (429 ve 5xx tekrar denenir)"""
+    if status == 429:
+        raise DeliveryError(f"Hız sınırı aşıldı: {detail}", retry_after=retry_after)
+    if status >= 500:
+        raise DeliveryError(f"Sağlayıcı hatası ({status}): {detail}")
+    if status >= 400:
+        raise DeliveryError(f"Mesaj reddedildi ({status}): {detail}", retryable=False)
+
+class TokenBucket:
+    """Saniyede rate jeton üreten, en fazla burst jeton biriktiren hız sınırlayıcı"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Bir jeton için beklenmesi gereken süre (0 ise hemen gönderilebilir)"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    @property
+    def idle(self) -> bool:
+        """Kova dolu; silinse de hız sınırı değişmez"""
+        self._refill()
+        return self.tokens >= self.burst
+
+class TelegramTransport:
+    """Telegram Bot API sendMessage çağrısı"""
+    channel = "telegram"
+    max_length = 4096
+
+    def __init__(self, token: str, base_url: Optional[str] = None,
+                 rate: Optional[float] = None, global_rate: Optional[float] = None):
+        self.token = token
+        self.base_url = (base_url or Config.TELEGRAM_API_URL).rstrip("/")
+        self.rate = rate or Config.TELEGRAM_RATE_PER_CHAT
+        self.global_rate = global_rate or Config.TELEGRAM_RATE_GLOBAL
+
+    async def send(self, session: aiohttp.ClientSession, destination: str, text: str) -> None:
+        async with session.post(f"{self.base_url}/bot{self.token}/sendMessage",
+                                json={"chat_id": destination, "text": text}) as response:
+            if response.status == 200:
+                return
+            body = await response.json(content_type=None)
+            retry_after = ((body or {}).get("parameters") or {}).get("retry_after")
+            check_status(response.status, (body or {}).get("description", ""), retry_after)
+
+class WhatsAppTransport:
+    """Twilio Messages API üzerinden WhatsApp mesajı"""
+    channel = "whatsapp"
+    max_length = 1600
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str,
+                 base_url: Optional[str] = None, rate: Optional[float] = None,
+                 global_rate: Optional[float] = None):
+        self.account_sid = account_sid
+        credentials = base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {credentials}"}
+        self.from_number = from_number
+        self.base_url = (base_url or Config.TWILIO_API_URL).rstrip("/")
+        self.rate = rate or Config.WHATSAPP_RATE_PER_DESTINATION
+        self.global_rate = global_rate or Config.WHATSAPP_RATE_GLOBAL
+
+    async def send(self, session: aiohttp.ClientSession, destination: str, text: str) -> None:
+        url = f"{self.base_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+        data = {
+            "From": f"whatsapp:{self.from_number}",
+            "To": f"whatsapp:{destination}",
+            "Body": text
+        }
+        async with session.post(url, data=data, headers=self.headers) as response:
+            if response.status in (200, 201):
+                return
+            retry_after = response.headers.get("Retry-After")
+            check_status(
+                response.status,
+                await response.text(),
+                float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+
+class Delivery:
+    __slots__ = ("channel", "destination", "text", "attempts")
+
+    def __init__(self, channel: str, destination: str, text: str):
+        self.channel = channel
+        self.destination = destination
+        self.text = text
+        self.attempts = 0
+
+class OutboundDispatcher:
+    """Giden mesajları sınırlı kuyruktan işçi görevlerle gönderir; hedef başına sıra ve hız sınırı korunur"""
+    def __init__(self, transports: Iterable, workers: Optional[int] = None,
+                 max_queue: Optional[int] = None, max_retries: Optional[int] = None,
+                 retry_base: Optional[float] = None, session: Optional[aiohttp.ClientSession] = None):
+        self.transports = {transport.channel: transport for transport in transports}
+        self.workers = max(1, workers or Config.OUTBOUND_WORKERS)
+        self.max_queue = max_queue or Config.OUTBOUND_QUEUE_SIZE
+        self.max_retries = Config.OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_base = retry_base or Config.OUTBOUND_RETRY_BASE_SECONDS
+        self._session = session
+        self._owns_session = session is None
+        self._slots = asyncio.Semaphore(self.max_queue)
+        self._admission = asyncio.Lock()
+        # Her hedefin (kanal, alıcı) kendi sırası vardır; bir hedef aynı anda tek işçide bulunur
+        self._lanes: Dict[Tuple[str, str], Deque[Delivery]] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._limiters: Dict[Tuple[str, str], TokenBucket] = {}
+        self._channel_limiters = {
+            channel: TokenBucket(transport.global_rate, transport.global_rate)
+            for channel, transport in self.transports.items()
+        }
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0, "rate_limited": 0}
+
+    @property
+    def pending(self) -> int:
+        """Gönderilmeyi bekleyen mesaj parçası sayısı"""
+        return sum(len(lane) for lane in self._lanes.values())
+
+    async def start(self) -> None:
+        """HTTP oturumunu ve işçi görevlerini başlat"""
+        if self._tasks:
+            return
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=Config.OUTBOUND_TIMEOUT)
+            )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Bekleyen mesajları göndermeyi dene, sonra işçileri ve oturumu kapat"""
+        timeout = Config.OUTBOUND_DRAIN_TIMEOUT if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.pending} giden mesaj gönderilemeden kapatılıyor")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def drain(self) -> None:
+        """Kuyruktaki tüm mesajlar gönderilene (ya da vazgeçilene) kadar bekle"""
+        while self._lanes:
+            await self._idle.wait()
+
+    async def send(self, channel: str, destination, text: str) -> int:
+        """Metni kanalın sınırına göre bölüp kuyruğa ekle; kuyruk doluysa yer açılana kadar bekler"""
+        transport = self.transports.get(channel)
+        if transport is None:
+            raise ValueError(f"Bilinmeyen kanal: {channel}")
+        chunks = split_message(text, transport.max_length)
+        if len(chunks) > self.max_queue:
+            raise ValueError("Mesaj giden kuyruğa sığmayacak kadar uzun")
+
+        # Parçalar birlikte kabul edilir; aynı hedefe eşzamanlı mesajlar birbirine karışmaz
+        async with self._admission:
+            for _ in chunks:
+                await self._slots.acquire()
+            for chunk in chunks:
+                self._enqueue(Delivery(channel, str(destination), chunk))
+        return len(chunks)
+
+    def _enqueue(self, delivery: Delivery) -> None:
+        key = (delivery.channel, delivery.destination)
+        lane = self._lanes.get(key)
+        if lane is None:
+            self._lanes[key] = deque([delivery])
+            self._idle.clear()
+            self._ready.put_nowait(key)
+        else:
+            lane.append(delivery)
+        self.stats["queued"] += 1
+        QUEUE_DEPTH.labels("outbound").inc()
+
+    def _rate_delay(self, key: Tuple[str, str]) -> float:
+        """Hedef ve kanal sınırları izin veriyorsa jetonu harca ve 0 döndür, yoksa bekleme süresini"""
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            if len(self._limiters) >= MAX_IDLE_LIMITERS:
+                for idle_key in [k for k, bucket in self._limiters.items()
+                                 if k not in self._lanes and bucket.idle]:
+                    del self._limiters[idle_key]
+            limiter = self._limiters[key] = TokenBucket(self.transports[key[0]].rate)
+        channel_limiter = self._channel_limiters[key[0]]
+        delay = max(limiter.delay(), channel_limiter.delay())
+        if delay == 0:
+            limiter.consume()
+            channel_limiter.consume()
+        return delay
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Tam jitter: aynı anda hata alan gönderimler aynı anda tekrar denemez
+        ceiling = min(Config.OUTBOUND_RETRY_MAX_SECONDS, self.retry_base * 2 ** (attempt - 1))
+        return max(random.uniform(0, ceiling), retry_after or 0.0)
+
+    def _requeue_later(self, key: Tuple[str, str], delay: float) -> None:
+        """Hedefi bekleme süresi sonunda yeniden hazır kuyruğuna koy; işçi bu sırada başka hedeflere bakar"""
+        asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, key)
+
+    def _complete(self, key: Tuple[str, str]) -> None:
+        lane = self._lanes[key]
+        lane.popleft()
+        self._slots.release()
+        QUEUE_DEPTH.labels("outbound").dec()
+        if lane:
+            # Diğer hedefler de sıra alsın diye hedef kuyruğun sonuna gider
+            self._ready.put_nowait(key)
+        else:
+            del self._lanes[key]
+            if not self._lanes:
+                self._idle.set()
+
+    async def _deliver(self, key: Tuple[str, str]) -> None:
+        lane = self._lanes[key]
+        delivery = lane[0]
+
+        delay = self._rate_delay(key)
+        if delay > 0:
+            self.stats["rate_limited"] += 1
+            self._requeue_later(key, delay)
+            return
+
+        try:
+            await self.transports[delivery.channel].send(self._session, delivery.destination, delivery.text)
+            self.stats["sent"] += 1
+        except Exception as e:
+            delivery.attempts += 1
+            retryable = isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)) or \
+                (isinstance(e, DeliveryError) and e.retryable)
+            if retryable and delivery.attempts <= self.max_retries:
+                self.stats["retried"] += 1
+                retry_after = e.retry_after if isinstance(e, DeliveryError) else None
+                self._requeue_later(key, self._backoff(delivery.attempts, retry_after))
+                return
+            ERRORS.labels("outbound").inc()
+            self.stats["failed"] += 1
+            logger.error(
+                f"{delivery.channel} mesajı gönderilemedi ({delivery.destination}, "
+                f"{delivery.attempts} deneme): {str(e)}"
+            )
+        self._complete(key)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            try:
+                await self._deliver(key)
+            except Exception as e:
+                logger.error(f"Giden mesaj işçisi hatası: {str(e)}")
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "pending": self.pending, "destinations": len(self._lanes)}
 
 class MessagingBot:
     def __init__(self):
-        # Telegram uygulamasını başlat
-        self.telegram_app = Application.builder().token(TELEGRAM_TOKEN).build()
-        
-        # Twilio istemcisini başlat
-        self.twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        
+        if Application is None:
+            raise RuntimeError("python-telegram-bot kurulu değil")
+
+        self.agent = Agent()
+
+        # Telegram ve WhatsApp yanıtları aynı dağıtıcıdan, paralel ve bloklamadan gönderilir
+        transports = [TelegramTransport(TELEGRAM_TOKEN)]
+        if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and YOUR_PHONE_NUMBER:
+            transports.append(WhatsAppTransport(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER))
+        self.dispatcher = OutboundDispatcher(transports)
+
+        # Telegram uygulamasını başlat; dağıtıcı botun olay döngüsünde çalışır
+        self.telegram_app = (
+            Application.builder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .build()
+        )
+
         # Telegram komut işleyicilerini ekle
         self.telegram_app.add_handler(CommandHandler("start", self.telegram_start))
         self.telegram_app.add_handler(CommandHandler("help", self.telegram_help))
         self.telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.telegram_message))
 
-    def send_whatsapp_message(self, message):
-        """WhatsApp üzerinden mesaj gönder"""
-        try:
-            # WhatsApp mesajını gönder
-            self.twilio_client.messages.create(
-                from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
-                body=message,
-                to=f"whatsapp:{YOUR_PHONE_NUMBER}"
-            )
-            return True
-        except Exception as e:
-            print(f"WhatsApp mesajı gönderilemedi: {str(e)}")
-            return False
+    async def _post_init(self, application) -> None:
+        await self.dispatcher.start()
+
+    async def _post_shutdown(self, application) -> None:
+        await self.dispatcher.stop()
+
+    async def send_reply(self, chat_id, text: str) -> None:
+        """Yanıtı Telegram sohbetine ve (ayarlıysa) WhatsApp'a kuyrukla"""
+        await self.dispatcher.send("telegram", chat_id, text)
+        if "whatsapp" in self.dispatcher.transports:
+            await self.dispatcher.send("whatsapp", YOUR_PHONE_NUMBER, text)
 
     async def telegram_start(self, update, context):
         """Telegram botunu başlatma komutu"""
@@ -76,24 +387,13 @@ Not: Kod bloklarını ``` işaretleri arasına alarak gönderebilirsiniz."""
         """Gelen mesajları işle"""
         try:
             user_message = update.message.text
-            response = ai_agent.get_response(user_message)
-            
-            # Uzun yanıtları böl (Telegram mesaj limiti: 4096 karakter)
-            if len(response) > 4000:
-                chunks = [response[i:i+4000] for i in range(0, len(response), 4000)]
-                for chunk in chunks:
-                    await update.message.reply_text(chunk)
-                    # WhatsApp'a da gönder
-                    self.send_whatsapp_message(chunk)
-            else:
-                await update.message.reply_text(response)
-                # WhatsApp'a da gönder
-                self.send_whatsapp_message(response)
-                
+            response = await self.agent.get_response(user_message, synthesize=False)
+            reply = response["text"]
         except Exception as e:
-            error_message = f"Hata oluştu: {str(e)}"
-            await update.message.reply_text(error_message)
-            self.send_whatsapp_message(error_message)
+            reply = f"Hata oluştu: {str(e)}"
+
+        # Uzun yanıtlar kanalın sınırına göre bölünür; işleyici ağ gidiş-dönüşünü beklemez
+        await self.send_reply(update.effective_chat.id, reply)
 
     def start(self):
         """Bot servislerini başlat"""
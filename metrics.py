@@ -0,0 +1,112 @@
+import os
+import shutil
+import time
+from functools import wraps
+from typing import Callable, Optional, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Çok süreçli uvicorn'da PROMETHEUS_MULTIPROC_DIR ayarlanmalı; her işçi
+# değerlerini bu dizine yazar ve /metrics hepsini birleştirir. Dizin işçiler
+# başlamadan reset_multiprocess_dir() ile boşaltılır, kapanan işçi
+# mark_process_dead() çağırır (docker-compose.yml'deki komuta bakın)
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    # Etiketsiz metrikler tanımlanırken değer dosyası hemen açılır
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+MESSAGE_LATENCY = Histogram(
+    "teddy_message_duration_seconds",
+    "WebSocket mesajının alınmasından yanıtın gönderilmesine kadar geçen süre",
+    ["type"],
+    buckets=LATENCY_BUCKETS
+)
+TTS_DURATION = Histogram(
+    "teddy_tts_duration_seconds",
+    "edge_tts ses sentezi süresi",
+    buckets=LATENCY_BUCKETS
+)
+STT_DURATION = Histogram(
+    "teddy_stt_duration_seconds",
+    "Ses tanıma süresi",
+    buckets=LATENCY_BUCKETS
+)
+VIDEO_DECODE_DURATION = Histogram(
+    "teddy_video_decode_duration_seconds",
+    "Video çözme süresi",
+    buckets=LATENCY_BUCKETS
+)
+DB_DURATION = Histogram(
+    "teddy_db_operation_duration_seconds",
+    "Veritabanı işlem süresi",
+    ["operation"],
+    buckets=LATENCY_BUCKETS
+)
+ACTIVE_CONNECTIONS = Gauge(
+    "teddy_active_connections",
+    "Açık WebSocket bağlantı sayısı",
+    multiprocess_mode="livesum"
+)
+QUEUE_DEPTH = Gauge(
+    "teddy_queue_depth",
+    "Bekleyen iş sayısı",
+    ["queue"],
+    multiprocess_mode="livesum"
+)
+CACHE_REQUESTS = Counter(
+    "teddy_cache_requests_total",
+    "Cache istekleri (isabet oranı: hit / (hit + miss))",
+    ["cache", "result"]
+)
+ERRORS = Counter(
+    "teddy_errors_total",
+    "Aşamaya göre hata sayısı",
+    ["stage"]
+)
+
+def observe_async(histogram) -> Callable:
+    """Coroutine süresini verilen histogram'a yazan decorator"""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def reset_multiprocess_dir() -> None:
+    """Önceki çalıştırmanın metrik dosyalarını sil; işçiler başlamadan ana süreçte bir kez çağrılır"""
+    if not MULTIPROC_DIR:
+        return
+    for entry in os.scandir(MULTIPROC_DIR):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+
+def mark_process_dead(pid: Optional[int] = None) -> None:
+    """Kapanan işçinin livesum göstergelerini (bağlantı, kuyruk derinliği) toplamdan çıkar"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid(), MULTIPROC_DIR)
+
+def metrics_response() -> Tuple[bytes, str]:
+    """Prometheus metin biçiminde metrikleri ve içerik tipini döndür"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,137 +1,211 @@
-import aiosqlite
-from datetime import datetime
-from typing import Optional, List, Dict
-import json
+import asyncio
+import base64
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Union
+from config import Config
+from archive import ConversationArchive
+from blob_store import BlobStore
+from history_cache import HistoryCache
+from db_backends import ConversationRow, DatabaseBackend, create_backend
+from write_behind import ConversationWriter, ProfileWriter
+from metrics import DB_DURATION, observe_async
+
+logger = logging.getLogger(__name__)
+
+def history_entry(row: Dict) -> Dict:
+    """Geçmiş kaydındaki sesi gövde yerine tembel yüklenecek bir referansla değiştir"""
+    entry = dict(row)
+    entry.pop("audio_path", None)
+    digest = entry.pop("audio_blob", None)
+    entry["audio"] = {"digest": digest, "url": f"/blobs/{digest}"} if digest else None
+    return entry
 
 class Database:
-    def __init__(self, db_path: str = "data/teddy.db"):
-        self.db_path = db_path
+    def __init__(self, db_path: Optional[str] = None, blob_dir: Optional[str] = None,
+                 archive_dir: Optional[str] = None):
+        """db_path bir SQLite dosya yolu ya da veritabanı URL'si olabilir; verilmezse DATABASE_URL kullanılır"""
+        self.db_path = db_path or Config.get_database_url()
+        self.backend: DatabaseBackend = create_backend(self.db_path)
+        self.history = HistoryCache()
+        self.writer = ConversationWriter(self.backend, on_write=self._on_conversations_written)
+        self.profiles = ProfileWriter(self.backend)
+        self.blobs = BlobStore(blob_dir)
+        self.archive = ConversationArchive(archive_dir)
+
+    @property
+    def pool(self):
+        """Arka ucun bağlantı havuzu (SQLite için ConnectionPool, Postgres için asyncpg.Pool)"""
+        return self.backend.pool
 
     async def initialize(self):
-        """Veritabanını oluştur"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Konuşma geçmişi tablosu
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    user_message TEXT NOT NULL,
-                    assistant_message TEXT NOT NULL,
-                    audio_path TEXT,
-                    video_path TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-
-            # Kullanıcı profili tablosu
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT UNIQUE NOT NULL,
-                    preferences TEXT,
-                    interaction_history TEXT,
-                    last_seen DATETIME
-                )
-            """)
-
-            # Öğrenilen bilgiler tablosu
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS learned_knowledge (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    topic TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    source TEXT,
-                    confidence FLOAT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-
-            await db.commit()
+        """Bağlantı havuzunu aç ve tabloları oluştur"""
+        await self.backend.open()
+        await self.backend.create_schema()
+        await self.writer.start()
+        await self.profiles.start()
+
+    async def close(self):
+        """Bekleyen kayıtları yaz ve bağlantı havuzunu kapat"""
+        await self.writer.stop()
+        await self.profiles.stop()
+        await self.backend.close()
 
+    async def store_audio(self, audio: Optional[Union[bytes, str]]) -> Optional[str]:
+        """Sesi blob deposuna yaz ve özetini döndür; str verilirse base64 kabul edilir"""
+        if not audio:
+            return None
+        if isinstance(audio, str):
+            audio = base64.b64decode(audio)
+        return await self.blobs.put(audio)
+
+    @observe_async(DB_DURATION.labels("save_conversation"))
     async def save_conversation(self, session_id: str, user_message: str, 
-                              assistant_message: str, audio_path: Optional[str] = None,
+                              assistant_message: str, audio: Optional[Union[bytes, str]] = None,
                               video_path: Optional[str] = None) -> int:
-        """Konuşmayı kaydet"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                INSERT INTO conversations 
-                (session_id, user_message, assistant_message, audio_path, video_path)
-                VALUES (?, ?, ?, ?, ?)
-            """, (session_id, user_message, assistant_message, audio_path, video_path))
-            await db.commit()
-            return cursor.lastrowid
-
-    async def get_conversation_history(self, session_id: str, limit: int = 50) -> List[Dict]:
-        """Konuşma geçmişini getir"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("""
-                SELECT * FROM conversations 
-                WHERE session_id = ? 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            """, (session_id, limit))
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        """Konuşmayı kaydet; ses satıra değil blob deposuna yazılır"""
+        audio_blob = await self.store_audio(audio)
+        row = await self.backend.insert_conversation(
+            (session_id, user_message, assistant_message, audio_blob, video_path)
+        )
+        self.history.add([row])
+        return row["id"]
+
+    async def queue_conversation(self, session_id: str, user_message: str,
+                                 assistant_message: str, audio: Optional[Union[bytes, str]] = None,
+                                 video_path: Optional[str] = None) -> None:
+        """Konuşmayı toplu yazma kuyruğuna ekle (commit beklenmez)"""
+        audio_blob = await self.store_audio(audio)
+        await self.writer.enqueue(
+            (session_id, user_message, assistant_message, audio_blob, video_path)
+        )
+
+    async def migrate_inline_audio(self, batch_size: Optional[int] = None) -> int:
+        """audio_path sütununda base64 tutulan eski sesleri blob deposuna taşı; taşınan satır sayısını döndür"""
+        batch_size = batch_size or Config.BLOB_MIGRATION_BATCH_SIZE
+        migrated = 0
+        last_id = 0
+        while True:
+            rows = await self.backend.get_inline_audio(batch_size, last_id)
+            if not rows:
+                return migrated
+            last_id = rows[-1][0]
+            updates = []
+            for row_id, audio in rows:
+                try:
+                    data = base64.b64decode(audio, validate=True)
+                except ValueError as e:
+                    # base64 olmayan eski değerler (ör. dosya yolu) olduğu gibi bırakılır
+                    logger.warning(f"Satır içi ses taşınamadı, satır değiştirilmedi (id={row_id}): {str(e)}")
+                    continue
+                updates.append((await self.store_audio(data), row_id))
+            if updates:
+                await self.backend.set_audio_blobs(updates)
+                # Önbellekteki kayıtlar eski ses alanlarını taşıyor olabilir
+                self.history.clear()
+                migrated += len(updates)
+
+    async def collect_blobs(self, grace: Optional[float] = None, limit: int = 1000) -> int:
+        """Referansı kalmamış blob'ları sil; bekleme süresinden yeni dosyalara dokunulmaz"""
+        grace = Config.BLOB_GC_GRACE_SECONDS if grace is None else grace
+        digests = await self.backend.unreferenced_blobs(limit)
+        deleted = []
+        for digest in digests:
+            if await asyncio.to_thread(self.blobs.delete_sync, digest, grace):
+                deleted.append(digest)
+        if deleted:
+            await self.backend.delete_blobs(deleted)
+        return len(deleted)
+
+    async def sweep_orphan_blobs(self, grace: Optional[float] = None, batch_size: int = 1000) -> int:
+        """blobs tablosunda kaydı olmayan dosyaları sil (ör. partisi yazılamayan kuyruk kayıtlarının sesleri)"""
+        grace = Config.BLOB_GC_GRACE_SECONDS if grace is None else grace
+        candidates = await asyncio.to_thread(lambda: list(self.blobs.scan_sync(grace)))
+        deleted = 0
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            known = await self.backend.existing_blobs(batch)
+            for digest in batch:
+                # Bekleme süresi tekrar kontrol edilir; bu arada yeniden yazılan blob silinmez
+                if digest not in known and await asyncio.to_thread(self.blobs.delete_sync, digest, grace):
+                    deleted += 1
+        return deleted
+
+    @observe_async(DB_DURATION.labels("get_conversation_history"))
+    async def get_conversation_history(self, session_id: str, limit: int = 50,
+                                       before: Optional[int] = None) -> List[Dict]:
+        """Konuşma geçmişini yeniden eskiye getir; before verilirse o id'den öncekiler"""
+        # Son kayıtlar önbellekteki nesnelerdir; çağıran değiştirmemelidir
+        return await self.history.get(session_id, limit, before, self._load_history)
+
+    def _on_conversations_written(self, batch: List[ConversationRow], inserted: Optional[List[Dict]]) -> None:
+        if inserted is None:
+            # COPY id döndürmez; etkilenen oturumlar önbellekten düşülür
+            self.history.invalidate({row[0] for row in batch})
+        else:
+            self.history.add(inserted)
+
+    async def _load_history(self, session_id: str, limit: int, before: Optional[int]) -> List[Dict]:
+        """Geçmişi sıcak tablodan, yetmezse arşivden oku"""
+        history = await self.backend.get_conversation_history(session_id, limit, before)
+        if len(history) < limit:
+            # Sıcak tabloda yeterli kayıt yoksa arşivden devam edilir (arşiv her zaman daha eskidir)
+            cursor = history[-1]["id"] if history else before
+            remaining = limit - len(history)
+            segments = await self.backend.get_archive_segments(session_id, cursor, remaining)
+            if segments:
+                history += await self.archive.read_history(segments, remaining, cursor)
+        return history
+
+    async def archive_conversations(self, max_age_days: Optional[float] = None,
+                                    batch_size: Optional[int] = None) -> int:
+        """max_age_days'ten eski konuşmaları sıkıştırılmış arşiv parçalarına taşı; taşınan kayıt sayısını döndür"""
+        max_age_days = Config.ARCHIVE_AFTER_DAYS if max_age_days is None else max_age_days
+        batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+        cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+        archived = 0
+        # Birden çok işçi aynı aralığı arşivlerse parçalar ve referans sayıları bozulur
+        async with self.backend.job_lock("teddy_archive") as acquired:
+            if not acquired:
+                logger.debug("Arşivleme başka bir işçide sürüyor, atlandı")
+                return 0
+            while True:
+                rows = await self.backend.get_archivable(cutoff, batch_size)
+                if not rows:
+                    return archived
+                # Önce parçalar diske yazılır; dizin kaydı ve silme ardından tek işlemde yapılır
+                segments = await self.archive.write_segments(rows)
+                await self.backend.archive_conversations(segments, [row["id"] for row in rows])
+                archived += len(rows)
+                if len(rows) < batch_size:
+                    return archived
 
     async def update_user_profile(self, user_id: str, preferences: Dict = None,
                                 interaction: Dict = None):
-        """Kullanıcı profilini güncelle"""
-        async with aiosqlite.connect(self.db_path) as db:
-            if preferences or interaction:
-                # Mevcut profili al
-                cursor = await db.execute(
-                    "SELECT preferences, interaction_history FROM user_profiles WHERE user_id = ?",
-                    (user_id,)
-                )
-                row = await cursor.fetchone()
-                
-                if row:
-                    current_prefs = json.loads(row[0]) if row[0] else {}
-                    current_inter = json.loads(row[1]) if row[1] else {}
-                    
-                    if preferences:
-                        current_prefs.update(preferences)
-                    if interaction:
-                        current_inter.update(interaction)
-                    
-                    await db.execute("""
-                        UPDATE user_profiles 
-                        SET preferences = ?, interaction_history = ?, last_seen = CURRENT_TIMESTAMP
-                        WHERE user_id = ?
-                    """, (json.dumps(current_prefs), json.dumps(current_inter), user_id))
-                else:
-                    await db.execute("""
-                        INSERT INTO user_profiles 
-                        (user_id, preferences, interaction_history, last_seen)
-                        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                    """, (user_id, json.dumps(preferences or {}), json.dumps(interaction or {})))
-                
-                await db.commit()
+        """Kullanıcı profilini güncelle (periyodik toplu UPSERT ile yazılır)"""
+        if preferences or interaction:
+            self.profiles.update(user_id, preferences, interaction)
+
+    @observe_async(DB_DURATION.labels("get_user_profile"))
+    async def get_user_profile(self, user_id: str) -> Optional[Dict]:
+        """Kullanıcı profilini getir; yoksa None"""
+        return await self.profiles.get(user_id)
 
+    @observe_async(DB_DURATION.labels("add_learned_knowledge"))
     async def add_learned_knowledge(self, topic: str, content: str, 
                                   source: Optional[str] = None, 
                                   confidence: float = 1.0):
         """Yeni öğrenilen bilgiyi kaydet"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT INTO learned_knowledge (topic, content, source, confidence)
-                VALUES (?, ?, ?, ?)
-            """, (topic, content, source, confidence))
-            await db.commit()
+        await self.backend.add_learned_knowledge(topic, content, source, confidence)
 
+    @observe_async(DB_DURATION.labels("get_learned_knowledge"))
     async def get_learned_knowledge(self, topic: Optional[str] = None) -> List[Dict]:
         """Öğrenilen bilgileri getir"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            if topic:
-                cursor = await db.execute(
-                    "SELECT * FROM learned_knowledge WHERE topic = ? ORDER BY confidence DESC",
-                    (topic,)
-                )
-            else:
-                cursor = await db.execute(
-                    "SELECT * FROM learned_knowledge ORDER BY timestamp DESC"
-                )
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows] 
\ No newline at end of file
+        return await self.backend.get_learned_knowledge(topic)
+
+    @observe_async(DB_DURATION.labels("search_knowledge"))
+    async def search_knowledge(self, query: str, min_confidence: float = 0.0,
+                               source: Optional[str] = None, limit: int = 20,
+                               offset: int = 0) -> List[Dict]:
+        """Öğrenilen bilgilerde tam metin ara; en alakalı sonuçlar önce gelir"""
+        return await self.backend.search_knowledge(query, min_confidence, source, limit, offset)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Set
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class Turn:
+    """Yanıt gönderme sırası: sıralı modda önceki mesajın yanıtları bitene kadar bekletir"""
+    def __init__(self, previous: Optional[asyncio.Future] = None, done: Optional[asyncio.Future] = None):
+        self._previous = previous
+        self._done = done
+
+    async def wait(self) -> None:
+        """Sıra bu mesaja gelene kadar bekle"""
+        if self._previous is not None:
+            # Önceki mesaj hata verse de iptal edilse de sıra ilerler
+            await asyncio.shield(self._previous)
+
+    def release(self) -> None:
+        """Sırayı bir sonraki mesaja devret"""
+        if self._done is None or self._done.done():
+            return
+        if self._previous is not None and not self._previous.done():
+            # Mesaj sırası gelmeden bittiyse (hata, iptal) önceki mesaj bitince devredilir
+            self._previous.add_done_callback(lambda _: self.release())
+            return
+        self._done.set_result(None)
+
+class MessagePipeline:
+    """Bağlantı başına mesaj hattı: en fazla max_inflight mesaj eşzamanlı işlenir"""
+    def __init__(self, max_inflight: Optional[int] = None, ordered: bool = False):
+        self.max_inflight = max(1, max_inflight or Config.WS_MAX_INFLIGHT)
+        self.ordered = ordered
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._tasks: Set[asyncio.Task] = set()
+        self._last_done: Optional[asyncio.Future] = None
+
+    @property
+    def inflight(self) -> int:
+        """İşlenmekte olan mesaj sayısı"""
+        return len(self._tasks)
+
+    def _next_turn(self) -> Turn:
+        if not self.ordered:
+            return Turn()
+        done = asyncio.get_running_loop().create_future()
+        turn = Turn(self._last_done, done)
+        self._last_done = done
+        return turn
+
+    async def submit(self, handler: Callable[[Turn], Awaitable[None]]) -> None:
+        """Boş yer açılana kadar bekle ve mesajı arka planda işlemeye başla"""
+        await self._slots.acquire()
+        turn = self._next_turn()
+        task = asyncio.create_task(self._run(handler, turn))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, handler: Callable[[Turn], Awaitable[None]], turn: Turn) -> None:
+        try:
+            await handler(turn)
+        except Exception as e:
+            logger.error(f"Mesaj hattı hatası: {str(e)}")
+        finally:
+            turn.release()
+            self._slots.release()
+
+    async def drain(self) -> None:
+        """İşlenmekte olan tüm mesajlar bitene kadar bekle"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def cancel(self) -> None:
+        """Bekleyen mesajları iptal et (bağlantı kapandığında)"""
+        for task in self._tasks:
+            task.cancel()
+        await self.drain()
@@ -0,0 +1,81 @@
+import json
+import struct
+from enum import IntEnum
+from typing import Any, Dict, Optional, Tuple
+
+# İkili çerçeve başlığı: sihirli değer, sürüm, tür, meta uzunluğu, yük uzunluğu
+HEADER = struct.Struct("!2sBBHI")
+MAGIC = b"TD"
+VERSION = 1
+MAX_META_SIZE = 0xFFFF
+
+class FrameKind(IntEnum):
+    """İkili WebSocket çerçeve türleri"""
+    TEXT = 1
+    AUDIO = 2
+    VIDEO = 3
+    RESPONSE = 16
+    AUDIO_CHUNK = 17
+
+# İstemciden gelen çerçeve türlerinin JSON mesaj türü karşılıkları
+MESSAGE_TYPES = {
+    FrameKind.TEXT: "text",
+    FrameKind.AUDIO: "audio",
+    FrameKind.VIDEO: "video",
+}
+
+class ProtocolError(ValueError):
+    """Geçersiz ikili çerçeve"""
+
+def encode_frame(kind: FrameKind, meta: Optional[Dict[str, Any]] = None,
+                 payload: bytes = b"") -> bytes:
+    """Başlık + JSON meta + ham yükten oluşan çerçeve üret"""
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode() if meta else b""
+    if len(meta_bytes) > MAX_META_SIZE:
+        raise ProtocolError("Meta verisi çok büyük")
+    header = HEADER.pack(MAGIC, VERSION, int(kind), len(meta_bytes), len(payload))
+    return b"".join((header, meta_bytes, payload))
+
+def decode_frame(data: bytes) -> Tuple[FrameKind, Dict[str, Any], memoryview]:
+    """Çerçeveyi çöz; yük kopyalanmadan memoryview olarak döner"""
+    if len(data) < HEADER.size:
+        raise ProtocolError("Çerçeve başlığı eksik")
+
+    magic, version, kind, meta_len, payload_len = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ProtocolError("Geçersiz çerçeve imzası")
+    if version != VERSION:
+        raise ProtocolError(f"Desteklenmeyen protokol sürümü: {version}")
+    if HEADER.size + meta_len + payload_len != len(data):
+        raise ProtocolError("Çerçeve uzunluğu tutarsız")
+    try:
+        kind = FrameKind(kind)
+    except ValueError:
+        raise ProtocolError(f"Bilinmeyen çerçeve türü: {kind}")
+
+    view = memoryview(data)
+    meta_end = HEADER.size + meta_len
+    try:
+        meta = json.loads(bytes(view[HEADER.size:meta_end])) if meta_len else {}
+    except ValueError:
+        raise ProtocolError("Meta verisi geçerli JSON değil")
+    if not isinstance(meta, dict):
+        raise ProtocolError("Meta verisi bir JSON nesnesi olmalı")
+    return kind, meta, view[meta_end:]
+
+def frame_to_message(data: bytes) -> Dict[str, Any]:
+    """İstemci çerçevesini JSON mesajlarıyla aynı biçimde sözlüğe çevir"""
+    kind, meta, payload = decode_frame(data)
+    if kind not in MESSAGE_TYPES:
+        raise ProtocolError(f"İstemci bu çerçeve türünü gönderemez: {kind.name}")
+
+    message = dict(meta)
+    message["type"] = MESSAGE_TYPES[kind]
+    if kind == FrameKind.TEXT:
+        try:
+            message["content"] = str(payload, "utf-8")
+        except UnicodeDecodeError:
+            raise ProtocolError("Metin çerçevesi geçerli UTF-8 değil")
+    else:
+        message["content"] = bytes(payload)
+    return message
@@ -0,0 +1,24 @@
+import pytest
+from benchmark import FakeCommunicate, make_video, make_wav, parse_mix, percentile
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@pytest.mark.asyncio
+async def test_benchmark_fakes_and_helpers(monkeypatch):
+    """Yük testi yardımcılarının ve sahte TTS'in deterministik olduğunu test eder"""
+    assert parse_mix("text=0.7,audio=0.3") == {"text": 0.7, "audio": 0.3}
+    with pytest.raises(ValueError):
+        parse_mix("resim=1")
+
+    assert percentile([], 50) is None
+    assert percentile([float(i) for i in range(1, 101)], 99) == 99.0
+
+    monkeypatch.setattr(FakeCommunicate, "latency", 0)
+    first = [chunk["data"] async for chunk in FakeCommunicate("merhaba", "tr-TR").stream()]
+    second = [chunk["data"] async for chunk in FakeCommunicate("merhaba", "tr-TR").stream()]
+    assert first == second and len(first) == FakeCommunicate.chunk_count
+
+    assert make_wav(0.1)[:4] == b"RIFF"
+    assert len(make_video(3)) > 0
@@ -0,0 +1,83 @@
+import os
+import time
+import pytest
+from blob_store import BlobStore, parse_range
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@pytest.mark.asyncio
+async def test_blob_store_dedup_and_range(tmp_path):
+    """Aynı içeriğin bir kez saklandığını ve aralıklı okunabildiğini test eder"""
+    store = BlobStore(str(tmp_path))
+    data = bytes(range(256)) * 1000
+
+    digest = await store.put(data)
+    assert await store.put(data) == digest
+    assert store.stats == {"stored": 1, "deduplicated": 1, "deleted": 0}
+
+    path = store.path(digest)
+    assert path == os.path.join(str(tmp_path), digest[:2], digest[2:4], digest)
+    assert store.stat(digest).st_size == len(data)
+    assert b"".join(store.read_range(digest, 0, len(data) - 1, chunk_size=4096)) == data
+    assert b"".join(store.read_range(digest, 100, 199)) == data[100:200]
+
+    with pytest.raises(ValueError):
+        store.path("../../etc/passwd")
+
+def test_blob_store_delete_grace(tmp_path):
+    """Bekleme süresi dolmamış blob'ların silinmediğini test eder"""
+    store = BlobStore(str(tmp_path))
+    digest = store.put_sync(b"ses")
+
+    assert not store.delete_sync(digest, grace=60)
+    old = time.time() - 120
+    os.utime(store.path(digest), (old, old))
+    assert store.delete_sync(digest, grace=60)
+    assert store.stat(digest) is None
+    # Zaten silinmiş blob tekrar silinebilir sayılır
+    assert store.delete_sync(digest)
+
+def test_blob_store_put_and_delete_race(tmp_path, monkeypatch):
+    """Çöp toplayıcıyla yarışan put_sync'in blob'u kaybetmediğini test eder"""
+    store = BlobStore(str(tmp_path))
+    digest = store.put_sync(b"ses")
+    path = store.path(digest)
+    utime, replace = os.utime, os.replace
+
+    # Silme, varlık kontrolü ile zaman damgası tazeleme arasına düşerse dosya yeniden yazılır
+    def deleted_before_utime(target, *args):
+        if target == path and os.path.exists(path):
+            os.unlink(path)
+        return utime(target, *args)
+
+    monkeypatch.setattr(os, "utime", deleted_before_utime)
+    assert store.put_sync(b"ses") == digest
+    assert store.stat(digest).st_size == 3
+    monkeypatch.setattr(os, "utime", utime)
+
+    # Eski görünen blob silinirken put_sync zaman damgasını tazelerse blob geri konur
+    old = time.time() - 120
+    os.utime(path, (old, old))
+
+    def refreshed_before_replace(src, dst):
+        if src == path:
+            store.put_sync(b"ses")
+        return replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", refreshed_before_replace)
+    assert not store.delete_sync(digest, grace=60)
+    assert store.stat(digest) is not None
+    assert [p.name for p in tmp_path.rglob("*.tmp")] == []
+
+def test_parse_range():
+    """Range başlığının çözümlenmesini test eder"""
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    for header in ["bytes=100-", "bytes=5-1", "bytes=0-1,5-6", "items=0-1", "bytes=-0"]:
+        with pytest.raises(ValueError):
+            parse_range(header, 100)
@@ -0,0 +1,173 @@
+import asyncio
+import pytest
+from cache import SimpleCache
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_lru_eviction_by_count_and_size():
+    """Kayıt sayısı ve bayt sınırında en az kullanılanın çıkarıldığını test eder"""
+    cache = SimpleCache(max_entries=2, max_bytes=1000)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+
+    cache = SimpleCache(max_entries=100, max_bytes=10)
+    cache.set("a", b"x" * 6)
+    cache.set("b", b"y" * 6)
+    assert cache.get("a") is None
+    assert cache.size_bytes == 6
+    assert cache.stats["evictions"] == 1
+
+    # Tek başına sınırı aşan değer hiç saklanmaz
+    cache.set("c", b"z" * 11)
+    assert cache.get("c") is None
+
+@pytest.mark.asyncio
+async def test_background_sweep_removes_unread_keys():
+    """Hiç okunmayan süresi dolmuş kayıtların arka planda silindiğini test eder"""
+    cache = SimpleCache(sweep_interval=0.01)
+    cache.set("gecici", "deger", ttl=0)
+    cache.set("kalici", "deger", ttl=60)
+    cache.start()
+    try:
+        await asyncio.sleep(0.05)
+        assert len(cache) == 1
+        stats = cache.get_stats()
+        assert stats["expirations"] == 1 and stats["entries"] == 1
+    finally:
+        await cache.stop()
+
+@pytest.mark.asyncio
+async def test_cache_decorator_single_flight_and_stale():
+    """Eşzamanlı ıskaların tek çağrıya indirildiğini ve bayat değerin arka planda yenilendiğini test eder"""
+    from cache import cache, cache_decorator
+    cache.clear()
+    calls = 0
+
+    @cache_decorator(ttl=0, stale_ttl=60)
+    async def pahali(x):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return x * calls
+
+    results = await asyncio.gather(*[pahali(2) for _ in range(10)])
+    assert results == [2] * 10
+    assert calls == 1
+
+    # ttl=0: değer hemen bayatlar; eski değer döner, yenileme tek sefer çalışır
+    assert await pahali(2) == 2
+    assert await pahali(2) == 2
+    await asyncio.sleep(0.05)
+    assert calls == 2
+    assert await pahali(2) == 4
+
+@pytest.mark.asyncio
+async def test_cache_decorator_propagates_errors():
+    """Hatanın tüm bekleyenlere iletildiğini ve önbelleğe yazılmadığını test eder"""
+    from cache import cache_decorator
+
+    @cache_decorator(ttl=60)
+    async def bozuk():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("hata")
+
+    results = await asyncio.gather(bozuk(), bozuk(), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    with pytest.raises(RuntimeError):
+        await bozuk()
+
+@pytest.mark.asyncio
+async def test_tiered_cache_shares_l2_and_invalidates():
+    """İki sürecin L2'yi paylaştığını ve yazmaların diğer L1'i geçersiz kıldığını test eder"""
+    from cache import TieredCache
+    from cache_backends import InMemoryBackend, InMemoryServer
+    server = InMemoryServer()
+    worker_a = TieredCache(SimpleCache(), secret="gizli")
+    worker_b = TieredCache(SimpleCache(), secret="gizli")
+    await worker_a.attach(InMemoryBackend(server))
+    await worker_b.attach(InMemoryBackend(server))
+    try:
+        await worker_a.set("gecmis:1", {"mesaj": "merhaba"}, ttl=60)
+        assert await worker_b.get("gecmis:1") == {"mesaj": "merhaba"}
+        assert worker_b.stats["l2_hits"] == 1
+
+        # B artık L1'den okuyor; A'nın yeni yazması B'nin kopyasını düşürmeli
+        await worker_a.set("gecmis:1", {"mesaj": "güncel"}, ttl=60)
+        await asyncio.sleep(0)
+        assert worker_b.l1.get("gecmis:1") is None
+        assert await worker_b.get("gecmis:1") == {"mesaj": "güncel"}
+
+        await worker_b.delete("gecmis:1")
+        await asyncio.sleep(0)
+        assert await worker_a.get("gecmis:1") is None
+    finally:
+        await worker_a.detach()
+        await worker_b.detach()
+
+@pytest.mark.asyncio
+async def test_cache_decorator_cancel_does_not_affect_waiters():
+    """İlk çağıranın iptalinin ortak hesaplamayı ve diğer bekleyenleri etkilemediğini test eder"""
+    from cache import cache, cache_decorator
+    cache.clear()
+    calls = 0
+
+    @cache_decorator(ttl=60)
+    async def yavas(x):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return x * 2
+
+    first = asyncio.create_task(yavas(1))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(yavas(1))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == 2
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert calls == 1
+    # Sonuç önbelleğe yazıldı; yeni çağrı hesaplamayı tekrarlamaz
+    assert await yavas(1) == 2
+    assert calls == 1
+
+@pytest.mark.asyncio
+async def test_tiered_cache_rejects_foreign_l2_values():
+    """Bozuk ya da imzasız L2 kayıtlarının açılmadan ıska ve hata sayıldığını test eder"""
+    import pickle
+    from cache import TieredCache
+    from cache_backends import InMemoryBackend, InMemoryServer
+    server = InMemoryServer()
+    worker = TieredCache(SimpleCache(), secret="gizli")
+    await worker.attach(InMemoryBackend(server))
+    try:
+        await InMemoryBackend(server).set("bozuk", b"\x01kisa", 60)
+        await InMemoryBackend(server).set("imzasiz", pickle.dumps({"a": 1}), 60)
+        assert await worker.get("bozuk") is None
+        assert await worker.get("imzasiz") is None
+        assert worker.stats["l2_errors"] == 2 and worker.stats["l2_hits"] == 0
+
+        # Farklı anahtarla imzalayan süreç de güvenilmez sayılır
+        other = TieredCache(SimpleCache(), secret="baska")
+        await other.attach(InMemoryBackend(server))
+        await other.set("deger", 1, ttl=60)
+        assert await worker.get("deger") is None
+        await other.detach()
+
+        await worker.set("deger", 2, ttl=60)
+        worker.l1.clear()
+        assert await worker.get("deger") == 2
+    finally:
+        await worker.detach()
+
+    # Yer tutucu anahtarla L2 bağlanmaz
+    for secret in ("your-secret-key", "your_secure_cache_secret"):
+        with pytest.raises(RuntimeError):
+            await TieredCache(SimpleCache(), secret=secret).attach(InMemoryBackend(server))
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pytest
+from connections import CLOSE_REPLACED, CLOSE_SLOW_CONSUMER, ConnectionManager
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeWebSocket:
+    """Gönderimleri kaydeden, istenirse tıkanan sahte WebSocket"""
+    def __init__(self, blocked: bool = False):
+        self.sent = []
+        self.closed_with = None
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+        self.incoming = asyncio.Queue()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        await self.unblocked.wait()
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        await self.unblocked.wait()
+        self.sent.append(data)
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+@pytest.mark.asyncio
+async def test_reconnect_replaces_previous_connection():
+    """Aynı client_id ile yeni bağlantının eskisini kapattığını test eder"""
+    manager = ConnectionManager()
+    old_socket, new_socket = FakeWebSocket(), FakeWebSocket()
+
+    old = await manager.connect("ayi", old_socket)
+    new = await manager.connect("ayi", new_socket)
+    assert manager.get("ayi") is new and len(manager) == 1
+
+    # Eski bağlantının okuma döngüsü disconnect alır
+    message = await asyncio.wait_for(old.receive(), 1)
+    assert message == {"type": "websocket.disconnect", "code": CLOSE_REPLACED}
+    await manager.disconnect(old)
+    assert old_socket.closed_with == CLOSE_REPLACED
+    assert manager.get("ayi") is new
+
+    await new.send_json({"text": "merhaba"})
+    await manager.disconnect(new)
+    assert new_socket.sent == [json.dumps({"text": "merhaba"})]
+    assert len(manager) == 0
+
+@pytest.mark.asyncio
+async def test_slow_consumer_policies():
+    """Tıkalı istemcide kuyruğun sınırlı kaldığını ve politikanın uygulandığını test eder"""
+    manager = ConnectionManager(max_queue=3, policy="drop_oldest")
+    socket = FakeWebSocket(blocked=True)
+    connection = await manager.connect("yavas", socket)
+    for i in range(10):
+        await connection.send_bytes(bytes([i]))
+    await asyncio.sleep(0)
+    assert connection.pending <= 3
+    assert connection.stats["dropped"] >= 6
+    socket.unblocked.set()
+    await asyncio.sleep(0.01)
+    assert socket.sent[-1] == bytes([9])
+    await manager.disconnect(connection)
+
+    manager = ConnectionManager(max_queue=3, policy="disconnect")
+    socket = FakeWebSocket(blocked=True)
+    connection = await manager.connect("yavas", socket)
+    for i in range(10):
+        await connection.send_bytes(bytes([i]))
+    assert connection.closed and connection.close_code == CLOSE_SLOW_CONSUMER
+    # Tıkalı soket beklenmeden kapatılır
+    await asyncio.wait_for(manager.disconnect(connection), 2)
+
+@pytest.mark.asyncio
+async def test_broadcast_and_idle_reaping():
+    """Yayının tek serileştirmeyle herkese ulaştığını ve boşta kalanların kapatıldığını test eder"""
+    manager = ConnectionManager(idle_timeout=60)
+    sockets = [FakeWebSocket() for _ in range(3)]
+    conns = [await manager.connect(f"istemci-{i}", socket) for i, socket in enumerate(sockets)]
+
+    assert manager.broadcast({"type": "duyuru"}, exclude=["istemci-2"]) == 2
+    await asyncio.sleep(0.01)
+    assert sockets[0].sent == sockets[1].sent == ['{"type": "duyuru"}']
+    assert sockets[2].sent == []
+
+    # Yalnızca nabız isteyen bağlantılar ping alır ve boşta kalınca kapatılır
+    conns[0].heartbeat = conns[1].heartbeat = True
+    conns[0].last_seen -= 120
+    conns[2].last_seen -= 120
+    reaped, pinged = manager.reap()
+    assert (reaped, pinged) == (1, 1)
+    assert conns[0].closed and not conns[1].closed and not conns[2].closed
+    await asyncio.sleep(0.01)
+    assert sockets[1].sent[-1] == '{"type": "ping"}'
+    assert sockets[2].sent == []
+
+    await manager.stop()
+    for connection in conns:
+        await manager.disconnect(connection)
+    assert len(manager) == 0
@@ -0,0 +1,55 @@
+import asyncio
+import time
+import pytest
+from executor import BlockingExecutor, ExecutorBusyError
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@pytest.mark.asyncio
+async def test_blocking_work_keeps_loop_responsive():
+    """Engelleyici işler çalışırken olay döngüsünün cevap verdiğini test eder"""
+    executor = BlockingExecutor(max_workers=2, max_queue=4, per_client_limit=2)
+    try:
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await asyncio.gather(*[executor.run(time.sleep, 0.1, client_id="a") for _ in range(2)])
+        task.cancel()
+        assert ticks >= 5
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_per_client_limit_and_rejection():
+    """İstemci başına eşzamanlılık sınırını ve dolu kuyruğun reddedildiğini test eder"""
+    executor = BlockingExecutor(max_workers=4, max_queue=3, per_client_limit=1)
+    try:
+        running = 0
+        peak = 0
+
+        def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            time.sleep(0.05)
+            running -= 1
+
+        jobs = [asyncio.create_task(executor.run(work, client_id="a")) for _ in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorBusyError):
+            await executor.run(work, client_id="b")
+        await asyncio.gather(*jobs)
+
+        assert peak == 1
+        assert executor.stats["rejected"] == 1
+    finally:
+        executor.shutdown()
@@ -0,0 +1,150 @@
+import asyncio
+import pytest
+from history_cache import HistoryCache
+from models import Database
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def make_rows(session_id, ids):
+    return [{"id": i, "session_id": session_id, "user_message": f"mesaj {i}"} for i in ids]
+
+@pytest.mark.asyncio
+async def test_history_cache_ring_buffer():
+    """Tamponun ilk sayfayı önbellekten verdiğini, yeni kayıtları eklediğini ve sınırı koruduğunu test eder"""
+    stored = make_rows("oturum", range(1, 11))
+    calls = []
+
+    async def loader(session_id, limit, before):
+        calls.append((limit, before))
+        rows = [row for row in reversed(stored) if before is None or row["id"] < before]
+        return rows[:limit]
+
+    history = HistoryCache(capacity=5)
+    assert [row["id"] for row in await history.get("oturum", 3, None, loader)] == [10, 9, 8]
+    assert [row["id"] for row in await history.get("oturum", 3, None, loader)] == [10, 9, 8]
+    assert [row["id"] for row in await history.get("oturum", 2, 9, loader)] == [8, 7]
+    assert len(calls) == 1
+
+    # Tampon dışına taşan sayfa veritabanından okunur
+    assert [row["id"] for row in await history.get("oturum", 3, 7, loader)] == [6, 5, 4]
+    assert calls[-1] == (3, 7)
+
+    # Yeni kayıt başa eklenir, en eski kayıt düşer
+    history.add(make_rows("oturum", [11]))
+    entry = history.cache.peek("oturum")
+    assert [row["id"] for row in entry.rows] == [11, 10, 9, 8, 7]
+    assert not entry.complete
+
+    # Sıra dışı ve tekrar gelen kayıtlar sırayı bozmaz
+    history.add(make_rows("oturum", [12, 12]))
+    entry.add({"id": 13, "session_id": "oturum"})
+    history.add(make_rows("oturum", [14]))
+    assert [row["id"] for row in history.cache.peek("oturum").rows] == [14, 13, 12, 11, 10]
+
+    history.invalidate(["oturum"])
+    assert history.cache.peek("oturum") is None
+
+@pytest.mark.asyncio
+async def test_history_cache_short_session_and_race():
+    """Kısa oturumların tamamen önbellekten verildiğini ve yükleme sırasındaki yazmanın eski sonucu önbelleğe sokmadığını test eder"""
+    history = HistoryCache(capacity=10)
+
+    async def short_loader(session_id, limit, before):
+        return make_rows(session_id, [2, 1])
+
+    await history.get("kisa", 5, None, short_loader)
+    # Oturumun tamamı tamponda; eksik sayfa da önbellekten karşılanır
+    assert [row["id"] for row in await history.get("kisa", 5, 2, short_loader)] == [1]
+    assert history.cache.peek("kisa").complete
+
+    async def racing_loader(session_id, limit, before):
+        history.add(make_rows(session_id, [3]))
+        return make_rows(session_id, [2, 1])
+
+    await history.get("yaris", 5, None, racing_loader)
+    assert history.cache.peek("yaris") is None
+
+@pytest.mark.asyncio
+async def test_database_history_cache(tmp_path):
+    """Kayıt ve toplu yazmanın önbelleği güncellediğini, tekrar okumada veritabanına gidilmediğini test eder"""
+    db = Database(str(tmp_path / "teddy.db"), blob_dir=str(tmp_path / "blobs"))
+    await db.initialize()
+    try:
+        await db.save_conversation("oturum", "mesaj 0", "yanıt 0")
+        first = await db.get_conversation_history("oturum", limit=10)
+        assert len(first) == 1
+
+        loads = []
+        original = db._load_history
+
+        async def counting_loader(session_id, limit, before):
+            loads.append(limit)
+            return await original(session_id, limit, before)
+
+        db._load_history = counting_loader
+
+        await db.save_conversation("oturum", "mesaj 1", "yanıt 1")
+        for i in range(2, 5):
+            await db.queue_conversation("oturum", f"mesaj {i}", f"yanıt {i}")
+        await db.writer.flush()
+
+        cached = await db.get_conversation_history("oturum", limit=10)
+        assert [row["user_message"] for row in cached] == [f"mesaj {i}" for i in range(4, -1, -1)]
+        assert loads == []
+
+        # Önbellekteki kayıtlar veritabanındakiyle aynı olmalı
+        async with db.pool.reader() as conn:
+            cursor = await conn.execute("SELECT * FROM conversations ORDER BY id DESC")
+            assert [dict(row) for row in await cursor.fetchall()] == cached
+    finally:
+        await db.close()
+
+@pytest.mark.asyncio
+async def test_history_cache_invalidates_other_workers():
+    """Bir işçinin yazdığı oturumun diğer işçinin tamponundan pub/sub ile düşürüldüğünü test eder"""
+    from cache_backends import InMemoryBackend, InMemoryServer
+    server = InMemoryServer()
+    worker_a, worker_b = HistoryCache(capacity=5), HistoryCache(capacity=5)
+    await worker_a.attach(InMemoryBackend(server))
+    await worker_b.attach(InMemoryBackend(server))
+    stored = make_rows("oturum", [2, 1])
+
+    async def loader(session_id, limit, before):
+        return [row for row in stored if before is None or row["id"] < before][:limit]
+
+    try:
+        await worker_a.get("oturum", 5, None, loader)
+        await worker_b.get("oturum", 5, None, loader)
+
+        # A kaydı yazar: kendi tamponuna ekler, B'ninki düşer ve sonraki okuma veritabanına gider
+        stored.insert(0, make_rows("oturum", [3])[0])
+        worker_a.add(stored[:1])
+        await asyncio.sleep(0.01)
+        assert [row["id"] for row in worker_a.cache.peek("oturum").rows] == [3, 2, 1]
+        assert worker_b.cache.peek("oturum") is None
+        assert [row["id"] for row in await worker_b.get("oturum", 5, None, loader)] == [3, 2, 1]
+
+        # Toplu temizlik de yayılır
+        worker_b.clear()
+        await asyncio.sleep(0.01)
+        assert worker_a.cache.peek("oturum") is None
+    finally:
+        await worker_a.detach()
+        await worker_b.detach()
+
+@pytest.mark.asyncio
+async def test_history_cache_disabled():
+    """Önbellek kapalıyken her okumanın yükleyiciye gittiğini test eder"""
+    history = HistoryCache(capacity=5)
+    history.enabled = False
+    calls = []
+
+    async def loader(session_id, limit, before):
+        calls.append(limit)
+        return make_rows(session_id, [1])
+
+    await history.get("oturum", 5, None, loader)
+    await history.get("oturum", 5, None, loader)
+    assert calls == [5, 5] and len(history.cache) == 0
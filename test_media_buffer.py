@@ -0,0 +1,29 @@
+import os
+import pytest
+from config import Config
+from media_buffer import media_path
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_small_media_stays_in_memory(tmp_path, monkeypatch):
+    """Eşik altındaki verinin diske yazılmadan okunabildiğini test eder"""
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    with media_path(b"webm verisi", suffix=".webm") as path:
+        with open(path, "rb") as f:
+            assert f.read() == b"webm verisi"
+    assert list(tmp_path.iterdir()) == []
+
+def test_large_media_is_spooled_and_cleaned(tmp_path, monkeypatch):
+    """Eşiği aşan verinin geçici dosyaya yazıldığını ve hata olsa da silindiğini test eder"""
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    monkeypatch.setattr(Config, "MEDIA_SPOOL_THRESHOLD_BYTES", 4)
+
+    with pytest.raises(RuntimeError):
+        with media_path(b"buyuk video", suffix=".webm") as path:
+            assert path.startswith(str(tmp_path)) and path.endswith(".webm")
+            assert os.path.getsize(path) == len(b"buyuk video")
+            raise RuntimeError("işleme hatası")
+
+    assert not os.path.exists(path)
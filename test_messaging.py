@@ -0,0 +1,158 @@
+import asyncio
+import time
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from messaging import OutboundDispatcher, TelegramTransport, WhatsAppTransport, split_message
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class StubProviders:
+    """Telegram ve Twilio API'lerini taklit eden yerel HTTP sunucusu"""
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.received = []
+        self.failures = {}
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", self.telegram)
+        app.router.add_post("/2010-04-01/Accounts/{sid}/Messages.json", self.twilio)
+        self.server = TestServer(app)
+
+    @property
+    def url(self) -> str:
+        return str(self.server.make_url("")).rstrip("/")
+
+    def fail(self, text: str, *responses: web.Response) -> None:
+        """text için sırayla bu yanıtları döndür"""
+        self.failures[text] = list(responses)
+
+    async def telegram(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        return await self.respond("telegram", str(data["chat_id"]), data["text"], web.json_response({"ok": True}))
+
+    async def twilio(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        assert request.headers["Authorization"].startswith("Basic ")
+        return await self.respond(
+            "whatsapp", data["To"].removeprefix("whatsapp:"), data["Body"],
+            web.json_response({"sid": "SM1"}, status=201)
+        )
+
+    async def respond(self, channel: str, destination: str, text: str, ok: web.Response) -> web.Response:
+        await asyncio.sleep(self.delay)
+        pending = self.failures.get(text)
+        if pending:
+            return pending.pop(0)
+        self.received.append((channel, destination, text, time.monotonic()))
+        return ok
+
+def make_dispatcher(stub: StubProviders, **kwargs) -> OutboundDispatcher:
+    telegram = TelegramTransport("token", base_url=stub.url, rate=1000, global_rate=1000)
+    whatsapp = WhatsAppTransport("AC1", "secret", "+900000000000", base_url=stub.url, rate=1000, global_rate=1000)
+    kwargs.setdefault("retry_base", 0.01)
+    return OutboundDispatcher([telegram, whatsapp], **kwargs)
+
+@pytest.mark.asyncio
+async def test_dispatcher_parallel_channels_keep_chunk_order():
+    """Telegram ve WhatsApp gönderimlerinin paralel yapıldığını ve parça sırasının korunduğunu test eder"""
+    stub = StubProviders(delay=0.05)
+    await stub.server.start_server()
+    dispatcher = make_dispatcher(stub, workers=4)
+    dispatcher.transports["telegram"].max_length = 5
+    dispatcher.transports["whatsapp"].max_length = 5
+    await dispatcher.start()
+    try:
+        started = time.monotonic()
+        text = "birinciikinciucuncudordun"
+        assert await dispatcher.send("telegram", 42, text) == 5
+        assert await dispatcher.send("whatsapp", "+905551112233", text) == 5
+        await dispatcher.drain()
+        elapsed = time.monotonic() - started
+
+        for channel in ("telegram", "whatsapp"):
+            chunks = [r[2] for r in stub.received if r[0] == channel]
+            assert chunks == split_message(text, 5)
+        # Kanallar birbirini beklemez: 10 istek sıralı gönderilseydi ~0.5 sn sürerdi
+        assert elapsed < 0.4
+        assert dispatcher.stats["sent"] == 10 and dispatcher.pending == 0
+    finally:
+        await dispatcher.stop()
+        await stub.server.close()
+
+@pytest.mark.asyncio
+async def test_dispatcher_retries_and_gives_up():
+    """429/5xx yanıtlarının tekrar denendiğini, 4xx yanıtından vazgeçilip sıradaki parçaya geçildiğini test eder"""
+    stub = StubProviders()
+    await stub.server.start_server()
+    dispatcher = make_dispatcher(stub, workers=2)
+    await dispatcher.start()
+    try:
+        stub.fail(
+            "tekrar",
+            web.json_response({"ok": False, "parameters": {"retry_after": 0}}, status=429),
+            web.Response(status=502)
+        )
+        stub.fail("reddedilen", web.json_response({"ok": False, "description": "chat not found"}, status=400))
+
+        for text in ("tekrar", "reddedilen", "son"):
+            await dispatcher.send("telegram", 1, text)
+        await dispatcher.drain()
+
+        assert [r[2] for r in stub.received] == ["tekrar", "son"]
+        assert dispatcher.stats["retried"] == 2
+        assert dispatcher.stats["failed"] == 1
+    finally:
+        await dispatcher.stop()
+        await stub.server.close()
+
+@pytest.mark.asyncio
+async def test_dispatcher_rate_limit_per_destination():
+    """Hız sınırının hedef başına uygulandığını ve diğer hedefleri bekletmediğini test eder"""
+    stub = StubProviders()
+    await stub.server.start_server()
+    dispatcher = make_dispatcher(stub, workers=2)
+    dispatcher.transports["telegram"].rate = 20
+    await dispatcher.start()
+    try:
+        for i in range(4):
+            await dispatcher.send("telegram", "yavas", f"mesaj {i}")
+        await dispatcher.send("telegram", "diger", "hemen")
+        await dispatcher.drain()
+
+        slow = [r[3] for r in stub.received if r[1] == "yavas"]
+        assert [r[2] for r in stub.received if r[1] == "yavas"] == [f"mesaj {i}" for i in range(4)]
+        # 20 mesaj/sn: ardışık gönderimler arasında ~50 ms (ilk istek bağlantı kurulumunu da içerir)
+        assert slow[-1] - slow[0] >= 0.1
+        other = next(r[3] for r in stub.received if r[1] == "diger")
+        assert other < slow[-1]
+        assert dispatcher.stats["rate_limited"] > 0
+    finally:
+        await dispatcher.stop()
+        await stub.server.close()
+
+@pytest.mark.asyncio
+async def test_dispatcher_bounded_queue():
+    """Kuyruk dolduğunda gönderenin beklediğini test eder"""
+    stub = StubProviders()
+    await stub.server.start_server()
+    dispatcher = make_dispatcher(stub, max_queue=2)
+    try:
+        await dispatcher.send("telegram", 1, "bir")
+        await dispatcher.send("telegram", 1, "iki")
+        blocked = asyncio.create_task(dispatcher.send("telegram", 1, "uc"))
+        await asyncio.sleep(0.05)
+        assert not blocked.done() and dispatcher.pending == 2
+
+        # İşçiler başlayınca yer açılır
+        await dispatcher.start()
+        await asyncio.wait_for(blocked, 1)
+        await dispatcher.drain()
+        assert [r[2] for r in stub.received] == ["bir", "iki", "uc"]
+
+        with pytest.raises(ValueError):
+            await dispatcher.send("sms", 1, "metin")
+    finally:
+        await dispatcher.stop()
+        await stub.server.close()
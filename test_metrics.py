@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import textwrap
+from fastapi.testclient import TestClient
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_metrics_endpoint_exposes_metrics():
+    """/metrics çıktısında histogram, gösterge ve sayaç adlarının bulunduğunu test eder"""
+    import web
+    from metrics import ACTIVE_CONNECTIONS, ERRORS, MESSAGE_LATENCY
+    MESSAGE_LATENCY.labels("text").observe(0.02)
+    ACTIVE_CONNECTIONS.inc()
+    ACTIVE_CONNECTIONS.dec()
+    ERRORS.labels("test").inc()
+
+    response = TestClient(web.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'teddy_message_duration_seconds_bucket{le="0.025",type="text"}' in body
+    assert "# TYPE teddy_active_connections gauge" in body
+    assert 'teddy_errors_total{stage="test"}' in body
+    assert "# TYPE teddy_db_operation_duration_seconds histogram" in body
+
+WORKER = textwrap.dedent("""
+    import sys
+    import metrics
+    metrics.ACTIVE_CONNECTIONS.inc(int(sys.argv[1]))
+    metrics.QUEUE_DEPTH.labels("write_behind").inc(int(sys.argv[1]))
+    if sys.argv[2] == "kapat":
+        metrics.mark_process_dead()
+""")
+
+SCRAPE = "import metrics; print(metrics.metrics_response()[0].decode())"
+RESET = "import metrics; metrics.reset_multiprocess_dir()"
+
+def run(script, *args, directory):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(directory)}
+    return subprocess.run(
+        [sys.executable, "-c", script, *args], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True, capture_output=True, text=True
+    ).stdout
+
+def sample(body, name):
+    for line in body.splitlines():
+        if line.startswith(name + " ") or line.startswith(name + "{"):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+def test_multiprocess_metrics_drop_dead_workers(tmp_path):
+    """Çok süreçli modda kapanan işçinin göstergelerinin toplamdan düştüğünü ve dizinin sıfırlandığını test eder"""
+    directory = tmp_path / "metrics"
+    run(WORKER, "2", "acik", directory=directory)
+    run(WORKER, "5", "kapat", directory=directory)
+
+    body = run(SCRAPE, directory=directory)
+    # Kapanışta mark_process_dead çağıran işçinin 5 bağlantısı toplanmaz
+    assert sample(body, "teddy_active_connections") == 2
+    assert sample(body, "teddy_queue_depth") == 2
+
+    # Başlangıçta dizin boşaltılınca önceki çalıştırmadan değer kalmaz
+    run(RESET, directory=directory)
+    assert not list(directory.iterdir())
@@ -0,0 +1,481 @@
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import uuid
+import pytest
+from db_backends import create_backend
+from models import Database
+from write_behind import ProfileWriter
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@pytest.mark.asyncio
+async def test_connection_pool(tmp_path):
+    """Havuzlu bağlantılarla kayıt ve okuma yapılabildiğini test eder"""
+    db = Database(str(tmp_path / "teddy.db"))
+    await db.initialize()
+    try:
+        async with db.pool.reader() as conn:
+            cursor = await conn.execute("PRAGMA journal_mode")
+            assert (await cursor.fetchone())[0] == "wal"
+
+        # Eşzamanlı yazma ve okumalar aynı havuzu paylaşmalı
+        await asyncio.gather(*[
+            db.save_conversation("oturum", f"mesaj {i}", f"yanıt {i}")
+            for i in range(20)
+        ])
+        history = await db.get_conversation_history("oturum")
+        assert len(history) == 20
+
+        await db.update_user_profile("kullanici", interaction={"a": 1})
+        await db.update_user_profile("kullanici", interaction={"b": 2})
+        await db.add_learned_knowledge("konu", "içerik")
+        assert len(await db.get_learned_knowledge("konu")) == 1
+    finally:
+        await db.close()
+
+    assert not db.pool.is_open
+
+@pytest.mark.asyncio
+async def test_write_behind_batches(tmp_path):
+    """Kuyruklanan konuşmaların toplu yazıldığını ve kapanışta boşaltıldığını test eder"""
+    db = Database(str(tmp_path / "teddy.db"))
+    await db.initialize()
+    db.writer.batch_size = 10
+    try:
+        for i in range(25):
+            await db.queue_conversation("oturum", f"mesaj {i}", f"yanıt {i}")
+        await db.writer.flush()
+
+        assert db.writer.stats["written"] == 25
+        assert db.writer.stats["batches"] < 25
+        assert len(await db.get_conversation_history("oturum")) == 25
+
+        await db.queue_conversation("oturum", "son", "yanıt")
+    finally:
+        await db.close()
+
+    # Kapanıştan önce kuyruk boşaltılmış olmalı
+    db = Database(str(tmp_path / "teddy.db"))
+    await db.initialize()
+    try:
+        assert len(await db.get_conversation_history("oturum")) == 26
+    finally:
+        await db.close()
+
+@pytest.mark.asyncio
+async def test_history_keyset_pagination(tmp_path):
+    """Geçmişin indeks üzerinden imleçle sayfalandığını test eder"""
+    db = Database(str(tmp_path / "teddy.db"))
+    await db.initialize()
+    try:
+        for i in range(7):
+            await db.save_conversation("oturum", f"mesaj {i}", f"yanıt {i}")
+            await db.save_conversation("diger", f"mesaj {i}", f"yanıt {i}")
+
+        async with db.pool.reader() as conn:
+            cursor = await conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM conversations "
+                "WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                ("oturum", 100, 3)
+            )
+            plan = " ".join(row[3] for row in await cursor.fetchall())
+            assert "idx_conversations_session_id" in plan
+            assert "TEMP B-TREE" not in plan
+
+        pages = []
+        before = None
+        while True:
+            page = await db.get_conversation_history("oturum", limit=3, before=before)
+            if not page:
+                break
+            pages.append([row["user_message"] for row in page])
+            before = page[-1]["id"]
+
+        assert pages == [
+            ["mesaj 6", "mesaj 5", "mesaj 4"],
+            ["mesaj 3", "mesaj 2", "mesaj 1"],
+            ["mesaj 0"]
+        ]
+    finally:
+        await db.close()
+
+@pytest.mark.asyncio
+async def test_user_profile_upsert_and_cache(tmp_path):
+    """Profil güncellemelerinin birleştirilip tek UPSERT ile yazıldığını test eder"""
+    db = Database(str(tmp_path / "teddy.db"))
+    await db.initialize()
+    try:
+        for i in range(20):
+            await db.update_user_profile("kullanici", interaction={"son": i, f"k{i % 3}": i})
+        await db.update_user_profile("diger", preferences={"ses": "kadın"})
+        assert db.profiles.pending == 2
+        assert db.profiles.stats["coalesced"] == 19
+
+        # Henüz yazılmamış güncellemeler okumaya yansır
+        profile = await db.get_user_profile("kullanici")
+        assert profile["interaction_history"]["son"] == 19
+
+        await db.profiles.flush()
+        assert db.profiles.pending == 0 and db.profiles.stats["flushes"] == 1
+
+        # Veritabanındaki JSON ile yama veritabanı içinde birleştirilir
+        await db.backend.upsert_user_profiles([("kullanici", {"dil": "tr"}, {"son": "yeni"})])
+        stored = await db.backend.get_user_profile("kullanici")
+        assert stored["interaction_history"] == {"son": "yeni", "k0": 18, "k1": 19, "k2": 17}
+        assert stored["preferences"] == {"dil": "tr"}
+
+        async with db.pool.reader() as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM user_profiles")
+            assert (await cursor.fetchone())[0] == 2
+        assert await db.get_user_profile("yok") is None
+
+        # Önbellek ve veritabanı aynı yüzeysel birleştirmeyi uygular: iç içe nesne değiştirilir, None saklanır
+        await db.update_user_profile("ayar", preferences={"voice": {"name": "x"}, "k": 1, "acik": True})
+        await db.profiles.flush()
+        assert await db.get_user_profile("ayar")
+        await db.update_user_profile("ayar", preferences={"voice": {"rate": 2}, "k": None})
+        cached = (await db.get_user_profile("ayar"))["preferences"]
+        await db.profiles.flush()
+        stored = (await db.backend.get_user_profile("ayar"))["preferences"]
+        assert cached == stored == {"voice": {"rate": 2}, "k": None, "acik": True}
+    finally:
+        await db.close()
+
+class SlowProfileBackend:
+    """İlk profil okumasını, test izin verene kadar bekleten sahte arka uç"""
+    def __init__(self):
+        self.profiles = {}
+        self.reads = 0
+        self.reading = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def get_user_profile(self, user_id):
+        row = self.profiles.get(user_id)
+        row = row and {**row, "preferences": dict(row["preferences"])}
+        self.reads += 1
+        if self.reads == 1:
+            self.reading.set()
+            await self.release.wait()
+        return row
+
+    async def upsert_user_profiles(self, rows):
+        for user_id, preferences, interaction in rows:
+            profile = self.profiles.setdefault(
+                user_id, {"user_id": user_id, "preferences": {}, "interaction_history": {}}
+            )
+            profile["preferences"].update(preferences)
+            profile["interaction_history"].update(interaction)
+
+@pytest.mark.asyncio
+async def test_profile_read_during_flush_is_not_cached_stale():
+    """Okuma sürerken yazılan yamanın önbellekte kaybolmadığını test eder"""
+    backend = SlowProfileBackend()
+    backend.profiles["kullanici"] = {"user_id": "kullanici", "preferences": {}, "interaction_history": {}}
+    profiles = ProfileWriter(backend)
+    profiles.update("kullanici", preferences={"ses": "kadın"})
+
+    reader = asyncio.create_task(profiles.get("kullanici"))
+    await backend.reading.wait()
+    await profiles.flush()
+    backend.release.set()
+
+    assert (await reader)["preferences"] == {"ses": "kadın"}
+    assert profiles.cache.peek("kullanici")["preferences"] == {"ses": "kadın"}
+    assert backend.reads == 2
+
+@pytest.mark.asyncio
+async def test_profile_stop_during_flush_keeps_batch():
+    """Periyodik yazım sürerken durdurulan yazıcının partiyi kaybetmediğini test eder"""
+    backend = SlowProfileBackend()
+    writing, release = asyncio.Event(), asyncio.Event()
+    upsert = backend.upsert_user_profiles
+
+    async def slow_upsert(rows):
+        writing.set()
+        await release.wait()
+        await upsert(rows)
+
+    backend.upsert_user_profiles = slow_upsert
+    profiles = ProfileWriter(backend, flush_interval_ms=1)
+    await profiles.start()
+    profiles.update("kullanici", preferences={"ses": "kadın"})
+    await writing.wait()
+
+    stopping = asyncio.create_task(profiles.stop())
+    await asyncio.sleep(0.01)
+    release.set()
+    await stopping
+
+    assert backend.profiles["kullanici"]["preferences"] == {"ses": "kadın"}
+    assert profiles.pending == 0 and profiles.stats["written"] == 1
+
+async def seed_knowledge(db):
+    await db.add_learned_knowledge("Güneş sistemi", "Güneş sistemi sekiz gezegenden oluşur", "ansiklopedi", 0.9)
+    await db.add_learned_knowledge("Gezegenler", "Mars kırmızı gezegendir, güneş sistemindedir", "arxiv", 0.6)
+    await db.add_learned_knowledge("Hayvanlar", "Ayılar kış uykusuna yatar", "ansiklopedi", 0.8)
+    await db.add_learned_knowledge("Güneş", "Güneş bir yıldızdır", "web", 0.2)
+
+@pytest.mark.asyncio
+async def test_search_knowledge_fts(tmp_path):
+    """Tam metin aramanın sıralama, filtre ve sayfalamayla çalıştığını test eder"""
+    db = Database(str(tmp_path / "teddy.db"))
+    await db.initialize()
+    try:
+        await seed_knowledge(db)
+
+        results = await db.search_knowledge("güneş")
+        assert len(results) == 3
+        # Konuda geçen eşleşmeler içerikte geçenlerden önce gelir
+        assert results[-1]["topic"] == "Gezegenler"
+        assert all(a["score"] >= b["score"] for a, b in zip(results, results[1:]))
+
+        assert [r["topic"] for r in await db.search_knowledge("gunes", min_confidence=0.5)] == \
+            ["Güneş sistemi", "Gezegenler"]
+        assert [r["source"] for r in await db.search_knowledge("güneş", source="web")] == ["web"]
+        assert len(await db.search_knowledge("güneş", limit=2, offset=2)) == 1
+        assert await db.search_knowledge('güneş" OR "*') == []
+        assert await db.search_knowledge("  ") == []
+
+        # Eşit skorlu kayıtlar sayfalar arasında atlanmadan ve tekrarlanmadan id ile sıralanır
+        for i in range(5):
+            await db.add_learned_knowledge("Yıldız", "Yıldız", "test", 1.0)
+        pages = [await db.search_knowledge("yıldız", source="test", limit=2, offset=o) for o in (0, 2, 4)]
+        ids = [r["id"] for page in pages for r in page]
+        assert ids == sorted(ids, reverse=True) and len(set(ids)) == 5
+
+        # Tetikleyiciler dizini güncel tutar
+        async with db.pool.writer() as conn:
+            await conn.execute("UPDATE learned_knowledge SET content = 'Ayılar bal sever' WHERE topic = 'Hayvanlar'")
+            await conn.execute("DELETE FROM learned_knowledge WHERE topic = 'Güneş'")
+            await conn.commit()
+        assert [r["topic"] for r in await db.search_knowledge("bal")] == ["Hayvanlar"]
+        assert await db.search_knowledge("uykusuna") == []
+        assert len(await db.search_knowledge("güneş")) == 2
+
+        async with db.pool.reader() as conn:
+            cursor = await conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM learned_knowledge WHERE topic = ? ORDER BY confidence DESC",
+                ("Güneş",)
+            )
+            plan = " ".join(row[3] for row in await cursor.fetchall())
+            assert "idx_learned_knowledge_topic" in plan and "TEMP B-TREE" not in plan
+    finally:
+        await db.close()
+
+@pytest.mark.asyncio
+async def test_audio_blob_refcounts(tmp_path):
+    """Sesin blob deposunda tek kopya tutulduğunu ve referans sayılarının izlendiğini test eder"""
+    db = Database(str(tmp_path / "teddy.db"), blob_dir=str(tmp_path / "blobs"))
+    await db.initialize()
+    try:
+        audio = b"ID3" + os.urandom(1024)
+        await db.save_conversation("oturum", "mesaj 1", "yanıt 1", audio=audio)
+        await db.queue_conversation("oturum", "mesaj 2", "yanıt 2", audio=audio)
+        await db.writer.flush()
+        assert db.blobs.stats["stored"] == 1
+
+        history = await db.get_conversation_history("oturum")
+        digest = db.blobs.digest(audio)
+        assert {row["audio_blob"] for row in history} == {digest}
+
+        async with db.pool.reader() as conn:
+            cursor = await conn.execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,))
+            assert (await cursor.fetchone())[0] == 2
+
+        # Eski sürümlerin satır içi base64 sesi blob deposuna taşınır
+        async with db.pool.writer() as conn:
+            await conn.execute(
+                "INSERT INTO conversations (session_id, user_message, assistant_message, audio_path) "
+                "VALUES (?, ?, ?, ?)", ("oturum", "eski", "yanıt", base64.b64encode(b"eski ses").decode())
+            )
+            await conn.commit()
+        assert await db.migrate_inline_audio() == 1
+        assert (await db.get_conversation_history("oturum", limit=1))[0]["audio_blob"] == db.blobs.digest(b"eski ses")
+
+        # base64 olmayan eski değerler taşınmaz ve olduğu gibi kalır
+        async with db.pool.writer() as conn:
+            await conn.execute(
+                "INSERT INTO conversations (session_id, user_message, assistant_message, audio_path) "
+                "VALUES (?, ?, ?, ?)", ("eski", "mesaj", "yanıt", "data/audio/eski.mp3")
+            )
+            await conn.commit()
+        assert await db.migrate_inline_audio(batch_size=1) == 0
+        legacy = await db.get_conversation_history("eski")
+        assert legacy[0]["audio_path"] == "data/audio/eski.mp3" and legacy[0]["audio_blob"] is None
+
+        # Referansı kalmayan blob bekleme süresinden sonra silinir
+        async with db.pool.writer() as conn:
+            await conn.execute("DELETE FROM conversations WHERE session_id = ?", ("oturum",))
+            await conn.commit()
+        assert await db.collect_blobs(grace=3600) == 0
+        assert await db.collect_blobs(grace=0) == 2
+        assert db.blobs.stat(digest) is None
+        assert await db.backend.unreferenced_blobs(10) == []
+
+        # Kaydı hiç yazılmamış (ör. partisi düşen) blob dosyaları da bekleme süresinden sonra silinir
+        orphan = await db.blobs.put(b"sahipsiz ses")
+        kept = await db.store_audio(b"kayitli ses")
+        await db.save_conversation("oturum", "mesaj", "yanıt", audio=b"kayitli ses")
+        assert await db.sweep_orphan_blobs(grace=3600) == 0
+        assert await db.sweep_orphan_blobs(grace=0) == 1
+        assert db.blobs.stat(orphan) is None and db.blobs.stat(kept) is not None
+    finally:
+        await db.close()
+
+@pytest.mark.asyncio
+async def test_archive_conversations(tmp_path):
+    """Eski konuşmaların arşive taşındığını ve geçmişin iki katmandan kesintisiz okunduğunu test eder"""
+    db = Database(str(tmp_path / "teddy.db"), blob_dir=str(tmp_path / "blobs"),
+                  archive_dir=str(tmp_path / "archive"))
+    await db.initialize()
+    try:
+        audio = b"arsivlenen ses"
+        for i in range(30):
+            await db.save_conversation("oturum", f"mesaj {i}", f"yanıt {i}", audio=audio if i == 0 else None)
+            await db.save_conversation("diger", f"mesaj {i}", f"yanıt {i}")
+        expected = await db.get_conversation_history("oturum", limit=100)
+
+        # İlk 40 kayıt (her oturumdan 20) eskimiş sayılır
+        async with db.pool.writer() as conn:
+            await conn.execute(
+                "UPDATE conversations SET timestamp = datetime('now', '-40 days') WHERE id <= 40"
+            )
+            await conn.commit()
+
+        # Aynı dosyayı kullanan başka bir işçi kilidi tutarken arşivleme atlanır
+        other = create_backend(str(tmp_path / "teddy.db"))
+        async with other.job_lock("teddy_archive") as acquired:
+            assert acquired
+            assert await db.archive_conversations(max_age_days=30) == 0
+            async with other.job_lock("teddy_blob_gc") as acquired:
+                assert acquired
+
+        assert await db.archive_conversations(max_age_days=30, batch_size=15) == 40
+        assert await db.archive_conversations(max_age_days=30) == 0
+        async with db.pool.reader() as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM conversations")
+            assert (await cursor.fetchone())[0] == 20
+            cursor = await conn.execute("SELECT refcount FROM blobs WHERE digest = ?", (db.blobs.digest(audio),))
+            assert (await cursor.fetchone())[0] == 1
+        assert db.archive.stats["rows_written"] == 40
+
+        # Aynı aralık tekrar arşivlenirse yalnızca gerçekten silinen satırların sesi geri eklenir
+        await db.backend.archive_conversations([], list(range(1, 41)))
+        async with db.pool.reader() as conn:
+            cursor = await conn.execute("SELECT refcount FROM blobs WHERE digest = ?", (db.blobs.digest(audio),))
+            assert (await cursor.fetchone())[0] == 1
+
+        # Arşivde hâlâ kullanılan ses çöp toplayıcıdan korunur
+        assert await db.collect_blobs(grace=0) == 0
+
+        # Sayfalar sıcak tablodan arşive geçerken kesintisiz devam eder
+        db.history.clear()
+        pages, before = [], None
+        while True:
+            page = await db.get_conversation_history("oturum", limit=7, before=before)
+            pages += page
+            if len(page) < 7:
+                break
+            before = page[-1]["id"]
+        assert [row["id"] for row in pages] == [row["id"] for row in expected]
+        assert pages[-1]["user_message"] == "mesaj 0"
+        assert pages[-1]["audio_blob"] == db.blobs.digest(audio)
+        assert db.archive.stats["segments_read"] > 0
+    finally:
+        await db.close()
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_DSN"), reason="TEST_POSTGRES_DSN ayarlı değil")
+async def test_postgres_backend():
+    """Postgres arka ucunun aynı Database arayüzüyle çalıştığını test eder (geçici şemada)"""
+    import asyncpg
+
+    dsn = os.environ["TEST_POSTGRES_DSN"]
+    schema = f"teddy_test_{uuid.uuid4().hex[:8]}"
+    admin = await asyncpg.connect(dsn)
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    separator = "&" if "?" in dsn else "?"
+    db = Database(f"{dsn}{separator}search_path={schema}", blob_dir=tempfile.mkdtemp(),
+                  archive_dir=tempfile.mkdtemp())
+    try:
+        await db.initialize()
+        assert db.backend.name == "postgres"
+
+        row_id = await db.save_conversation("oturum", "mesaj", "yanıt")
+        assert row_id > 0
+
+        # Kuyruklanan kayıtlar COPY ile toplu yazılır
+        for i in range(25):
+            await db.queue_conversation("oturum", f"mesaj {i}", f"yanıt {i}")
+        await db.writer.flush()
+        assert db.writer.stats["written"] == 25
+
+        page = await db.get_conversation_history("oturum", limit=10)
+        assert [row["user_message"] for row in page[:2]] == ["mesaj 24", "mesaj 23"]
+        older = await db.get_conversation_history("oturum", limit=100, before=page[-1]["id"])
+        assert len(page) + len(older) == 26
+
+        await asyncio.gather(*[
+            db.update_user_profile("kullanici", interaction={f"k{i}": i}) for i in range(10)
+        ])
+        await db.profiles.flush()
+        await db.backend.upsert_user_profiles([("kullanici", {"dil": "tr"}, {"k0": "yeni"})])
+        profile = await admin.fetchrow(
+            f"SELECT interaction_history::text AS data FROM {schema}.user_profiles WHERE user_id = $1",
+            "kullanici"
+        )
+        data = json.loads(profile["data"])
+        assert len(data) == 10 and data["k0"] == "yeni"
+        assert (await db.backend.get_user_profile("kullanici"))["preferences"] == {"dil": "tr"}
+        await db.backend.upsert_user_profiles([("kullanici", {"voice": {"name": "x"}, "k": 1}, {})])
+        await db.backend.upsert_user_profiles([("kullanici", {"voice": {"rate": 2}, "k": None}, {})])
+        assert (await db.backend.get_user_profile("kullanici"))["preferences"] == {
+            "dil": "tr", "voice": {"rate": 2}, "k": None
+        }
+
+        await db.add_learned_knowledge("konu", "içerik", confidence=0.5)
+        assert len(await db.get_learned_knowledge("konu")) == 1
+
+        # COPY ile yazılan satırlar da blob referansı sayar
+        await db.queue_conversation("sesli", "mesaj", "yanıt", audio=b"ses")
+        await db.queue_conversation("sesli", "mesaj", "yanıt", audio=b"ses")
+        await db.writer.flush()
+        refcount = await admin.fetchval(
+            f"SELECT refcount FROM {schema}.blobs WHERE digest = $1", db.blobs.digest(b"ses")
+        )
+        assert refcount == 2
+        await admin.execute(f"DELETE FROM {schema}.conversations WHERE session_id = 'sesli'")
+        assert await db.backend.unreferenced_blobs(10) == [db.blobs.digest(b"ses")]
+        assert await db.backend.existing_blobs([db.blobs.digest(b"ses"), "0" * 64]) == {db.blobs.digest(b"ses")}
+        assert await db.backend.get_inline_audio(10, 0) == []
+
+        # Arşivlenen kayıtlar geçmişte okunmaya devam eder
+        await admin.execute(
+            f"UPDATE {schema}.conversations SET timestamp = now() - interval '40 days' WHERE session_id = 'oturum'"
+        )
+        # Kilit başka bir işçideyken arşivleme atlanır
+        async with db.backend.job_lock("teddy_archive") as acquired:
+            assert acquired
+            assert await db.archive_conversations(max_age_days=30) == 0
+        assert await db.archive_conversations(max_age_days=30) == 26
+        db.history.clear()
+        archived = await db.get_conversation_history("oturum", limit=100)
+        assert len(archived) == 26 and archived[0]["user_message"] == "mesaj 24"
+
+        await seed_knowledge(db)
+        results = await db.search_knowledge("güneş")
+        assert len(results) == 3 and results[-1]["topic"] == "Gezegenler"
+        assert [r["source"] for r in await db.search_knowledge("güneş", source="web")] == ["web"]
+        assert len(await db.search_knowledge("güneş", min_confidence=0.5, limit=1, offset=1)) == 1
+        # Aksanlar SQLite'taki gibi katlanır
+        assert [r["topic"] for r in await db.search_knowledge("gunes", min_confidence=0.5)] == \
+            ["Güneş sistemi", "Gezegenler"]
+    finally:
+        await db.close()
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
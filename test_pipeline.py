@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from pipeline import MessagePipeline
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def make_handler(sent, delay, name, running=None):
+    async def handler(turn):
+        if running is not None:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(delay)
+        if running is not None:
+            running["now"] -= 1
+        await turn.wait()
+        sent.append(name)
+    return handler
+
+@pytest.mark.asyncio
+async def test_pipeline_limits_concurrency_without_head_of_line_blocking():
+    """Hızlı mesajın yavaş mesajı beklemediğini ve eşzamanlılık sınırını test eder"""
+    pipeline = MessagePipeline(max_inflight=2)
+    sent, running = [], {"now": 0, "max": 0}
+
+    await pipeline.submit(make_handler(sent, 0.1, "video", running))
+    await pipeline.submit(make_handler(sent, 0.01, "text", running))
+    await pipeline.submit(make_handler(sent, 0.01, "text2", running))
+    await pipeline.drain()
+
+    assert sent[0] == "text"
+    assert sent[-1] == "video"
+    assert running["max"] == 2
+    assert pipeline.inflight == 0
+
+@pytest.mark.asyncio
+async def test_pipeline_ordered_delivery_survives_errors():
+    """Sıralı modda yanıtların geliş sırasıyla gönderildiğini ve hatanın sırayı kilitlemediğini test eder"""
+    pipeline = MessagePipeline(max_inflight=4, ordered=True)
+    sent = []
+
+    async def failing(turn):
+        await asyncio.sleep(0.02)
+        raise RuntimeError("hata")
+
+    await pipeline.submit(make_handler(sent, 0.05, "video"))
+    await pipeline.submit(failing)
+    await pipeline.submit(make_handler(sent, 0.0, "text"))
+    await pipeline.drain()
+
+    assert sent == ["video", "text"]
+
+@pytest.mark.asyncio
+async def test_pipeline_cancel():
+    """Bağlantı kapanınca bekleyen mesajların iptal edildiğini test eder"""
+    pipeline = MessagePipeline(max_inflight=2)
+    sent = []
+    await pipeline.submit(make_handler(sent, 10, "video"))
+    await pipeline.cancel()
+    assert sent == [] and pipeline.inflight == 0
@@ -0,0 +1,46 @@
+import pytest
+from protocol import HEADER, MAGIC, VERSION, FrameKind, ProtocolError, decode_frame, encode_frame, frame_to_message
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_frame_round_trip():
+    """Çerçevenin başlık, meta ve ham yükü kayıpsız taşıdığını test eder"""
+    payload = bytes(range(256)) * 4
+    frame = encode_frame(FrameKind.RESPONSE, {"text": "Merhaba", "type": "response"}, payload)
+
+    kind, meta, body = decode_frame(frame)
+    assert kind == FrameKind.RESPONSE
+    assert meta == {"text": "Merhaba", "type": "response"}
+    assert bytes(body) == payload
+
+def test_frame_to_message():
+    """İstemci çerçevelerinin JSON mesajlarıyla aynı sözlüğe çevrildiğini test eder"""
+    message = frame_to_message(encode_frame(FrameKind.AUDIO, {"stream": True}, b"RIFF"))
+    assert message == {"type": "audio", "content": b"RIFF", "stream": True}
+
+    message = frame_to_message(encode_frame(FrameKind.TEXT, payload="Günaydın".encode()))
+    assert message == {"type": "text", "content": "Günaydın"}
+
+    # Sunucu çerçeveleri istemciden kabul edilmez
+    with pytest.raises(ProtocolError):
+        frame_to_message(encode_frame(FrameKind.RESPONSE))
+
+def test_invalid_frames():
+    """Bozuk çerçevelerin ProtocolError ile reddedildiğini test eder"""
+    frame = encode_frame(FrameKind.VIDEO, payload=b"webm")
+    with pytest.raises(ProtocolError):
+        decode_frame(frame[:4])
+    with pytest.raises(ProtocolError):
+        decode_frame(frame[:-1])
+    with pytest.raises(ProtocolError):
+        decode_frame(b"XX" + frame[2:])
+    with pytest.raises(ProtocolError):
+        frame_to_message(encode_frame(FrameKind.TEXT, payload=b"\xff\xfe"))
+
+    # Meta verisi bozuk JSON ya da nesne olmayan JSON olamaz
+    for meta in (b"{bozuk", b"[1, 2]", b"\xff"):
+        frame = HEADER.pack(MAGIC, VERSION, int(FrameKind.TEXT), len(meta), 0) + meta
+        with pytest.raises(ProtocolError):
+            frame_to_message(frame)
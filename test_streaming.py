@@ -0,0 +1,119 @@
+import base64
+import edge_tts
+import pytest
+from config import Config
+from protocol import FrameKind, decode_frame
+from tts_cache import TTSCache
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FakeCommunicate:
+    """Sabit parçalar üreten sahte edge_tts.Communicate; fail_after verilirse akış yarıda kesilir"""
+    chunks = [b"abc", b"def", b"gh"]
+    fail_after = None
+    calls = 0
+
+    def __init__(self, text, voice):
+        self.text = text
+        FakeCommunicate.calls += 1
+
+    async def stream(self):
+        for i, data in enumerate(self.chunks):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ConnectionError("bağlantı koptu")
+            yield {"type": "WordBoundary", "offset": i}
+            yield {"type": "audio", "data": data}
+
+class FakeConnection:
+    """Gönderilen mesajları sırayla kaydeden sahte bağlantı"""
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        kind, meta, payload = decode_frame(data)
+        self.sent.append({"kind": kind, **meta, "payload": bytes(payload)})
+
+class FakeDatabase:
+    def __init__(self):
+        self.saved = []
+
+    async def queue_conversation(self, session_id, user_message, assistant_message,
+                                 audio=None, video_path=None):
+        self.saved.append((session_id, user_message, assistant_message, audio))
+
+@pytest.fixture
+def web(tmp_path, monkeypatch):
+    import web
+    monkeypatch.setattr(edge_tts, "Communicate", FakeCommunicate)
+    monkeypatch.setattr(FakeCommunicate, "calls", 0)
+    monkeypatch.setattr(web.agent, "tts_cache", TTSCache(str(tmp_path)))
+    monkeypatch.setattr(web, "db", FakeDatabase())
+    monkeypatch.setattr(Config, "TTS_STREAM_CHUNK_SIZE", 4)
+    monkeypatch.setattr(Config, "TTS_STREAM_CACHE_MAX_BYTES", 1024)
+    return web
+
+def chunks(sent):
+    return [base64.b64decode(m["data"]) for m in sent if m["type"] == "audio_chunk"]
+
+@pytest.mark.asyncio
+async def test_stream_order_and_cache_replay(web):
+    """Parçaların sırayla gönderildiğini ve ikinci istekte önbellekten yeniden oynatıldığını test eder"""
+    connection = FakeConnection()
+    assert await web.stream_audio(connection, "merhaba", request_id=7) == b"abcdefgh"
+
+    types = [m["type"] for m in connection.sent]
+    assert types == ["audio_start", "audio_chunk", "audio_chunk", "audio_chunk", "audio_end"]
+    assert [m["seq"] for m in connection.sent[1:-1]] == [0, 1, 2]
+    assert chunks(connection.sent) == [b"abc", b"def", b"gh"]
+    assert len({m["stream_id"] for m in connection.sent}) == 1
+    assert connection.sent[-1] == {**connection.sent[-1], "id": 7, "chunks": 3, "status": "ok"}
+
+    # Tamamlanan akış önbelleğe yazıldı; tekrar sentezlenmez, TTS_STREAM_CHUNK_SIZE ile bölünür
+    replay = FakeConnection()
+    assert await web.stream_audio(replay, "merhaba") == b"abcdefgh"
+    assert FakeCommunicate.calls == 1
+    assert chunks(replay.sent) == [b"abcd", b"efgh"]
+    assert replay.sent[-1]["status"] == "ok"
+
+@pytest.mark.asyncio
+async def test_stream_binary_frames(web):
+    """İkili protokolde parçaların AUDIO_CHUNK çerçeveleriyle taşındığını test eder"""
+    connection = FakeConnection()
+    await web.stream_audio(connection, "merhaba", binary=True, request_id=1)
+    frames = [m for m in connection.sent if m.get("kind") == FrameKind.AUDIO_CHUNK]
+    assert [(m["seq"], m["payload"]) for m in frames] == [(0, b"abc"), (1, b"def"), (2, b"gh")]
+    assert connection.sent[-1]["type"] == "audio_end" and connection.sent[-1]["chunks"] == 3
+
+@pytest.mark.asyncio
+async def test_stream_cache_cutoff(web, monkeypatch):
+    """TTS_STREAM_CACHE_MAX_BYTES'ı aşan kliplerin gönderildiğini ama önbelleğe alınmadığını test eder"""
+    monkeypatch.setattr(Config, "TTS_STREAM_CACHE_MAX_BYTES", 5)
+    connection = FakeConnection()
+    assert await web.stream_audio(connection, "uzun yanıt") is None
+    assert chunks(connection.sent) == [b"abc", b"def", b"gh"]
+    assert connection.sent[-1]["status"] == "ok"
+    assert await web.agent.tts_cache.get(web.agent.voice, "uzun yanıt") is None
+
+@pytest.mark.asyncio
+async def test_stream_error_status(web, monkeypatch):
+    """Akış yarıda kesilirse audio_end'in hata durumu taşıdığını ve önbelleğe yazılmadığını test eder"""
+    monkeypatch.setattr(FakeCommunicate, "fail_after", 1)
+    connection = FakeConnection()
+    assert await web.stream_audio(connection, "kesik") is None
+    assert chunks(connection.sent) == [b"abc"]
+    assert connection.sent[-1]["status"] == "error" and connection.sent[-1]["chunks"] == 1
+    assert await web.agent.tts_cache.get(web.agent.voice, "kesik") is None
+
+@pytest.mark.asyncio
+async def test_streamed_turn_saves_audio(web):
+    """Akışlı yanıtın ses gönderildikten sonra birleştirilmiş klip ile kaydedildiğini test eder"""
+    connection = FakeConnection()
+    await web.process_message(connection, "istemci", {"type": "text", "content": "merhaba", "stream": True, "id": 3})
+    assert [m["type"] for m in connection.sent][:2] == ["response", "audio_start"]
+    assert connection.sent[0]["audio"] is None
+    assert web.db.saved == [("istemci", "merhaba", "merhaba", b"abcdefgh")]
@@ -0,0 +1,33 @@
+import time
+from tracing import SlowRequestLog, current_trace, span, start_trace
+import tracing
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_spans_accumulate_and_slow_log(monkeypatch):
+    """Aşama sürelerinin ize yazıldığını ve yavaş isteklerin tampona girdiğini test eder"""
+    log = SlowRequestLog(threshold_ms=5, size=2)
+    monkeypatch.setattr(tracing, "slow_log", log)
+
+    # İz yokken span sessizce çalışır
+    with span("parse"):
+        pass
+    assert current_trace() is None
+
+    with start_trace("text", "istemci") as trace:
+        with span("tts"):
+            time.sleep(0.01)
+        with span("tts"):
+            pass
+        assert current_trace() is trace
+    assert current_trace() is None
+    assert set(trace.timings()) == {"tts", "total"}
+    assert trace.timings()["tts"] >= 10
+
+    with start_trace("hizli"):
+        pass
+
+    slowest = log.snapshot()
+    assert [item["name"] for item in slowest] == ["text"]
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import time
+import pytest
+from tts_cache import TTSCache
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VOICE = "tr-TR-AhmetNeural"
+
+@pytest.mark.asyncio
+async def test_memory_and_disk_tiers(tmp_path):
+    """Bellek katmanının LRU, disk katmanının boyut sınırlı çalıştığını test eder"""
+    cache = TTSCache(str(tmp_path), memory_max_bytes=20, disk_max_bytes=30)
+
+    assert await cache.get(VOICE, "merhaba") is None
+    await cache.put(VOICE, "merhaba", b"a" * 10)
+    await cache.put(VOICE, "selam", b"b" * 10)
+    assert await cache.get(VOICE, "merhaba") == b"a" * 10
+
+    # Bellek sınırı aşılınca en az kullanılan ("selam") bellekten düşer, diskten gelir
+    await cache.put(VOICE, "günaydın", b"c" * 10)
+    assert await cache.get(VOICE, "selam") == b"b" * 10
+    assert cache.stats["disk_hits"] == 1
+
+    # Disk sınırı aşılınca en eski dosya silinir
+    await cache.put(VOICE, "iyi geceler", b"d" * 10)
+    assert len(list(tmp_path.glob("*.mp3"))) == 3
+
+    # Yeni örnek diskteki girdileri görür; farklı ses farklı anahtardır
+    fresh = TTSCache(str(tmp_path), memory_max_bytes=20, disk_max_bytes=30)
+    assert await fresh.get(VOICE, "iyi geceler") == b"d" * 10
+    assert await fresh.get("tr-TR-EmelNeural", "iyi geceler") is None
+
+    stats = fresh.get_stats()
+    assert stats["disk_hits"] == 1 and stats["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_disk_access(tmp_path, monkeypatch):
+    """Eşzamanlı ilk okumaların ve aynı anahtarın yazımının disk indeksini bozmadığını test eder"""
+    scandir = os.scandir
+
+    def slow_scandir(path):
+        # Yarış penceresini genişlet: indeks yüklenirken diğer iş parçacıkları da gelir
+        time.sleep(0.02)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", slow_scandir)
+    (tmp_path / f"{TTSCache.make_key(VOICE, 'eski')}.mp3").write_bytes(b"e" * 10)
+    cache = TTSCache(str(tmp_path), memory_max_bytes=0, disk_max_bytes=1000)
+
+    await asyncio.gather(*[cache.get(VOICE, "eski") for _ in range(20)])
+    assert cache.get_stats()["disk_bytes"] == 10
+
+    await asyncio.gather(*[cache.put(VOICE, f"metin {i % 5}", b"x" * 10) for i in range(40)])
+    assert cache.get_stats()["disk_bytes"] == 60
+    assert len(list(tmp_path.glob("*.mp3"))) == 6
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,123 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import pytest
+from agent import Agent
+from config import Config
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def make_video(path, frame_count: int = 12) -> bytes:
+    """Her karesi farklı parlaklıkta küçük bir MJPG video üret"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for i in range(frame_count):
+        writer.write(np.full((48, 64, 3), i * 20, np.uint8))
+    writer.release()
+    return path.read_bytes()
+
+def test_decode_video_seeks_to_last_frame(tmp_path):
+    """Kare sayısı meta veriden okunup son karenin döndüğünü test eder"""
+    video = make_video(tmp_path / "klip.avi")
+    frame, count = Agent()._decode_video(video)
+    assert count == 12
+    assert abs(int(frame.mean()) - 11 * 20) <= 3
+
+def test_decode_video_stride_and_downscale(tmp_path, monkeypatch):
+    """Ardışık çözmede adım ve küçültme ayarlarının uygulandığını test eder"""
+    video = make_video(tmp_path / "klip.avi")
+    monkeypatch.setattr(Agent, "_seek_last_frame", staticmethod(lambda cap: (None, 0)))
+    monkeypatch.setattr(Config, "VIDEO_FRAME_STRIDE", 5)
+    monkeypatch.setattr(Config, "VIDEO_DOWNSCALE", 2)
+
+    frame, count = Agent()._decode_video(video)
+    assert count == 12
+    assert frame.shape[:2] == (24, 32)
+    # Son örneklenen kare 10. karedir
+    assert abs(int(frame.mean()) - 10 * 20) <= 3
+
+def test_decode_video_rejects_garbage():
+    """Çözülemeyen verinin hata verdiğini test eder"""
+    with pytest.raises(ValueError):
+        Agent()._decode_video(b"video degil")
+
+@pytest.mark.asyncio
+async def test_frame_store_dedup_and_retention(tmp_path):
+    """Aynı karenin tek dosyada tutulduğunu ve boyut sınırının uygulandığını test eder"""
+    from frame_store import FrameStore
+    store = FrameStore(str(tmp_path), max_bytes=10 ** 9, max_age=3600)
+    try:
+        frame = np.full((48, 64, 3), 100, np.uint8)
+        first = await store.save(frame)
+        second = await store.save(frame.copy())
+        assert first == second and first.startswith("frames/")
+        assert store.stats == {"saved": 1, "deduplicated": 1, "evicted": 0}
+
+        await store.save(np.full((48, 64, 3), 200, np.uint8))
+        assert len(list(tmp_path.glob("*.jpg"))) == 2
+
+        store.max_bytes = 1
+        store.sweep()
+        assert len(list(tmp_path.glob("*.jpg"))) == 0
+    finally:
+        store.executor.shutdown()
+
+def test_frame_store_dir_matches_static_mount():
+    """/static/frames'in karelerin yazıldığı FRAME_STORE_DIR dizininden sunulduğunu test eder"""
+    import web
+    assert web.agent.frame_store.directory == Config.FRAME_STORE_DIR
+    mount = next(route for route in web.app.routes if getattr(route, "path", None) == "/static/frames")
+    assert mount.app.directory == Config.FRAME_STORE_DIR
+
+def test_frame_store_temp_files_and_races(tmp_path, monkeypatch):
+    """Yarıda kalan yazımların geçici dosya bırakmadığını, eski .tmp'lerin süpürüldüğünü ve sayaçların tutarlı kaldığını test eder"""
+    from frame_store import FrameStore
+    store = FrameStore(str(tmp_path), max_bytes=10 ** 9, max_age=3600)
+    try:
+        replace = os.replace
+
+        def failing_replace(src, dst):
+            raise OSError("disk dolu")
+
+        monkeypatch.setattr(os, "replace", failing_replace)
+        with pytest.raises(OSError):
+            store._save_sync(np.full((8, 8, 3), 1, np.uint8))
+        assert list(tmp_path.iterdir()) == []
+        monkeypatch.setattr(os, "replace", replace)
+
+        # Temizlik, varlık kontrolü ile zaman damgası tazeleme arasında kareyi silerse kare yeniden yazılır
+        frame = np.full((8, 8, 3), 2, np.uint8)
+        name = store._save_sync(frame).split("/", 1)[1]
+        utime = os.utime
+
+        def deleted_before_utime(target, *args):
+            if os.path.exists(target):
+                os.unlink(target)
+            return utime(target, *args)
+
+        monkeypatch.setattr(os, "utime", deleted_before_utime)
+        store._save_sync(frame)
+        monkeypatch.setattr(os, "utime", utime)
+        assert (tmp_path / name).exists()
+
+        stale, fresh = tmp_path / "eski.jpg.1.tmp", tmp_path / "yeni.jpg.2.tmp"
+        stale.write_bytes(b"x")
+        fresh.write_bytes(b"x")
+        old = time.time() - 3600
+        os.utime(stale, (old, old))
+        store.sweep()
+        assert not stale.exists() and fresh.exists()
+        assert store.stats["evicted"] == 0
+
+        frames = [np.full((8, 8, 3), i, np.uint8) for i in range(10, 60)]
+        monkeypatch.setattr(Config, "FRAME_STORE_SWEEP_EVERY", 10 ** 6)
+        saved = store.stats["saved"]
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(store._save_sync, frames))
+        assert store.stats["saved"] - saved == 50
+        assert store._saves_since_sweep == 50
+    finally:
+        store.executor.shutdown()
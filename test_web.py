@@ -0,0 +1,105 @@
+import httpx
+import pytest
+import pytest_asyncio
+from models import Database
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@pytest_asyncio.fixture
+async def client(tmp_path, monkeypatch):
+    """Geçici veritabanıyla web.app'e bağlı HTTP istemcisi (başlangıç olayları çalışmaz)"""
+    import web
+    db = Database(str(tmp_path / "teddy.db"), blob_dir=str(tmp_path / "blobs"),
+                  archive_dir=str(tmp_path / "archive"))
+    await db.initialize()
+    monkeypatch.setattr(web, "db", db)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=web.app),
+                                     base_url="http://test") as http:
+            http.db = db
+            yield http
+    finally:
+        await db.close()
+
+@pytest.mark.asyncio
+async def test_history_etag_and_not_modified(client):
+    """Değişmeyen geçmişin 304 ile, yeni kayıttan sonra yeni ETag ile döndüğünü test eder"""
+    await client.db.save_conversation("istemci", "merhaba", "selam", audio=b"ses")
+
+    response = await client.get("/history/istemci")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "no-cache"
+    entry = response.json()["history"][0]
+    assert entry["audio"]["url"] == f"/blobs/{entry['audio']['digest']}"
+    assert "audio_blob" not in entry and "audio_path" not in entry
+
+    response = await client.get("/history/istemci", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers["etag"] == etag
+
+    # Başka sayfa boyutu farklı gövde döndürdüğünden aynı ETag'i kullanmaz
+    response = await client.get("/history/istemci?limit=1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    await client.db.save_conversation("istemci", "nasılsın", "iyiyim")
+    response = await client.get("/history/istemci", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    assert [row["user_message"] for row in response.json()["history"]] == ["nasılsın", "merhaba"]
+
+@pytest.mark.asyncio
+async def test_blob_ranges_and_errors(client):
+    """Blob uç noktasının tam, kısmi (206), geçersiz aralık (416), 304 ve 404 yanıtlarını test eder"""
+    audio = bytes(range(256)) * 4
+    digest = await client.db.store_audio(audio)
+
+    response = await client.get(f"/blobs/{digest}")
+    assert response.status_code == 200 and response.content == audio
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"] == f'"{digest}"'
+    assert response.headers["content-type"] == "audio/mpeg"
+
+    response = await client.get(f"/blobs/{digest}", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206 and response.content == audio[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(audio)}"
+    assert response.headers["content-length"] == "10"
+
+    response = await client.get(f"/blobs/{digest}", headers={"Range": "bytes=-4"})
+    assert response.status_code == 206 and response.content == audio[-4:]
+
+    response = await client.get(f"/blobs/{digest}", headers={"Range": f"bytes={len(audio)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(audio)}"
+
+    response = await client.get(f"/blobs/{digest}", headers={"If-None-Match": f'"{digest}"'})
+    assert response.status_code == 304 and response.content == b""
+
+    assert (await client.get(f"/blobs/{'0' * 64}")).status_code == 404
+    assert (await client.get("/blobs/gecersiz")).status_code == 404
+
+@pytest.mark.asyncio
+async def test_knowledge_search_endpoint(client):
+    """Arama uç noktasının sayfalama, filtre ve yalnızca noktalama içeren sorgularla çalıştığını test eder"""
+    from test_models import seed_knowledge
+    await seed_knowledge(client.db)
+
+    first = (await client.get("/knowledge/search", params={"q": "güneş", "limit": 2})).json()
+    assert len(first["results"]) == 2 and first["next_offset"] == 2
+    rest = (await client.get("/knowledge/search", params={"q": "güneş", "limit": 2, "offset": 2})).json()
+    assert len(rest["results"]) == 1 and rest["next_offset"] is None
+    ids = [r["id"] for r in first["results"] + rest["results"]]
+    assert len(set(ids)) == 3
+
+    filtered = (await client.get("/knowledge/search", params={"q": "gunes", "min_confidence": 0.5})).json()
+    assert [r["topic"] for r in filtered["results"]] == ["Güneş sistemi", "Gezegenler"]
+    by_source = (await client.get("/knowledge/search", params={"q": "güneş", "source": "web"})).json()
+    assert [r["source"] for r in by_source["results"]] == ["web"]
+
+    punctuation = await client.get("/knowledge/search", params={"q": '"*?!'})
+    assert punctuation.status_code == 200
+    assert punctuation.json() == {"results": [], "next_offset": None}
+
+    assert (await client.get("/knowledge/search", params={"q": "güneş", "min_confidence": 2})).status_code == 422
+    assert (await client.get("/knowledge/search")).status_code == 422
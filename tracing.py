@@ -0,0 +1,90 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, ContextManager, Deque, Dict, Iterator, List, Optional
+from config import Config
+
+class Trace:
+    """Tek bir isteğin aşama sürelerini toplayan hafif iz"""
+    def __init__(self, name: str, client_id: Optional[str] = None):
+        self.name = name
+        self.client_id = client_id
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.total: Optional[float] = None
+
+    def add(self, name: str, duration: float) -> None:
+        """Aşama süresini ekle; aynı aşama tekrar ederse süreler toplanır"""
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    def finish(self) -> float:
+        self.total = time.perf_counter() - self._start
+        return self.total
+
+    def timings(self) -> Dict[str, float]:
+        """Milisaniye cinsinden aşama süreleri; total o ana kadar geçen süredir"""
+        total = self.total if self.total is not None else time.perf_counter() - self._start
+        result = {name: round(duration * 1000, 2) for name, duration in self.spans.items()}
+        result["total"] = round(total * 1000, 2)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "client_id": self.client_id,
+            "started_at": self.started_at,
+            "timings": self.timings()
+        }
+
+class SlowRequestLog:
+    """Eşiği aşan son isteklerin sabit boyutlu halka tamponu"""
+    def __init__(self, threshold_ms: Optional[float] = None, size: Optional[int] = None):
+        self.threshold_ms = threshold_ms if threshold_ms is not None else Config.TRACE_SLOW_MS
+        self._traces: Deque[Trace] = deque(maxlen=size or Config.TRACE_SLOW_BUFFER)
+
+    def record(self, trace: Trace) -> None:
+        if trace.total is not None and trace.total * 1000 >= self.threshold_ms:
+            self._traces.append(trace)
+
+    def snapshot(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Tampondaki istekleri en yavaştan başlayarak döndür"""
+        slowest = sorted(self._traces, key=lambda trace: trace.total, reverse=True)
+        return [trace.to_dict() for trace in slowest[:limit]]
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("teddy_trace", default=None)
+slow_log = SlowRequestLog()
+
+def current_trace() -> Optional[Trace]:
+    """Etkin izi döndür; iz yoksa None"""
+    return _current_trace.get()
+
+def start_trace(name: str, client_id: Optional[str] = None) -> ContextManager[Trace]:
+    """Yeni bir iz başlat; blok bitince süre kaydedilir ve yavaşsa tampona eklenir"""
+    return activate_trace(Trace(name, client_id))
+
+@contextmanager
+def activate_trace(trace: Trace) -> Iterator[Trace]:
+    """Önceden oluşturulmuş izi etkinleştir (örneğin başka bir görevde sürdürmek için)"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+        slow_log.record(trace)
+
+@contextmanager
+def span(name: str, histogram=None) -> Iterator[None]:
+    """Bloğun süresini etkin ize (ve verilirse Prometheus histogram'ına) yaz"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, duration)
+        if histogram is not None:
+            histogram.observe(duration)
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import Config
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class TTSCache:
+    """(ses, metin özeti) anahtarlı iki katmanlı TTS önbelleği: bellekte LRU, diskte boyut sınırlı"""
+    def __init__(self, cache_dir: Optional[str] = None, memory_max_bytes: Optional[int] = None,
+                 disk_max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or Config.TTS_CACHE_DIR
+        self.memory_max_bytes = memory_max_bytes if memory_max_bytes is not None else Config.TTS_CACHE_MEMORY_BYTES
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else Config.TTS_CACHE_DISK_BYTES
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_loaded = False
+        # Disk indeksi birden çok iş parçacığından (asyncio.to_thread) güncellenir
+        self._disk_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(voice: str, text: str) -> str:
+        """Ses ve metinden içerik adresli anahtar üret"""
+        return hashlib.sha256(f"{voice}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def _load_disk_index(self) -> None:
+        """Disk katmanındaki dosyaları en eskiden yeniye doğru indeksle (_disk_lock tutulurken çağrılır)"""
+        if self._disk_loaded:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._disk_loaded = True
+
+    def _remember(self, key: str, data: bytes) -> None:
+        """Bellek katmanına ekle, sınır aşılırsa en az kullanılanları çıkar"""
+        if len(data) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        with self._disk_lock:
+            self._load_disk_index()
+            if key not in self._disk:
+                return None
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._disk_lock:
+                size = self._disk.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+            return None
+        with self._disk_lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        return data
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        with self._disk_lock:
+            self._load_disk_index()
+            if key in self._disk or len(data) > self.disk_max_bytes:
+                return
+
+        # Yarım dosya okunmasın diye önce geçici dosyaya yaz, sonra yer değiştir;
+        # aynı anahtarı yazan iş parçacıkları farklı geçici dosya kullanır
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._disk_lock:
+            if key in self._disk:
+                return
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.disk_max_bytes:
+                evicted_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self.stats["evictions"] += 1
+                evicted.append(evicted_key)
+
+        for evicted_key in evicted:
+            try:
+                os.unlink(self._path(evicted_key))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, voice: str, text: str) -> Optional[bytes]:
+        """Önbellekteki sesi getir; yoksa None"""
+        key = self.make_key(voice, text)
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            CACHE_REQUESTS.labels("tts", "hit").inc()
+            return data
+
+        try:
+            data = await asyncio.to_thread(self._read_disk, key)
+        except Exception as e:
+            logger.error(f"TTS disk önbelleği okuma hatası: {str(e)}")
+            data = None
+
+        if data is None:
+            self.stats["misses"] += 1
+            CACHE_REQUESTS.labels("tts", "miss").inc()
+            return None
+
+        self.stats["disk_hits"] += 1
+        CACHE_REQUESTS.labels("tts", "hit").inc()
+        self._remember(key, data)
+        return data
+
+    async def put(self, voice: str, text: str, data: bytes) -> None:
+        """Sentezlenen sesi her iki katmana kaydet"""
+        if not data:
+            return
+        key = self.make_key(voice, text)
+        self._remember(key, data)
+        try:
+            await asyncio.to_thread(self._write_disk, key, data)
+        except Exception as e:
+            logger.error(f"TTS disk önbelleği yazma hatası: {str(e)}")
+
+    def get_stats(self) -> Dict[str, float]:
+        """İsabet/ıska istatistiklerini döndür"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": hits / total if total else 0.0,
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes
+        }
@@ -1,16 +1,31 @@
-from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from models import Database
+from models import Database, history_entry
 from agent import Agent
+from cache import cache, tiered_cache
+from cache_backends import RedisBackend
+from frame_store import ImmutableStaticFiles
+from blob_store import blob_response, etag_matches
+from metrics import ERRORS, MESSAGE_LATENCY, mark_process_dead, metrics_response
+from tracing import Trace, activate_trace, current_trace, slow_log, span
+from pipeline import MessagePipeline, Turn
+from connections import Connection, ConnectionManager
+from protocol import VERSION as PROTOCOL_VERSION, FrameKind, ProtocolError, encode_frame, frame_to_message
+from config import Config
 import logging
 import os
 import json
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
 import asyncio
+import base64
+import functools
+import hashlib
+import time
+import uuid
 from pathlib import Path
 
 # Dizin yolları
@@ -46,14 +61,17 @@ db = Database()
 agent = Agent()
 
 # WebSocket bağlantıları
-active_connections: Dict[str, WebSocket] = {}
+connections = ConnectionManager()
 
 # Dizinleri oluştur
-for directory in [STATIC_DIR, TEMPLATES_DIR, STATIC_DIR / "frames", BASE_DIR / "data"]:
-    directory.mkdir(exist_ok=True)
+FRAMES_DIR = Path(Config.FRAME_STORE_DIR)
+for directory in [STATIC_DIR, TEMPLATES_DIR, FRAMES_DIR, BASE_DIR / "data"]:
+    directory.mkdir(parents=True, exist_ok=True)
     logger.info(f"Dizin oluşturuldu/kontrol edildi: {directory}")
 
 # Statik dosyalar ve templates
+# Kareler içerik özetiyle adlandırıldığından süresiz önbelleklenebilir
+app.mount("/static/frames", ImmutableStaticFiles(directory=str(FRAMES_DIR)), name="frames")
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
@@ -62,11 +80,86 @@ async def startup_event():
     """Uygulama başlangıcında veritabanını ve agent'ı başlat"""
     try:
         await db.initialize()
+        cache.start()
+        connections.start()
+        if Config.CACHE_L2_ENABLED:
+            await tiered_cache.attach(RedisBackend())
+            # Geçmiş tamponları aynı pub/sub üzerinden işçiler arasında geçersiz kılınır
+            await db.history.attach(tiered_cache.l2)
+        elif Config.WEB_CONCURRENCY > 1:
+            db.history.enabled = False
+            logger.warning("Birden çok işçi L2 cache olmadan çalışıyor; geçmiş önbelleği kapatıldı")
+        await agent.executor.run(agent.frame_store.sweep)
+        # Sabit cümleler arka planda sentezlenir, başlangıcı geciktirmez
+        app.state.warmup_task = asyncio.create_task(agent.warmup())
+        # Satır içi eski sesler taşınır; referanssız blob'lar periyodik olarak temizlenir
+        app.state.migration_task = asyncio.create_task(migrate_audio())
+        app.state.blob_task = asyncio.create_task(blob_gc_loop())
+        if Config.ARCHIVE_AFTER_DAYS > 0:
+            app.state.archive_task = asyncio.create_task(archive_loop())
         logger.info("Uygulama başarıyla başlatıldı")
     except Exception as e:
         logger.error(f"Başlatma hatası: {str(e)}")
         raise
 
+async def migrate_audio():
+    """Eski satır içi sesleri blob deposuna taşı"""
+    try:
+        migrated = await db.migrate_inline_audio()
+        if migrated:
+            logger.info(f"{migrated} kayıt satır içi sesten blob deposuna taşındı")
+    except Exception as e:
+        logger.error(f"Ses taşıma hatası: {str(e)}")
+
+async def blob_gc_loop():
+    """Referansı kalmayan ve hiç kaydı olmayan blob dosyalarını periyodik olarak sil"""
+    await app.state.migration_task
+    while True:
+        try:
+            async with db.backend.job_lock("teddy_blob_gc") as acquired:
+                if acquired:
+                    collected = batch = await db.collect_blobs()
+                    while batch >= 1000:
+                        batch = await db.collect_blobs()
+                        collected += batch
+                    swept = await db.sweep_orphan_blobs()
+                    if collected or swept:
+                        logger.info(f"Blob temizliği: {collected} referanssız, {swept} kayıtsız blob silindi")
+        except Exception as e:
+            logger.error(f"Blob temizliği hatası: {str(e)}")
+        await asyncio.sleep(Config.BLOB_GC_INTERVAL_SECONDS)
+
+async def archive_loop():
+    """Eski konuşmaları periyodik olarak arşive taşı; sıcak tablo ve indeksleri sınırlı kalır"""
+    # Satır içi sesler taşınmadan arşivlenirse parçalarda kalır ve bir daha erişilemez
+    await app.state.migration_task
+    while True:
+        try:
+            archived = await db.archive_conversations()
+            if archived:
+                logger.info(f"{archived} konuşma arşive taşındı")
+        except Exception as e:
+            logger.error(f"Arşivleme hatası: {str(e)}")
+        await asyncio.sleep(Config.ARCHIVE_INTERVAL_SECONDS)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Uygulama kapanırken veritabanı bağlantılarını kapat"""
+    await connections.stop()
+    for name in ("archive_task", "blob_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    await db.close()
+    await cache.stop()
+    await db.history.detach()
+    await tiered_cache.detach()
+    agent.executor.shutdown()
+    # Çok süreçli modda bu işçinin bağlantı ve kuyruk göstergeleri toplamdan düşülür
+    mark_process_dead()
+    logger.info("Uygulama kapatıldı")
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Ana sayfa"""
@@ -89,53 +182,168 @@ async def home(request: Request):
             content={"error": f"Sayfa yüklenemedi: {str(e)}"}
         )
 
-async def process_message(websocket: WebSocket, client_id: str, message_data: Dict[str, Any]) -> None:
-    """Gelen mesajı işle ve yanıt gönder"""
+async def send_response(websocket: Connection, response: Dict[str, Any], binary: bool = False) -> None:
+    """Yanıtı gönder; ikili protokolde ses JSON yerine ham bayt olarak taşınır"""
+    audio = response.get("audio")
+    if binary and isinstance(audio, bytes):
+        meta = {key: value for key, value in response.items() if key != "audio"}
+        await websocket.send_bytes(encode_frame(FrameKind.RESPONSE, meta, audio))
+    else:
+        await websocket.send_json(response)
+
+async def stream_audio(websocket: Connection, text: str, binary: bool = False,
+                       request_id: Any = None) -> Optional[bytes]:
+    """Yanıt sesini parçalar halinde gönder (audio_start, audio_chunk..., audio_end)
+
+    Akış tamamlanırsa birleştirilmiş klibi döndürür; TTS_STREAM_CACHE_MAX_BYTES
+    sınırını aşan ya da yarıda kalan akışlarda None döner.
+    """
+    stream_id = uuid.uuid4().hex
+    seq = 0
+    status = "ok"
+    parts: Optional[List[bytes]] = []
+    size = 0
+    await websocket.send_json({
+        "type": "audio_start",
+        "id": request_id,
+        "stream_id": stream_id,
+        "format": "audio/mpeg"
+    })
+    try:
+        async for chunk in agent.stream_speech(text):
+            if parts is not None:
+                size += len(chunk)
+                if size > Config.TTS_STREAM_CACHE_MAX_BYTES:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            if binary:
+                await websocket.send_bytes(encode_frame(
+                    FrameKind.AUDIO_CHUNK,
+                    {"id": request_id, "stream_id": stream_id, "seq": seq},
+                    chunk
+                ))
+                seq += 1
+                continue
+            await websocket.send_json({
+                "type": "audio_chunk",
+                "id": request_id,
+                "stream_id": stream_id,
+                "seq": seq,
+                "data": base64.b64encode(chunk).decode()
+            })
+            seq += 1
+    except Exception as e:
+        logger.error(f"Ses akışı hatası: {str(e)}")
+        status = "error"
+    await websocket.send_json({
+        "type": "audio_end",
+        "id": request_id,
+        "stream_id": stream_id,
+        "chunks": seq,
+        "status": status
+    })
+    if status != "ok" or not parts:
+        return None
+    return b"".join(parts)
+
+async def save_turn(client_id: str, user_message: str, response: Dict[str, Any],
+                    audio: Optional[Union[bytes, str]]) -> None:
+    """Konuşmayı kaydet; ses blob deposuna yazılır, satırda yalnızca özeti tutulur"""
+    with span("db_enqueue"):
+        await db.queue_conversation(
+            client_id,
+            user_message,
+            response["text"],
+            audio=audio,
+            video_path=response.get("video")
+        )
+
+async def process_message(websocket: Connection, client_id: str, message_data: Dict[str, Any],
+                          binary: bool = False, turn: Optional[Turn] = None) -> None:
+    """Gelen mesajı işle ve yanıt gönder; yanıtlar mesajın id'sini taşır"""
+    start_time = time.perf_counter()
+    message_type = message_data.get("type")
+    request_id = message_data.get("id")
+    turn = turn or Turn()
     try:
-        message_type = message_data.get("type")
         content = message_data.get("content")
+        # stream=true ise ses yanıtın içinde değil, ardından parça parça gönderilir
+        stream = bool(message_data.get("stream"))
+        # timings=true ise yanıta aşama süreleri eklenir
+        want_timings = bool(message_data.get("timings"))
 
         if not content:
             raise ValueError("Mesaj içeriği boş")
 
         # Mesaj türüne göre işle
         if message_type == "text":
-            response = await agent.get_response(content)
+            response = await agent.get_response(content, synthesize=not stream, raw_audio=binary)
         elif message_type == "audio":
-            response = await agent.process_audio(content)
+            response = await agent.process_audio(
+                content, synthesize=not stream, raw_audio=binary, client_id=client_id
+            )
         elif message_type == "video":
-            response = await agent.process_video(content)
+            response = await agent.process_video(
+                content, synthesize=not stream, raw_audio=binary, client_id=client_id
+            )
         else:
             raise ValueError(f"Geçersiz mesaj türü: {message_type}")
 
-        # Konuşmayı kaydet
-        if response.get("type") != "error":
-            await db.save_conversation(
-                client_id,
-                content if message_type == "text" else response.get("transcription", ""),
-                response["text"],
-                audio_path=response.get("audio"),
-                video_path=response.get("video")
-            )
+        user_message = content if message_type == "text" else response.get("transcription", "")
+        # Akışlı yanıtlar ses gönderildikten sonra, birleştirilen klip ile kaydedilir
+        if response.get("type") != "error" and not stream:
+            await save_turn(client_id, user_message, response, response.get("audio"))
+
+        response["id"] = request_id
+
+        # Sıralı modda önceki mesajın yanıtları bitene kadar beklenir
+        with span("ordering"):
+            await turn.wait()
+
+        trace = current_trace()
+        if want_timings and trace is not None:
+            response["timings"] = trace.timings()
 
         # Yanıtı gönder
-        await websocket.send_json(response)
+        with span("send"):
+            await send_response(websocket, response, binary)
+
+        if stream and response.get("type") != "error":
+            with span("stream"):
+                audio = await stream_audio(websocket, response["text"], binary, request_id)
+            await save_turn(client_id, user_message, response, audio)
 
     except Exception as e:
+        ERRORS.labels("message").inc()
         logger.error(f"Mesaj işleme hatası: {str(e)}")
         error_response = {
             "type": "error",
+            "id": request_id,
             "text": "İşlem sırasında bir hata oluştu.",
             "details": str(e)
         }
+        await turn.wait()
         await websocket.send_json(error_response)
+    finally:
+        turn.release()
+        label = message_type if message_type in ("text", "audio", "video") else "invalid"
+        MESSAGE_LATENCY.labels(label).observe(time.perf_counter() - start_time)
+
+async def handle_message(websocket: Connection, client_id: str, message_data: Dict[str, Any],
+                         binary: bool, trace: Trace, turn: Turn) -> None:
+    """Mesajı okuma döngüsünde başlatılan iz altında işle"""
+    with activate_trace(trace):
+        await process_message(websocket, client_id, message_data, binary, turn)
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     """WebSocket bağlantı noktası"""
+    connection: Optional[Connection] = None
+    pipeline: Optional[MessagePipeline] = None
     try:
-        await websocket.accept()
-        active_connections[client_id] = websocket
+        # Aynı client_id ile açık eski bağlantı varsa kapatılır
+        connection = await connections.connect(client_id, websocket)
         
         # Kullanıcı profilini güncelle
         await db.update_user_profile(
@@ -145,46 +353,106 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
         
         logger.info(f"Yeni WebSocket bağlantısı: {client_id}")
         
+        # İstemci {"type": "hello", "protocol": "binary"} gönderene kadar JSON kullanılır
+        binary = False
+        # Okuma döngüsü beklemeden sonraki mesajı alır; mesajlar hatta eşzamanlı işlenir.
+        # {"type": "hello", "ordered": true} ile yanıtlar geliş sırasıyla gönderilir
+        pipeline = MessagePipeline()
+        next_id = 0
+        
         while True:
             try:
-                # Mesajı al ve işle
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
-                await process_message(websocket, client_id, message_data)
+                # Mesajı al
+                message = await connection.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+
+                # İz, mesaj alındıktan sonra başlar; bekleme süresi sayılmaz
+                trace = Trace("message", client_id)
+                parse_start = time.perf_counter()
+                if message.get("bytes") is not None:
+                    message_data = frame_to_message(message["bytes"])
+                else:
+                    message_data = json.loads(message["text"])
+                trace.add("parse", time.perf_counter() - parse_start)
+                trace.name = str(message_data.get("type"))
+
+                if message_data.get("type") == "pong":
+                    # Nabız yanıtı; son görülme zamanı receive() içinde güncellendi
+                    continue
+
+                if message_data.get("type") == "hello":
+                    binary = message_data.get("protocol") == "binary"
+                    pipeline.ordered = bool(message_data.get("ordered"))
+                    # {"heartbeat": true}: istemci ping'lere pong ile yanıt verir, sessiz kalırsa kapatılır
+                    connection.heartbeat = bool(message_data.get("heartbeat"))
+                    await connection.send_json({
+                        "type": "hello",
+                        "protocol": "binary" if binary else "json",
+                        "version": PROTOCOL_VERSION,
+                        "ordered": pipeline.ordered,
+                        "heartbeat": connection.heartbeat,
+                        "max_inflight": pipeline.max_inflight
+                    })
+                    continue
+
+                # İstemci id göndermezse yanıtlar bağlantıdaki sıra numarasını taşır
+                next_id += 1
+                message_data.setdefault("id", next_id)
+                await pipeline.submit(functools.partial(
+                    handle_message, connection, client_id, message_data, binary, trace
+                ))
                 
             except WebSocketDisconnect:
                 logger.info(f"WebSocket bağlantısı kapandı: {client_id}")
                 break
                 
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON ayrıştırma hatası: {str(e)}")
-                await websocket.send_json({
+            except (json.JSONDecodeError, ProtocolError) as e:
+                logger.error(f"Mesaj ayrıştırma hatası: {str(e)}")
+                await connection.send_json({
                     "type": "error",
                     "text": "Geçersiz mesaj formatı"
                 })
                 
             except Exception as e:
                 logger.error(f"WebSocket hatası: {str(e)}")
-                await websocket.send_json({
+                await connection.send_json({
                     "type": "error",
                     "text": "Beklenmeyen bir hata oluştu"
                 })
     
     finally:
-        # Bağlantıyı temizle
-        if client_id in active_connections:
-            del active_connections[client_id]
-        try:
-            await websocket.close()
-        except:
-            pass
+        # Bağlantıyı temizle; istemci gittiği için yarım kalan mesajlar iptal edilir
+        if pipeline is not None:
+            await pipeline.cancel()
+        if connection is not None:
+            await connections.disconnect(connection)
+
+def history_etag(history: List[Dict[str, Any]], limit: int) -> str:
+    """Sayfanın içeriğinden türetilen ETag; kayıtlar yalnızca eklenir, ses referansı taşınabilir"""
+    digest = hashlib.sha1(str(limit).encode())
+    for row in history:
+        digest.update(f"{row['id']}:{row.get('audio_blob')};".encode())
+    return f'W/"{digest.hexdigest()}"'
 
 @app.get("/history/{client_id}")
-async def get_history(client_id: str):
-    """Konuşma geçmişini getir"""
+async def get_history(
+    request: Request,
+    response: Response,
+    client_id: str,
+    before: Optional[int] = Query(None, ge=1),
+    limit: int = Query(Config.HISTORY_PAGE_SIZE, ge=1, le=Config.HISTORY_MAX_PAGE_SIZE)
+):
+    """Konuşma geçmişini sayfa sayfa getir (before: önceki sayfanın imleci)"""
     try:
-        history = await db.get_conversation_history(client_id)
-        return {"history": history}
+        history = await db.get_conversation_history(client_id, limit=limit, before=before)
+        # İstemci her seferinde doğrulasın; değişmeyen geçmiş için gövde gönderilmez
+        headers = {"ETag": history_etag(history, limit), "Cache-Control": "no-cache"}
+        if etag_matches(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        next_before = history[-1]["id"] if len(history) == limit else None
+        return {"history": [history_entry(row) for row in history], "next_before": next_before}
     except Exception as e:
         logger.error(f"Geçmiş alınırken hata: {str(e)}")
         return JSONResponse(
@@ -192,14 +460,57 @@ async def get_history(client_id: str):
             content={"error": f"Geçmiş alınamadı: {str(e)}"}
         )
 
+@app.get("/blobs/{digest}")
+async def get_blob(digest: str, request: Request):
+    """Konuşma sesini getir; Range başlığıyla kısmi içerik (206) desteklenir"""
+    return await blob_response(db.blobs, digest, request)
+
+@app.get("/knowledge/search")
+async def search_knowledge(
+    q: str = Query(..., min_length=1),
+    min_confidence: float = Query(0.0, ge=0.0, le=1.0),
+    source: Optional[str] = None,
+    limit: int = Query(Config.KNOWLEDGE_PAGE_SIZE, ge=1, le=Config.KNOWLEDGE_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0)
+):
+    """Öğrenilen bilgilerde alaka sırasına göre tam metin arama"""
+    try:
+        results = await db.search_knowledge(q, min_confidence, source, limit, offset)
+        next_offset = offset + limit if len(results) == limit else None
+        return {"results": results, "next_offset": next_offset}
+    except Exception as e:
+        logger.error(f"Bilgi araması hatası: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Arama yapılamadı: {str(e)}"}
+        )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrikleri"""
+    body, content_type = metrics_response()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/debug/slow")
+async def slow_requests(limit: int = Query(20, ge=1, le=Config.TRACE_SLOW_BUFFER)):
+    """Son yavaş isteklerin aşama süreleri (en yavaştan başlayarak)"""
+    return {
+        "threshold_ms": slow_log.threshold_ms,
+        "requests": slow_log.snapshot(limit)
+    }
+
 @app.get("/health")
 async def health_check():
     """Sağlık kontrolü"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "connections": len(active_connections),
+        "connections": len(connections),
+        "websocket": connections.get_stats(),
         "agent_status": "active",
+        "tts_cache": agent.tts_cache.get_stats(),
+        "cache": {**cache.get_stats(), **tiered_cache.stats},
+        "history_cache": db.history.cache.get_stats(),
         "templates_dir": str(TEMPLATES_DIR),
         "static_dir": str(STATIC_DIR)
     } 
\ No newline at end of file
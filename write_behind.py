@@ -0,0 +1,233 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+from cache import SimpleCache
+from config import Config
+from db_backends import ConversationRow, DatabaseBackend, ProfileRow
+from metrics import DB_DURATION, ERRORS, QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+class ConversationWriter:
+    """Konuşma kayıtlarını kuyruklayıp tek işlemde toplu yazan arka plan yazıcısı"""
+    def __init__(self, backend: DatabaseBackend, batch_size: Optional[int] = None,
+                 flush_interval_ms: Optional[int] = None, max_queue: Optional[int] = None,
+                 on_write: Optional[Callable[[List[ConversationRow], Optional[List[Dict]]], None]] = None):
+        self.backend = backend
+        # Parti yazıldıktan sonra (parti, yazılan kayıtlar ya da None) ile çağrılır
+        self.on_write = on_write
+        self.batch_size = max(1, batch_size or Config.WRITE_BATCH_SIZE)
+        self.flush_interval = (flush_interval_ms or Config.WRITE_FLUSH_INTERVAL_MS) / 1000
+        self.max_queue = max_queue or Config.WRITE_QUEUE_SIZE
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"written": 0, "batches": 0, "dropped": 0}
+
+    @property
+    def pending(self) -> int:
+        """Henüz yazılmamış kayıt sayısı"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        """Arka plan yazma görevini başlat"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, row: ConversationRow) -> None:
+        """Kaydı kuyruğa ekle; kuyruk doluysa yer açılana kadar bekle"""
+        if self._task is None:
+            raise RuntimeError("Konuşma yazıcısı başlatılmadı")
+        await self._queue.put(row)
+        QUEUE_DEPTH.labels("write_behind").inc()
+
+    async def flush(self) -> None:
+        """Kuyruktaki tüm kayıtlar yazılana kadar bekle"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        """Bekleyen kayıtları yaz ve görevi durdur"""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _collect(self) -> List[ConversationRow]:
+        """Bir sonraki partiyi topla: batch_size kayıt ya da flush_interval süresi"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _write(self, batch: List[ConversationRow]) -> None:
+        """Partiyi tek bir işlemde yaz, hata olursa birkaç kez tekrar dene"""
+        for attempt in range(1, Config.MAX_RETRIES + 1):
+            try:
+                with DB_DURATION.labels("write_batch").time():
+                    inserted = await self.backend.insert_conversations(batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                self._notify(batch, inserted)
+                return
+            except Exception as e:
+                ERRORS.labels("db_write").inc()
+                logger.error(f"Toplu yazma hatası (deneme {attempt}): {str(e)}")
+                await asyncio.sleep(0.1 * attempt)
+
+        self.stats["dropped"] += len(batch)
+        logger.error(f"{len(batch)} konuşma kaydı yazılamadı ve atıldı")
+
+    def _notify(self, batch: List[ConversationRow], inserted: Optional[List[Dict]]) -> None:
+        # Dinleyici hatası partiyi yeniden yazdırmamalı
+        if self.on_write is None:
+            return
+        try:
+            self.on_write(batch, inserted)
+        except Exception as e:
+            logger.error(f"Yazma bildirimi hatası: {str(e)}")
+
+    async def _run(self) -> None:
+        """Kuyruğu sürekli boşalt"""
+        while True:
+            batch = await self._collect()
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                QUEUE_DEPTH.labels("write_behind").dec(len(batch))
+
+class ProfileWriter:
+    """Profil güncellemelerini kullanıcı başına birleştirip periyodik olarak tek UPSERT partisiyle yazar"""
+    def __init__(self, backend: DatabaseBackend, flush_interval_ms: Optional[int] = None,
+                 cache: Optional[SimpleCache] = None):
+        self.backend = backend
+        self.flush_interval = (flush_interval_ms or Config.PROFILE_FLUSH_INTERVAL_MS) / 1000
+        self.cache = cache or SimpleCache(max_entries=Config.PROFILE_CACHE_SIZE, name="profile")
+        self._pending: Dict[str, ProfileRow] = {}
+        self._writing: Dict[str, ProfileRow] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        # Her parti yazımında artar; okuma sırasında yazılan parti önbelleğe eski satırın girmesini engeller
+        self._generation = 0
+        self.stats = {"updates": 0, "coalesced": 0, "written": 0, "flushes": 0, "errors": 0}
+
+    @property
+    def pending(self) -> int:
+        """Yazılmayı bekleyen kullanıcı sayısı"""
+        return len(self._pending)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Görevi durdur ve bekleyen güncellemeleri yaz"""
+        if self._task is not None:
+            # Süren periyodik yazım bitmeden iptal edilirse alınmış parti kaybolur
+            async with self._flush_lock:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        await self.flush()
+
+    def update(self, user_id: str, preferences: Optional[Dict] = None,
+               interaction: Optional[Dict] = None) -> None:
+        """Güncellemeyi bekleyen yamaya ekle; aynı kullanıcının ardışık güncellemeleri tek satırda birleşir"""
+        self.stats["updates"] += 1
+        pending = self._pending.get(user_id)
+        if pending is None:
+            self._pending[user_id] = (user_id, dict(preferences or {}), dict(interaction or {}))
+        else:
+            self.stats["coalesced"] += 1
+            pending[1].update(preferences or {})
+            pending[2].update(interaction or {})
+
+        cached = self.cache.get(user_id)
+        if cached is not None:
+            cached["preferences"].update(preferences or {})
+            cached["interaction_history"].update(interaction or {})
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        """Profili önbellekten ya da veritabanından getir; henüz yazılmamış yamalar da yansır"""
+        profile = self.cache.get(user_id)
+        if profile is None:
+            while True:
+                generation = self._generation
+                profile = await self.backend.get_user_profile(user_id)
+                # Okuma sürerken bir parti yazıldıysa satır yamadan önceki hali olabilir; tekrar okunur
+                if generation == self._generation:
+                    break
+            # Yazılmakta olan ve henüz yazılmamış yamalar eklenir
+            patches = [batch[user_id] for batch in (self._writing, self._pending) if user_id in batch]
+            if profile is None and not patches:
+                return None
+            if profile is None:
+                profile = {"user_id": user_id, "preferences": {}, "interaction_history": {}}
+            for _, preferences, interaction in patches:
+                profile["preferences"].update(preferences)
+                profile["interaction_history"].update(interaction)
+            self.cache.set(user_id, profile, ttl=Config.PROFILE_CACHE_TTL)
+        return {
+            **profile,
+            "preferences": dict(profile["preferences"]),
+            "interaction_history": dict(profile["interaction_history"])
+        }
+
+    async def flush(self) -> None:
+        """Bekleyen yamaları tek partide yaz; hata olursa sonraki denemeye bırak"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._writing = batch
+            try:
+                with DB_DURATION.labels("upsert_user_profiles").time():
+                    await self.backend.upsert_user_profiles(list(batch.values()))
+                self.stats["written"] += len(batch)
+                self.stats["flushes"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                ERRORS.labels("db_write").inc()
+                logger.error(f"Profil yazma hatası: {str(e)}")
+                # Bu arada gelen yeni yamalar eskilerin üzerine uygulanır
+                for user_id, (_, preferences, interaction) in batch.items():
+                    newer = self._pending.get(user_id)
+                    if newer is not None:
+                        preferences.update(newer[1])
+                        interaction.update(newer[2])
+                    self._pending[user_id] = (user_id, preferences, interaction)
+            finally:
+                self._writing = {}
+                self._generation += 1
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()